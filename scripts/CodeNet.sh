@@ -11,13 +11,11 @@ for file in $path/*/*.$lang; do
     rm -r ./out/joern/*
     
     joern-parse "$file" > /dev/null 2>&1
-    for repr in all pdg cfg ast #  ddg cdg  pdg cpg14
+    for repr in all pdg ast #  ddg cdg  pdg cpg14 cfg
     do
         joern-export --repr=$repr --out ./out/joern/$repr
     done
     
-    python ./src/v2.py ./out/joern/all/export.dot --cfg ./out/joern/cfg/* --lang "$lang"
-
-    python ./src/v2.py ./out/joern/all/export.dot --cfg ./out/joern/cfg/* --lang "$lang" --ast -o ./out/ast_v2.dot
+    python ./src/v2.py ./out/joern/all/export.dot --lang "$lang" --ast-output ./out/ast_v2.dot
     
 done
\ No newline at end of file
@@ -1,10 +1,35 @@
 import argparse
+import contextlib
 import glob
+import logging
 import multiprocessing
 import os
+import queue
+import shlex
 import shutil  # 尽管在此版本中不直接用于 rmtree，但保留它对文件操作有益
+import signal
 import subprocess
+import sys
+import tempfile
+import time
+import traceback
+from typing import NamedTuple
 
+from failures import CircuitBreaker, FailureLog, class_rate, truncate_log
+from output_cache import OutputCache, link_or_copy, pipeline_version
+from progress import ProgressJournal
+from scheduling import (
+    JvmSlots,
+    StageTimeout,
+    TimingLog,
+    jvm_slots_for,
+    kill_process_group,
+    kill_running_commands,
+    largest_first,
+    run_command,
+    time_limit,
+)
+from telemetry import StageRecorder, TelemetryLog, group_usage, reset_group_peak
 from tqdm import tqdm
 
 # --- 配置 ---
@@ -19,155 +44,559 @@ FILE_GLOB_PATTERN = os.path.join(BASE_DATA_PATH, "*", f"*.{LANG}")
 V2_PY_SCRIPT = os.path.abspath("./src/v2.py")
 # --- 配置结束 ---
 
+# 在进程内调用 v2.py 的逻辑，而不是每个文件启动两次 Python 解释器。
+# 由 load_analysis_modules 在检查 V2_PY_SCRIPT 存在之后导入
+split = None
+v2 = None
 
-def process_file(args):
+# Joern 常驻进程的应答前缀，用来把应答和 Joern 自己打印的日志区分开
+JOERN_WORKER_REPLY = "@@joern-worker"
+# 常驻进程模式默认运行的 Joern 脚本
+JOERN_WORKER_SCRIPT = os.path.abspath("./scripts/joern_worker.sc")
+# 项目使用的 Joern 版本，计入输出缓存的键
+JOERN_VERSION_FILE = os.path.abspath("./.joern-version")
+
+
+# 失败类别，用于失败记录 (failures.jsonl) 和按类别熔断
+FAILURE_CLASSES = {
+    "parse": "joern-parse 失败",
+    "export": "joern-export 失败或没有生成导出",
+    "joern": "常驻 Joern 进程返回错误",
+    "crash": "Joern 进程崩溃、被杀死或内存不足",
+    "timeout": "某个阶段超时",
+    "v2": "v2 解析、剪枝或写出时抛出异常",
+    "duplicate": "内容相同的文件处理失败",
+    "other": "其它错误",
+}
+
+
+class JoernWorkerError(Exception):
+    """Joern 常驻进程返回错误或意外退出。"""
+
+
+class JoernWorkerCrash(JoernWorkerError):
+    """Joern 常驻进程意外退出（例如 JVM 内存不足被杀死）。"""
+
+
+class FileResult(NamedTuple):
+    """工作进程返回的单个文件的处理结果，前三项即 (file_path, success, message)。"""
+
+    file_path: str
+    success: bool
+    message: str
+    # 失败是否可能由资源不足引起（超时、JVM 崩溃或内存不足），降低并发后值得重试
+    retryable: bool = False
+    # 各阶段的资源使用，见 telemetry.StageRecorder.stages
+    stages: dict | None = None
+    # 失败类别，见 FAILURE_CLASSES
+    failure_class: str | None = None
+
+
+class JoernWorker:
     """
-    使用 Joern 和 v2.py 脚本处理单个源代码文件。
-    每个文件的输出都存储在以输入文件命名的目录内的 'joern' 子目录中，
-    该目录与输入文件位于同一目录。
-    例如：输入: path/to/file.cpp -> 输出: path/to/file/joern/
-    返回: (file_path, success_boolean, message_string)
+    一个常驻的 Joern 进程，在同一个 JVM 中依次处理多个源文件，
+    省去每个文件 joern-parse / joern-export 启动 JVM 和反序列化 CPG 的开销。
+
+    协议（基于 stdin/stdout，每行一条）：
+      请求: "<源文件>\t<输出目录>"
+      应答: "@@joern-worker ok\t<输出目录>" 或 "@@joern-worker error\t<消息>"
+    进程启动完成时先输出 "@@joern-worker ready"。其它输出都视为日志，
+    出错时附在错误消息中。stdin 关闭后进程应自行退出。
+    输出目录下需生成 'all/export.dot'，与 joern-export --repr=all 相同。
     """
-    file_path, lang_param = args
-    abs_file_path = os.path.abspath(file_path)
-    current_file_joern_root = ""  # 为清晰起见，在早期错误发生时初始化
 
-    try:
-        # 1. 确定并为此文件创建唯一的输出目录。
-        input_file_parent_dir = os.path.dirname(abs_file_path)
-        input_filename_no_ext = os.path.splitext(os.path.basename(abs_file_path))[0]
-        per_file_base_dir = os.path.join(input_file_parent_dir, input_filename_no_ext)
-        current_file_joern_root = os.path.join(per_file_base_dir, "joern")
-        os.makedirs(current_file_joern_root, exist_ok=True)
+    def __init__(self, cmd):
+        self.cmd = cmd
+        self.process = None
+        # Joern 会在当前目录创建 workspace，每个进程使用单独的目录
+        self.workdir = tempfile.mkdtemp(prefix="joern-worker-")
 
-        # 2. 运行 c2cpg.sh（Joern前端）。
-        cpg_output = os.path.join(current_file_joern_root, "cpg.bin")
-        c2cpg_cmd = ["joern-parse", abs_file_path, "--output", cpg_output]
-        parse_result = subprocess.run(
-            c2cpg_cmd,
-            cwd=current_file_joern_root,
+    def start(self, timeout=None):
+        # 新的进程组：超时时连同 Joern 启动脚本派生的 JVM 一起杀掉
+        self.process = subprocess.Popen(
+            self.cmd,
+            cwd=self.workdir,
+            stdin=subprocess.PIPE,
             stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
             text=True,
-            check=False,
+            bufsize=1,
+            start_new_session=True,
         )
-        if parse_result.returncode != 0:
-            print(f"\n[ERROR] c2cpg 执行失败: {' '.join(c2cpg_cmd)}")
-            print(f"[STDOUT]:\n{parse_result.stdout}")
-            print(f"[STDERR]:\n{parse_result.stderr}")
-            raise subprocess.CalledProcessError(
-                returncode=parse_result.returncode,
-                cmd=c2cpg_cmd,
-                stderr=parse_result.stderr,
-                output=parse_result.stdout,
-            )
+        status, message = self._read_reply(timeout, "Joern 常驻进程启动")
+        if status != "ready":
+            raise JoernWorkerError(f"启动失败: {status} {message}")
 
-        # 3. 运行 joern-export 以获取 'all' 和 'cfg' 表示。
-        for representation in ["all", "cfg"]:
-            export_target_dir = os.path.join(current_file_joern_root, representation)
-            if os.path.exists(export_target_dir):
-                shutil.rmtree(export_target_dir)
-            joern_export_cmd = [
-                "joern-export",
-                f"--repr={representation}",
-                "--out",
-                export_target_dir,
-            ]
-            export_result = subprocess.run(
-                joern_export_cmd,
-                cwd=current_file_joern_root,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                check=False,
+    def export(self, abs_file_path, output_dir, timeout=None, recorder=None):
+        """
+        处理一个源文件或目录。recorder 不为 None 时，把这次请求的墙钟时间，
+        以及 Joern 进程组的 CPU 时间和峰值 RSS 记为 'joern-worker' 阶段。
+        """
+        if self.process is None or self.process.poll() is not None:
+            self.start(timeout)
+        shutil.rmtree(os.path.join(output_dir, "all"), ignore_errors=True)
+        pgid = self.process.pid
+        if recorder is not None:
+            reset_group_peak(pgid)
+            cpu_before, _ = group_usage(pgid)
+        start = time.perf_counter()
+        try:
+            self.process.stdin.write(f"{abs_file_path}\t{output_dir}\n")
+            self.process.stdin.flush()
+        except BrokenPipeError:
+            self.process = None
+            raise JoernWorkerCrash("进程已退出，下一个文件将重新启动")
+        status, message = self._read_reply(timeout, "Joern 常驻进程导出")
+        if recorder is not None:
+            cpu_after, rss = group_usage(pgid)
+            recorder.add(
+                "joern-worker", time.perf_counter() - start, cpu_after - cpu_before, rss
             )
-            if export_result.returncode != 0:
-                print(f"\n[ERROR] joern-export 执行失败: {' '.join(joern_export_cmd)}")
-                print(f"[STDOUT]:\n{export_result.stdout}")
-                print(f"[STDERR]:\n{export_result.stderr}")
-                raise subprocess.CalledProcessError(
-                    returncode=export_result.returncode,
-                    cmd=joern_export_cmd,
-                    stderr=export_result.stderr,
-                    output=export_result.stdout,
-                )
+        if status != "ok":
+            raise JoernWorkerError(message)
 
-        # 4. 准备 v2.py 脚本的路径和参数。
-        all_export_dot_file = os.path.join(current_file_joern_root, "all", "export.dot")
-        if not os.path.exists(all_export_dot_file):
-            dot_files_in_all_dir = glob.glob(
-                os.path.join(current_file_joern_root, "all", "*.dot")
-            )
-            if dot_files_in_all_dir:
-                all_export_dot_file = dot_files_in_all_dir[0]
-            else:
-                raise FileNotFoundError(
-                    f"在 {os.path.join(current_file_joern_root, 'all')} 中未找到 'export.dot' 或任何 '*.dot' 文件 "
-                    f"对于输入文件 {abs_file_path}"
+    def close(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.stdin.close()
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                kill_process_group(self.process)
+                self.process.wait()
+        self.process = None
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def _read_reply(self, timeout, stage):
+        """
+        读取下一条应答，返回 (状态, 消息)。超时后杀掉进程（下一个文件时重新启动）
+        并抛出 StageTimeout。
+        """
+        try:
+            with time_limit(timeout, stage):
+                return self._wait_reply()
+        except StageTimeout:
+            kill_process_group(self.process)
+            self.process.wait()
+            self.process = None
+            raise
+
+    def _wait_reply(self):
+        log = []
+        for line in self.process.stdout:
+            if line.startswith(JOERN_WORKER_REPLY):
+                status, _, message = (
+                    line[len(JOERN_WORKER_REPLY) :].strip().partition("\t")
                 )
+                if status == "error" and log:
+                    message += "\n" + "".join(log[-20:])
+                return status, message
+            log.append(line)
+        # stdout 关闭：进程已退出
+        returncode = self.process.wait()
+        self.process = None
+        raise JoernWorkerCrash(
+            f"进程意外退出，退出代码 {returncode}\n" + "".join(log[-20:])
+        )
 
-        cfg_data_dir = os.path.join(current_file_joern_root, "cfg")
-        if not os.path.isdir(cfg_data_dir):
-            os.makedirs(cfg_data_dir, exist_ok=True)
-        cfg_input_items_for_v2py = glob.glob(os.path.join(cfg_data_dir, "*"))
-
-        # 5. 运行第一个 v2.py 命令。
-        v2_cmd1_list = ["python", V2_PY_SCRIPT, all_export_dot_file, "--cfg"]
-        v2_cmd1_list.extend(cfg_input_items_for_v2py)
-        v2_cmd1_list.extend(["--lang", lang_param])
-        v2_cmd1_list.extend(["-o", os.path.join(current_file_joern_root, "v2.dot")])
-        v2_py_result1 = subprocess.run(
-            v2_cmd1_list,
-            cwd=current_file_joern_root,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            check=False,
+
+# 每个工作进程各自持有一个 Joern 常驻进程（未启用时为 None）
+_joern_worker = None
+# 各阶段的超时秒数 {"parse", "export", "v2"}，0 表示不限时
+_stage_timeouts = {}
+# 所有工作进程共享的 JVM 名额（常驻模式下为 None，JVM 数即工作进程数）
+_jvm_slots = None
+# 传给 joern-parse / joern-export 的 JVM 参数，例如 ["-J-Xmx4096m"]
+_jvm_options = []
+# 任务开始时向主进程报告 (任务号, 开始时间)，用于发现拖尾的任务
+_task_events = None
+
+
+def load_analysis_modules():
+    """从 V2_PY_SCRIPT 所在目录导入 split 和 v2；工作进程由 init_worker 再次调用。"""
+    global split, v2
+    src_dir = os.path.dirname(V2_PY_SCRIPT)
+    if src_dir not in sys.path:
+        sys.path.insert(0, src_dir)
+    import split
+    import v2
+
+
+def init_worker(
+    joern_worker_cmd=None,
+    stage_timeouts=None,
+    jvm_slots=None,
+    jvm_options=(),
+    task_events=None,
+):
+    """
+    工作进程初始化。v2 的日志以前随子进程输出一起被丢弃，
+    现在在进程内运行，只保留错误级别，避免刷屏打乱进度条。
+    启用常驻模式时，Joern 进程在处理第一个文件时启动；
+    工作进程退出后其 stdin 关闭，Joern 进程随之退出。
+    """
+    global _joern_worker, _stage_timeouts, _jvm_slots, _jvm_options, _task_events
+    load_analysis_modules()
+    logging.basicConfig(level=logging.ERROR)
+    if joern_worker_cmd:
+        _joern_worker = JoernWorker(joern_worker_cmd)
+    _stage_timeouts = stage_timeouts or {}
+    _jvm_slots = jvm_slots
+    _jvm_options = list(jvm_options)
+    _task_events = task_events
+    # Pool.terminate() 用 SIGTERM 结束工作进程（例如推测执行中落败的任务）。
+    # Joern 运行在单独的进程组中收不到该信号，需要先杀掉，不留下孤儿 JVM。
+    # 之后立即退出：空闲的工作进程若抛出 SystemExit，multiprocessing 的退出清理
+    # 可能等待 Pool 正持有的队列锁，使 Pool.terminate() 挂起。
+    signal.signal(signal.SIGTERM, terminate_worker)
+
+
+def terminate_worker(signum, frame):
+    """SIGTERM 处理：杀掉正在运行的 Joern 进程组后立即退出。"""
+    kill_running_commands()
+    if _joern_worker is not None and _joern_worker.process is not None:
+        kill_process_group(_joern_worker.process)
+    os._exit(1)
+
+
+def stage_timeout(stage, files=1):
+    """阶段的超时秒数。批处理时 Joern 一次处理 files 个文件，超时按文件数放大。"""
+    return _stage_timeouts.get(stage, 0) * files
+
+
+def run_joern_cli(abs_file_path, current_file_joern_root, files=1, recorder=None):
+    """
+    每个文件启动 joern-parse 和 joern-export 两个 JVM 生成 'all' 导出。
+    失败时抛出 subprocess.CalledProcessError，超时时抛出 StageTimeout。
+    两个命令分别记为 recorder 的 'joern-parse' 和 'joern-export' 阶段。
+    """
+    # 2. 运行 c2cpg.sh（Joern前端）。
+    cpg_output = os.path.join(current_file_joern_root, "cpg.bin")
+    c2cpg_cmd = ["joern-parse", abs_file_path, "--output", cpg_output, *_jvm_options]
+    parse_result = run_command(
+        c2cpg_cmd,
+        current_file_joern_root,
+        stage_timeout("parse", files),
+        "joern-parse",
+        recorder,
+    )
+    if parse_result.returncode != 0:
+        # 输出随失败记录写入 failures.jsonl，不再打印到终端
+        raise subprocess.CalledProcessError(
+            returncode=parse_result.returncode,
+            cmd=c2cpg_cmd,
+            stderr=parse_result.stderr,
+            output=parse_result.stdout,
         )
-        if v2_py_result1.returncode != 0:
-            raise subprocess.CalledProcessError(
-                returncode=v2_py_result1.returncode,
-                cmd=v2_cmd1_list,
-                output=v2_py_result1.stdout,
-                stderr=v2_py_result1.stderr,
-            )
 
-        # 6. 运行第二个 v2.py 命令
-        ast_output_target_file = os.path.join(current_file_joern_root, "ast_v2.dot")
-        v2_cmd2_list = ["python", V2_PY_SCRIPT, all_export_dot_file, "--cfg"]
-        v2_cmd2_list.extend(cfg_input_items_for_v2py)
-        v2_cmd2_list.extend(
-            ["--lang", lang_param, "--ast", "-o", ast_output_target_file]
+    # 3. 运行 joern-export 以获取 'all' 表示，v2 从中提取 CFG 边。
+    export_target_dir = os.path.join(current_file_joern_root, "all")
+    if os.path.exists(export_target_dir):
+        shutil.rmtree(export_target_dir)
+    joern_export_cmd = [
+        "joern-export",
+        "--repr=all",
+        "--out",
+        export_target_dir,
+        *_jvm_options,
+    ]
+    export_result = run_command(
+        joern_export_cmd,
+        current_file_joern_root,
+        stage_timeout("export", files),
+        "joern-export",
+        recorder,
+    )
+    if export_result.returncode != 0:
+        raise subprocess.CalledProcessError(
+            returncode=export_result.returncode,
+            cmd=joern_export_cmd,
+            stderr=export_result.stderr,
+            output=export_result.stdout,
         )
-        v2_py_result2 = subprocess.run(
-            v2_cmd2_list,
-            cwd=current_file_joern_root,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            check=False,
+
+
+def installed_joern_version():
+    """
+    返回 `joern --version` 的输出，没有安装 Joern 或命令失败时返回 None。
+    joern-parse 等启动脚本在 Joern 升级时通常不变，缓存键需要实际的版本号。
+    """
+    joern = shutil.which("joern")
+    if joern is None:
+        return None
+    try:
+        result = subprocess.run(
+            [joern, "--version"], capture_output=True, text=True, timeout=120
         )
-        if v2_py_result2.returncode != 0:
-            raise subprocess.CalledProcessError(
-                returncode=v2_py_result2.returncode,
-                cmd=v2_cmd2_list,
-                output=v2_py_result2.stdout,
-                stderr=v2_py_result2.stderr,
-            )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def file_joern_root(abs_file_path):
+    """
+    返回文件的输出目录：与输入文件同目录、以输入文件命名的目录内的 'joern' 子目录。
+    例如：输入: path/to/file.cpp -> 输出: path/to/file/joern/
+    """
+    input_file_parent_dir = os.path.dirname(abs_file_path)
+    input_filename_no_ext = os.path.splitext(os.path.basename(abs_file_path))[0]
+    per_file_base_dir = os.path.join(input_file_parent_dir, input_filename_no_ext)
+    return os.path.join(per_file_base_dir, "joern")
+
+
+def run_joern(abs_path, joern_root, recorder, files=1):
+    """
+    对一个源文件或目录（files 个文件）运行 Joern，在 joern_root 下生成 'all' 导出，
+    各阶段记入 recorder。
+    """
+    slot = _jvm_slots.acquire() if _jvm_slots else contextlib.nullcontext()
+    with slot:
+        if _joern_worker is not None:
+            timeout = stage_timeout("parse", files) + stage_timeout("export", files)
+            _joern_worker.export(abs_path, joern_root, timeout, recorder)
+        else:
+            run_joern_cli(abs_path, joern_root, files, recorder)
+
+
+def is_retryable(e):
+    """超时、JVM 崩溃或内存不足引起的失败在降低并发后可能成功，值得重试。"""
+    if isinstance(e, (StageTimeout, JoernWorkerCrash, MemoryError)):
+        return True
+    if isinstance(e, subprocess.CalledProcessError):
+        # 被信号杀死（OOM killer 为 SIGKILL，shell 报告为 137）或 JVM 堆内存不足
+        output = f"{e.output or ''}{e.stderr or ''}"
+        return e.returncode < 0 or e.returncode == 137 or "OutOfMemoryError" in output
+    return False
+
 
-        return (file_path, True, f"输出位于 {current_file_joern_root}")
+def classify_error(e, step):
+    """失败类别（见 FAILURE_CLASSES），step 为抛出异常的步骤: "joern" 或 "v2"。"""
+    if isinstance(e, StageTimeout):
+        return "timeout"
+    if is_retryable(e):
+        return "crash"
+    if isinstance(e, subprocess.CalledProcessError):
+        return {"joern-parse": "parse", "joern-export": "export"}.get(e.cmd[0], "other")
+    if isinstance(e, JoernWorkerError):
+        return "joern"
+    if step == "v2":
+        # generate_v2 找不到导出文件时抛出 FileNotFoundError
+        return "export" if isinstance(e, FileNotFoundError) else "v2"
+    return "other"
 
-    except subprocess.CalledProcessError as e:
+
+def describe_error(e):
+    """把处理过程中的异常转换为失败消息，命令输出和调用栈经过截断。"""
+    if isinstance(e, StageTimeout):
+        return f"处理超时 - {e}"
+    if isinstance(e, subprocess.CalledProcessError):
         error_details = f"命令 '{' '.join(e.cmd)}' 执行失败，退出代码 {e.returncode}。"
         if hasattr(e, "output") and e.output and e.output.strip():
-            error_details += f"\n标准输出:\n{e.output.strip()}"
+            error_details += f"\n标准输出:\n{truncate_log(e.output)}"
         if e.stderr and e.stderr.strip():
-            error_details += f"\n标准错误:\n{e.stderr.strip()}"
-        return (file_path, False, error_details)
-    except FileNotFoundError as e:
-        return (file_path, False, f"未找到所需的文件或目录 - {e}")
+            error_details += f"\n标准错误:\n{truncate_log(e.stderr)}"
+        return error_details
+    if isinstance(e, FileNotFoundError):
+        return f"未找到所需的文件或目录 - {e}"
+    if isinstance(e, JoernWorkerError):
+        return f"Joern 常驻进程处理失败 - {truncate_log(str(e))}"
+    # v2 中的异常：附上调用栈，便于定位是哪个剪枝函数出错
+    stack = truncate_log("".join(traceback.format_exception(e)))
+    return f"发生意外错误 - {type(e).__name__}: {e}\n{stack}"
+
+
+def failed_result(file_path, e, step, recorder):
+    """由处理 file_path 时在 step 步骤抛出的异常 e 构造失败的 FileResult。"""
+    return FileResult(
+        file_path,
+        False,
+        describe_error(e),
+        is_retryable(e),
+        recorder.stages,
+        classify_error(e, step),
+    )
+
+
+def generate_v2(
+    abs_file_path, current_file_joern_root, lang_param, recorder, output_dir=None
+):
+    """
+    由 current_file_joern_root 下的 'all' 导出生成 v2.dot 和 ast_v2.dot，
+    写入 output_dir（默认为 current_file_joern_root）。
+    v2 的解析、剪枝和写出分别记为 recorder 的 'v2.parse'、'v2.prune'、'v2.write' 阶段。
+    """
+    # 4. 准备 v2.py 脚本的路径和参数。
+    all_export_dot_file = os.path.join(current_file_joern_root, "all", "export.dot")
+    if not os.path.exists(all_export_dot_file):
+        dot_files_in_all_dir = glob.glob(
+            os.path.join(current_file_joern_root, "all", "*.dot")
+        )
+        if dot_files_in_all_dir:
+            all_export_dot_file = dot_files_in_all_dir[0]
+        else:
+            raise FileNotFoundError(
+                f"在 {os.path.join(current_file_joern_root, 'all')} 中未找到 'export.dot' 或任何 '*.dot' 文件 "
+                f"对于输入文件 {abs_file_path}"
+            )
+
+    # 5. 在进程内运行 v2：只解析一次 export.dot，同时生成 v2.dot 和 ast_v2.dot。
+    # 先写临时文件再改名：推测执行时同一文件可能由两个进程同时处理，
+    # 被终止的一方也不会留下写了一半的输出。
+    output_dir = output_dir or current_file_joern_root
+    outputs = [os.path.join(output_dir, name) for name in ("v2.dot", "ast_v2.dot")]
+    tmp_outputs = [f"{path}.{os.getpid()}.tmp" for path in outputs]
+    try:
+        with time_limit(stage_timeout("v2"), "v2"):
+            v2.generate(
+                all_export_dot_file,
+                lang=lang_param,
+                output=tmp_outputs[0],
+                ast_output=tmp_outputs[1],
+                stage=lambda name: recorder.stage(f"v2.{name}"),
+            )
+        for tmp_path, path in zip(tmp_outputs, outputs):
+            os.replace(tmp_path, path)
+    finally:
+        for tmp_path in tmp_outputs:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+def process_file(args, speculative=False):
+    """
+    使用 Joern 和 v2.py 脚本处理单个源代码文件。
+    每个文件的输出都存储在 file_joern_root 返回的目录中。
+    speculative 为 True 时（推测执行的副本），Joern 的中间结果写到单独的
+    '.speculative-<pid>' 目录，不与仍在运行的原任务冲突，只有 v2 输出被替换。
+    返回: FileResult
+    """
+    file_path, lang_param = args
+    abs_file_path = os.path.abspath(file_path)
+    recorder = StageRecorder()
+    work_dir = None
+    step = "joern"
+
+    try:
+        # 1. 确定并为此文件创建唯一的输出目录。
+        current_file_joern_root = file_joern_root(abs_file_path)
+        os.makedirs(current_file_joern_root, exist_ok=True)
+        work_dir = current_file_joern_root
+        if speculative:
+            work_dir = os.path.join(
+                current_file_joern_root, f".speculative-{os.getpid()}"
+            )
+            os.makedirs(work_dir, exist_ok=True)
+
+        # 2-3. 运行 Joern 以获取 'all' 表示。
+        run_joern(abs_file_path, work_dir, recorder)
+
+        step = "v2"
+        generate_v2(
+            abs_file_path, work_dir, lang_param, recorder, current_file_joern_root
+        )
+        return FileResult(
+            file_path,
+            True,
+            f"输出位于 {current_file_joern_root}",
+            stages=recorder.stages,
+        )
     except Exception as e:
-        return (file_path, False, f"发生意外错误 - {type(e).__name__}: {e}")
+        return failed_result(file_path, e, step, recorder)
+    finally:
+        if speculative and work_dir is not None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def process_batch(args, speculative=False):
+    """
+    批处理模式：把一批源文件放进同一个 Joern 输入目录一起解析，只付一次 Joern 的
+    启动和项目开销；再按 FILENAME 把 'all' 导出拆分回每个文件的 all/export.dot
+    （见 src/split.py），之后与 process_file 相同，逐个文件生成 v2.dot 和 ast_v2.dot。
+    整批的 Joern 解析或拆分失败时，退回逐个文件处理，避免一个文件拖累整批。
+    speculative 为 True 时逐个文件处理，见 process_file。
+    返回: [FileResult, ...]
+    """
+    file_paths, lang_param = args
+    if len(file_paths) == 1 or speculative:
+        return [
+            process_file((file_path, lang_param), speculative)
+            for file_path in file_paths
+        ]
+
+    batch_dir = tempfile.mkdtemp(prefix="joern-batch-")
+    try:
+        # 1. 暂存源文件，加序号前缀保证文件名唯一，拆分时按文件名找回原文件，
+        #    并把 FILENAME 等属性中的暂存文件名改回原文件名，与逐个文件处理一致。
+        input_dir = os.path.join(batch_dir, "src")
+        batch_joern_root = os.path.join(batch_dir, "joern")
+        os.makedirs(input_dir)
+        os.makedirs(batch_joern_root)
+        staged = {}
+        renames = {}
+        for i, file_path in enumerate(file_paths):
+            abs_file_path = os.path.abspath(file_path)
+            name = f"{i:04d}_{os.path.basename(abs_file_path)}"
+            staged_path = os.path.join(input_dir, name)
+            link_or_copy(abs_file_path, staged_path)
+            staged[name] = abs_file_path
+            renames[name] = os.path.basename(abs_file_path)
+            renames[staged_path] = abs_file_path
+
+        # 2-3. 整批运行 Joern，并把 'all' 导出拆分到每个文件的输出目录。
+        batch_recorder = StageRecorder()
+        try:
+            run_joern(input_dir, batch_joern_root, batch_recorder, len(file_paths))
+            output_files = {}
+            for name, abs_file_path in staged.items():
+                all_dir = os.path.join(file_joern_root(abs_file_path), "all")
+                shutil.rmtree(all_dir, ignore_errors=True)
+                output_files[name] = os.path.join(all_dir, "export.dot")
+            with batch_recorder.stage("split"):
+                linked = split.split_export(
+                    os.path.join(batch_joern_root, "all", "export.dot"),
+                    output_files,
+                    renames,
+                )
+        except Exception:
+            return [process_file((file_path, lang_param)) for file_path in file_paths]
+
+        # 4-5. 逐个文件运行 v2。Joern 把调用链接到了其它文件的方法（各文件常定义
+        #      同名的 main、gcd 等函数）的文件无法拆分，退回逐个文件处理。
+        results = []
+        for file_path, (name, abs_file_path) in zip(file_paths, staged.items()):
+            if name in linked:
+                results.append(process_file((file_path, lang_param)))
+                continue
+            current_file_joern_root = file_joern_root(abs_file_path)
+            # 整批的 Joern 和拆分阶段平均分给每个文件
+            recorder = StageRecorder(batch_recorder.shared(len(file_paths)))
+            try:
+                generate_v2(
+                    abs_file_path, current_file_joern_root, lang_param, recorder
+                )
+                results.append(
+                    FileResult(
+                        file_path,
+                        True,
+                        f"输出位于 {current_file_joern_root}",
+                        stages=recorder.stages,
+                    )
+                )
+            except Exception as e:
+                results.append(failed_result(file_path, e, "v2", recorder))
+        return results
+    finally:
+        shutil.rmtree(batch_dir, ignore_errors=True)
+
+
+def run_task(task):
+    """
+    工作进程执行的任务：(任务号, 是否推测执行, 文件列表, 语言)。
+    开始时向主进程报告，返回 (任务号, 是否推测执行, [FileResult, ...])。
+    """
+    task_id, speculative, file_paths, lang_param = task
+    if _task_events is not None:
+        _task_events.put((task_id, time.monotonic()))
+    return task_id, speculative, process_batch((file_paths, lang_param), speculative)
 
 
 def main():
@@ -187,8 +616,138 @@ def main():
         type=str,
         help="包含要处理的文件列表的文件路径。如果提供，则从此文件读取文件列表而不使用glob模式搜索",
     )
+    parser.add_argument(
+        "--joern-server",
+        action="store_true",
+        help="每个工作进程使用一个常驻 Joern 进程处理多个文件，而不是每个文件启动 joern-parse/joern-export",
+    )
+    parser.add_argument(
+        "--joern-worker-cmd",
+        type=str,
+        help=f"常驻 Joern 进程的启动命令（隐含 --joern-server），默认: joern --script {JOERN_WORKER_SCRIPT}。"
+        "测试时可用 'python scripts/joern_worker_stub.py'",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1,
+        help="每个 Joern 项目一起解析的文件数，结果按文件拆分，默认 1（逐个文件）",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "v2_cache"),
+        help="按源码内容缓存 v2.dot/ast_v2.dot 的目录，内容相同的文件只处理一次",
+    )
+    parser.add_argument(
+        "--cache-max-size",
+        type=int,
+        default=10240,
+        help="缓存大小上限（MB），运行结束时淘汰最久未用的缓存项，默认 10240",
+    )
+    parser.add_argument("--no-cache", action="store_true", help="不使用输出缓存")
+    parser.add_argument(
+        "--parse-timeout",
+        type=float,
+        default=600,
+        help="每个文件 joern-parse 的超时秒数，超时后杀掉整个进程组，0 表示不限时，默认 600",
+    )
+    parser.add_argument(
+        "--export-timeout",
+        type=float,
+        default=600,
+        help="每个文件 joern-export 的超时秒数（常驻模式下与 --parse-timeout 相加），默认 600",
+    )
+    parser.add_argument(
+        "--v2-timeout",
+        type=float,
+        default=300,
+        help="每个文件 v2 阶段的超时秒数，默认 300",
+    )
+    parser.add_argument(
+        "--jvm-memory",
+        type=float,
+        default=4,
+        help="每个 Joern JVM 的最大堆内存（GB），同时运行的 JVM 数按可用内存除以该值限制，默认 4",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=2,
+        help="超时或资源不足而失败的文件，以减半的并发重试的轮数，默认 2",
+    )
+    parser.add_argument(
+        "--speculate",
+        action="store_true",
+        help="所有任务都已开始后，把运行时间远超预计的拖尾任务在空闲的工作进程上再执行一份，先完成的结果生效",
+    )
+    parser.add_argument(
+        "--speculate-after",
+        type=float,
+        default=2.0,
+        help="任务运行时间超过预计耗时的多少倍时视为拖尾，默认 2",
+    )
+    parser.add_argument(
+        "--telemetry",
+        type=str,
+        default=os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), "telemetry.jsonl"
+        ),
+        help="追加写入每个文件各阶段墙钟时间、CPU 时间和峰值 RSS 的 JSONL 文件",
+    )
+    parser.add_argument(
+        "--failure-log",
+        type=str,
+        default=os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), "failures.jsonl"
+        ),
+        help="追加写入失败文件的类别和截断后错误消息的 JSONL 文件",
+    )
+    parser.add_argument(
+        "--breaker",
+        action="append",
+        type=class_rate(FAILURE_CLASSES),
+        default=[],
+        metavar="CLASS=RATE",
+        help="某一类失败在最近 --breaker-window 个结果中所占比例超过 RATE 时停止运行，"
+        "可多次指定，RATE 不小于 1 表示该类从不熔断。类别: "
+        + ", ".join(FAILURE_CLASSES),
+    )
+    parser.add_argument(
+        "--breaker-window",
+        type=int,
+        default=100,
+        help="熔断统计的最近结果数，默认 100",
+    )
+    parser.add_argument(
+        "--breaker-min-results",
+        type=int,
+        default=10,
+        help="至少有多少个结果后才可能熔断（不超过 --breaker-window），默认 10",
+    )
+    parser.add_argument(
+        "--breaker-rate",
+        type=float,
+        default=0.5,
+        help="未用 --breaker 指定的类别的熔断阈值，默认 0.5",
+    )
     args = parser.parse_args()
 
+    joern_worker_cmd = None
+    if args.joern_worker_cmd:
+        # 常驻进程在临时工作目录中运行，相对路径的参数需先转为绝对路径
+        joern_worker_cmd = [
+            os.path.abspath(arg) if os.path.exists(arg) else arg
+            for arg in shlex.split(args.joern_worker_cmd)
+        ]
+    elif args.joern_server:
+        joern_worker_cmd = [
+            "joern",
+            f"-J-Xmx{int(args.jvm_memory * 1024)}m",
+            "--script",
+            JOERN_WORKER_SCRIPT,
+        ]
+
     print("--------------------------------------------------------------------------")
     print("🐍 使用 Joern 和 v2.py 处理源文件的 Python 脚本")
     print("   (输出到每个文件的 '<文件名>/joern/' 子目录)")
@@ -210,6 +769,7 @@ def main():
     if not os.path.exists(V2_PY_SCRIPT):
         print(f"🔴 严重错误: 未找到分析脚本 {V2_PY_SCRIPT}。正在退出。")
         return
+    load_analysis_modules()
 
     # 根据是否提供文件列表选择不同的文件发现方式
     if args.file_list:
@@ -254,20 +814,19 @@ def main():
     FAILED_DB_PATH = os.path.join(
         os.path.dirname(os.path.abspath(__file__)), "failed_files.txt"
     )
-    processed_files_set = set()
-    if os.path.exists(PROCESSED_DB_PATH):
-        with open(PROCESSED_DB_PATH, "r", encoding="utf-8") as f:
-            for line in f:
-                processed_files_set.add(line.strip())
+    # 每个文件上次的处理耗时，用于优先调度耗时最长的文件
+    TIMINGS_PATH = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "timings.jsonl"
+    )
+    journal = ProgressJournal(PROCESSED_DB_PATH, FAILED_DB_PATH)
 
     # 过滤掉已处理的文件
     original_count = len(files_to_process)
-    files_to_process = [
-        fp for fp in files_to_process if os.path.abspath(fp) not in processed_files_set
-    ]
+    files_to_process = [fp for fp in files_to_process if fp not in journal]
     filtered_count = original_count - len(files_to_process)
 
     if not files_to_process:
+        journal.close()
         if args.file_list:
             print("文件列表中的所有文件均已处理，无需重复处理。")
         else:
@@ -284,45 +843,272 @@ def main():
         )
     print("ℹ️  每个文件 'path/to/file.ext' 的输出将位于 'path/to/file/joern/'。")
 
-    tasks_args = [
-        (
-            fp,
-            LANG,
+    # 内存中只保留计数，失败的详细信息随结果到达写入 failures.jsonl
+    success_count = 0
+    error_count = 0
+    failures = FailureLog(args.failure_log)
+    breaker = CircuitBreaker(
+        args.breaker_window,
+        args.breaker_rate,
+        args.breaker,
+        min_results=args.breaker_min_results,
+    )
+    tripped_class = None  # 触发熔断的失败类别
+
+    def record(file_path, success, message, failure_class=None, attempt=0):
+        nonlocal success_count, error_count, tripped_class
+        journal.record(file_path, success)
+        if success:
+            success_count += 1
+        else:
+            error_count += 1
+            failures.record(file_path, failure_class, message, attempt=attempt)
+        if breaker.observe(None if success else failure_class):
+            tripped_class = tripped_class or failure_class
+
+    # 按源码内容查缓存：命中的文件直接放入缓存的输出，内容相同的文件只交给
+    # 工作进程处理一份，其余的在它完成后从缓存取得结果。
+    cache = None
+    cache_keys = {}  # 待处理文件 -> 缓存键
+    duplicates = {}  # 缓存键 -> 等待同内容文件处理结果的文件
+    files_to_run = files_to_process
+    if not args.no_cache:
+        if joern_worker_cmd:
+            joern_cmds = joern_worker_cmd
+        else:
+            joern_cmds = [shutil.which("joern-parse"), shutil.which("joern-export")]
+        version = pipeline_version(
+            LANG, JOERN_VERSION_FILE, installed_joern_version(), *joern_cmds
         )
-        for fp in files_to_process
-    ]
+        cache = OutputCache(args.cache_dir, version, renamer=split.renamer)
+        files_to_run = []
+        for fp in files_to_process:
+            key = cache.key(fp)
+            abs_fp = os.path.abspath(fp)
+            if key in duplicates:
+                duplicates[key].append(fp)
+            elif cache.restore(key, file_joern_root(abs_fp), abs_fp):
+                record(fp, True, "缓存命中")
+            else:
+                cache_keys[fp] = key
+                duplicates[key] = []
+                files_to_run.append(fp)
+        print(
+            f"💾 缓存命中 {cache.hits} 个文件，{len(files_to_process) - cache.hits - len(files_to_run)} "
+            f"个文件与其它待处理文件内容相同，需处理 {len(files_to_run)} 个文件"
+        )
+
+    def finish_duplicates(fp, success):
+        if fp not in cache_keys:
+            return 0
+        key = cache_keys[fp]
+        if success:
+            abs_fp = os.path.abspath(fp)
+            cache.store(key, file_joern_root(abs_fp), abs_fp)
+        waiting = duplicates.pop(key)
+        for dup in waiting:
+            abs_dup = os.path.abspath(dup)
+            if success and cache.restore(key, file_joern_root(abs_dup), abs_dup):
+                record(dup, True, f"缓存命中（与 {fp} 内容相同）")
+            else:
+                record(dup, False, f"与 {fp} 内容相同，该文件处理失败", "duplicate")
+        return len(waiting)
+
+    batch_size = max(1, args.batch_size)
+    timings = TimingLog(TIMINGS_PATH)
+
+    def make_tasks(file_paths):
+        # 预计耗时最长的文件先调度，避免最后剩下几个大文件、其它工作进程空等；
+        # 批处理时耗时相近的文件分在同一批
+        file_paths = largest_first(file_paths, timings)
+        return [
+            (
+                file_paths[i : i + batch_size],
+                LANG,
+            )
+            for i in range(0, len(file_paths), batch_size)
+        ]
+
     num_workers = args.num_workers
     # num_workers = max(1, min(cpu_cores // 2, 16))
     # num_workers = 1 # 用于调试
+    stage_timeouts = {
+        "parse": args.parse_timeout,
+        "export": args.export_timeout,
+        "v2": args.v2_timeout,
+    }
+    jvm_memory = int(args.jvm_memory * 1024**3)
+    jvm_options = [f"-J-Xmx{int(args.jvm_memory * 1024)}m"]
+    # 同时运行的 JVM 数不超过可用内存能容纳的个数，其余工作进程照常执行 v2
+    jvm_count = jvm_slots_for(jvm_memory, num_workers)
+    if joern_worker_cmd:
+        # 常驻模式下每个工作进程一直持有一个 JVM，只能减少工作进程数
+        num_workers = jvm_count
+        jvm_options = []
 
-    results_log = []  # 存储 (file_path, success_bool, message_str) 元组
-    success_count = 0
-    error_count = 0
-    print(f"⚙️  正在使用 {num_workers} 个工作进程初始化并行处理...")
+    def make_slots():
+        return None if joern_worker_cmd else JvmSlots(jvm_count, jvm_memory)
+
+    print(
+        f"⚙️  正在使用 {num_workers} 个工作进程初始化并行处理"
+        f"（最多同时运行 {jvm_count} 个 JVM，每个 {args.jvm_memory:g} GB）..."
+    )
 
+    telemetry = TelemetryLog(args.telemetry)
+    speculated_count = 0
+    speculation_wins = 0
+
+    def handle_results(batch_results, retry, attempt, speculative, pbar):
+        finished = 0
+        for result in batch_results:
+            telemetry.record(
+                result.file_path,
+                result.success,
+                result.stages,
+                attempt=attempt,
+                speculative=speculative,
+            )
+            if result.success:
+                timings.record(
+                    result.file_path,
+                    sum(metrics["wall"] for metrics in result.stages.values()),
+                )
+            if result.retryable and attempt < args.retries:
+                # 暂不记录，本轮结束后以更低的并发重试
+                retry.append(result.file_path)
+                continue
+            record(
+                result.file_path,
+                result.success,
+                result.message,
+                result.failure_class,
+                attempt,
+            )
+            finished += 1 + finish_duplicates(result.file_path, result.success)
+        pbar.set_postfix(
+            {"成功": success_count, "失败": error_count, "待重试": len(retry)}
+        )
+        pbar.update(finished)
+
+        if tripped_class is not None:
+            tqdm.write(
+                f"\n🛑 熔断: 最近 {breaker.seen} 个结果中 '{tripped_class}' 类失败"
+                f"（{FAILURE_CLASSES.get(tripped_class, tripped_class)}）"
+                f"占 {breaker.share(tripped_class):.0%}，"
+                f"超过阈值 {breaker.rate(tripped_class):.0%}"
+            )
+            # 退出 Pool 的 with 语句时终止工作进程
+            raise SystemExit(f"Circuit breaker tripped by '{tripped_class}' failures.")
+
+    def run_pass(pending, attempt, pbar):
+        """
+        用一个进程池处理 pending 中的文件，返回因超时或资源不足需要重试的文件。
+        启用 --speculate 时，所有任务都已开始且有空闲的工作进程后，运行时间超过
+        预计耗时 --speculate-after 倍的任务会在空闲进程上再执行一份，先完成的结果生效。
+        """
+        nonlocal speculated_count, speculation_wins
+        tasks = make_tasks(pending)
+        task_events = multiprocessing.SimpleQueue()
+        completed = queue.Queue()
+        retry = []
+        started = {}  # 任务号 -> 开始时间
+        remaining = set(range(len(tasks)))
+        speculated = set()
+
+        def stragglers():
+            now = time.monotonic()
+            candidates = []
+            for task_id in remaining - speculated:
+                if task_id not in started:
+                    continue
+                estimates = [timings.estimate(fp) for fp in tasks[task_id][0]]
+                if None in estimates:
+                    continue
+                elapsed = now - started[task_id]
+                if elapsed > args.speculate_after * sum(estimates):
+                    candidates.append((elapsed, task_id))
+            return [task_id for _, task_id in sorted(candidates, reverse=True)]
+
+        with multiprocessing.Pool(
+            processes=num_workers,
+            initializer=init_worker,
+            initargs=(
+                joern_worker_cmd,
+                stage_timeouts,
+                make_slots(),
+                jvm_options,
+                task_events,
+            ),
+        ) as pool:
+
+            def submit(task_id, speculative):
+                # 任务按提交顺序（预计耗时从大到小）逐个分配给空闲的工作进程
+                pool.apply_async(
+                    run_task,
+                    ((task_id, speculative, *tasks[task_id]),),
+                    callback=completed.put,
+                    error_callback=completed.put,
+                )
+
+            for task_id in range(len(tasks)):
+                submit(task_id, False)
+            running = len(tasks)  # 已提交、尚未返回的任务数（含推测执行的副本）
+
+            while remaining:
+                try:
+                    item = completed.get(timeout=1)
+                except queue.Empty:
+                    item = None
+                while not task_events.empty():
+                    task_id, start = task_events.get()
+                    started.setdefault(task_id, start)
+                if isinstance(item, BaseException):
+                    raise item
+                if item is not None:
+                    running -= 1
+                    task_id, speculative, batch_results = item
+                    if task_id in remaining:
+                        # 先完成的一份生效，另一份的结果到达时忽略
+                        remaining.discard(task_id)
+                        speculation_wins += speculative
+                        handle_results(batch_results, retry, attempt, speculative, pbar)
+                if args.speculate and len(started) == len(tasks):
+                    for task_id in stragglers()[: num_workers - running]:
+                        speculated.add(task_id)
+                        speculated_count += 1
+                        running += 1
+                        submit(task_id, True)
+
+        # 落败的副本在退出 with 语句时被终止，清理它们留下的临时文件
+        for task_id in speculated:
+            for fp in tasks[task_id][0]:
+                joern_root = file_joern_root(os.path.abspath(fp))
+                for path in glob.glob(os.path.join(joern_root, ".speculative-*")):
+                    shutil.rmtree(path, ignore_errors=True)
+                for path in glob.glob(os.path.join(joern_root, "*.tmp")):
+                    os.remove(path)
+        return retry
+
+    start_time = time.monotonic()
     try:
-        with multiprocessing.Pool(processes=num_workers) as pool:
-            with tqdm(total=len(tasks_args), desc="🚀 处理文件", smoothing=0) as pbar:
-                for result_tuple in pool.imap_unordered(process_file, tasks_args):
-                    results_log.append(result_tuple)
-                    if result_tuple[1]:
-                        success_count += 1
-                    else:
-                        error_count += 1
-                    pbar.set_postfix({"成功": success_count, "失败": error_count})
-                    pbar.update(1)
-
-                    # Panic exit if error rate > 50% and processed > 10
-                    total_processed = success_count + error_count
-                    if total_processed > 10 and error_count / total_processed > 0.5:
-                        print(
-                            "\n🛑 Panic exit: 错误率超过50%，已处理文件数：{}，失败数：{}".format(
-                                total_processed, error_count
-                            )
-                        )
-                        pool.terminate()
-                        pool.join()
-                        raise SystemExit("Panic exit due to high error rate.")
+        with tqdm(
+            total=len(files_to_process),
+            initial=success_count + error_count,
+            desc="🚀 处理文件",
+            smoothing=0,
+        ) as pbar:
+            pending = files_to_run
+            attempt = 0
+            while pending:
+                pending = run_pass(pending, attempt, pbar)
+                attempt += 1
+                if pending:
+                    num_workers = max(1, num_workers // 2)
+                    jvm_count = max(1, min(jvm_count // 2, num_workers))
+                    tqdm.write(
+                        f"🔁 {len(pending)} 个文件超时或资源不足，第 {attempt} 轮重试: "
+                        f"{num_workers} 个工作进程，最多同时运行 {jvm_count} 个 JVM"
+                    )
     except KeyboardInterrupt:
         print("\n🚫 用户通过 (Ctrl+C) 中断了进程。工作进程正在终止。")
         print("   将显示已完成工作的摘要。")
@@ -330,70 +1116,75 @@ def main():
         print(f"\n❌ 并行处理期间发生意外错误: {type(e).__name__} - {e}")
         print("   工作进程正在终止。将显示已完成工作的摘要。")
     finally:
-        # 统一写入本轮新成功的文件到 processed_files.txt
-        new_success_files = [
-            os.path.abspath(fp) for fp, success, _ in results_log if success
-        ]
-        if new_success_files:
-            with open(PROCESSED_DB_PATH, "a", encoding="utf-8") as f:
-                for fp in new_success_files:
-                    f.write(fp + "\n")
-
-        # 统一写入本轮新失败的文件到 failed_files.txt
-        new_failed_files = [
-            os.path.abspath(fp) for fp, success, _ in results_log if not success
-        ]
-        if new_failed_files:
-            with open(FAILED_DB_PATH, "a", encoding="utf-8") as f:
-                for fp in new_failed_files:
-                    f.write(fp + "\n")
+        # 结果到达时已逐条写入 processed_files.txt / failed_files.txt，这里只需落盘
+        journal.close()
+        timings.close()
+        telemetry.close()
+        failures.close()
+        total_logged = success_count + error_count
 
-        print("\n--- 📊 处理摘要 ---")
+        if cache is not None:
+            lookups = cache.hits + cache.misses
+            hit_rate = cache.hits / lookups if lookups else 0.0
+            removed, freed = cache.evict(args.cache_max_size * 1024 * 1024)
+            print(
+                f"\n💾 缓存: 命中 {cache.hits} / {lookups} 次查找 ({hit_rate:.1%})，"
+                f"淘汰 {removed} 项，释放 {freed / 1024 / 1024:.1f} MB"
+            )
 
-        # 根据原始文件名对结果进行排序
-        results_log.sort(key=lambda item: item[0])
+        elapsed = time.monotonic() - start_time
+        stage_summary = telemetry.summary()
+        if stage_summary:
+            print("\n--- ⏱️ 各阶段耗时与资源 ---")
+            for line in stage_summary:
+                print(line)
+            print(f"每个文件的记录保存在: {os.path.abspath(args.telemetry)}")
+            print(
+                f"总计: {total_logged} 个文件，用时 {elapsed:.1f} 秒，"
+                f"{total_logged / elapsed if elapsed else 0:.2f} 文件/秒"
+            )
+        if speculated_count:
+            print(
+                f"⚡ 推测执行了 {speculated_count} 个拖尾任务，"
+                f"其中 {speculation_wins} 个先于原任务完成"
+            )
 
-        success_count = 0
-        error_count = 0
+        print("\n--- 📊 处理摘要 ---")
 
-        if not results_log and files_to_process:
+        if not total_logged and files_to_process:
             print("没有任务完成或记录结果，可能是由于早期中断或错误。")
 
-        for original_fp, success, msg_detail in results_log:
-            if success:
-                success_count += 1
-                # 可以选择在这里打印每个成功的文件的详细信息，如果需要的话
-                # print(f"成功: {original_fp} 已处理。{msg_detail}")
-            else:
-                error_count += 1
-                print(
-                    f"处理 {original_fp} 时出错: {msg_detail}"
-                )  # 打印失败文件的完整错误消息
+        failure_summary = failures.summary()
+        if failure_summary:
+            print("按类别统计的失败:")
+            for line in failure_summary:
+                print(line)
 
-        total_attempted_or_logged = len(results_log)
         print(
-            f"\n处理/尝试的任务数（截至中断/完成）: {total_attempted_or_logged} / {len(files_to_process)}"
+            f"\n处理/尝试的任务数（截至中断/完成）: {total_logged} / {len(files_to_process)}"
         )
         print(f"成功处理: {success_count}")
         print(f"失败或出错: {error_count}")
 
         if error_count > 0:
-            print("⚠️ 请查看上面的错误消息以获取有关失败文件的详细信息。")
+            print(
+                f"⚠️ 失败文件的类别和（截断的）错误消息保存在: {os.path.abspath(args.failure_log)}"
+            )
         elif (
             success_count > 0
-            and total_attempted_or_logged == len(files_to_process)
+            and total_logged == len(files_to_process)
             and error_count == 0
         ):
             print("✅ 所有文件均已成功处理！")
         elif success_count > 0:
             print("✅ 部分文件已成功处理。")
-        elif total_attempted_or_logged == 0 and len(files_to_process) > 0:
+        elif total_logged == 0 and len(files_to_process) > 0:
             print("ℹ️ 没有文件被处理（可能是在处理开始前立即中断或设置问题）。")
         else:
             print("ℹ️ 处理运行完成。")
 
         print(f"🔗 已处理的文件记录保存在: {PROCESSED_DB_PATH}")
-        if new_failed_files:
+        if error_count > 0:
             print(f"❌ 失败的文件记录保存在: {FAILED_DB_PATH}")
 
 
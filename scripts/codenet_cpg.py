@@ -3,7 +3,11 @@ import glob
 import multiprocessing
 import os
 import subprocess
+import time
 
+from failures import CircuitBreaker, FailureLog, class_rate, truncate_log
+from progress import ProgressJournal
+from scheduling import TimingLog, largest_first
 from tqdm import tqdm
 
 # --- 配置 ---
@@ -20,6 +24,14 @@ CPG_NEO4J_EXECUTABLE = os.path.abspath("../cpg/cpg-neo4j/build/install/cpg-neo4j
 JSON2DOT_SCRIPT = os.path.abspath("./src/json2dot.py")
 # --- 配置结束 ---
 
+# 失败类别，用于失败记录 (failures.jsonl) 和按类别熔断
+FAILURE_CLASSES = {
+    "cpg": "cpg-neo4j 失败",
+    "json2dot": "json2dot.py 失败",
+    "missing": "未找到所需的文件或目录",
+    "other": "其它错误",
+}
+
 
 def process_file(args):
     """
@@ -27,7 +39,8 @@ def process_file(args):
     每个文件的输出都存储在以输入文件命名的目录内的 'cpg' 子目录中，
     该目录与输入文件位于同一目录。
     例如：输入: path/to/file.cpp -> 输出: path/to/file/cpg/
-    返回: (file_path, success_boolean, message_string)
+    返回: (file_path, success_boolean, message_string, failure_class)，
+    failure_class 为失败类别（见 FAILURE_CLASSES），成功时为 None
     """
     file_path, lang_param = args
     abs_file_path = os.path.abspath(file_path)
@@ -53,9 +66,6 @@ def process_file(args):
             check=False,
         )
         if cpg_result.returncode != 0:
-            print(f"\n[ERROR] cpg-neo4j 执行失败: {' '.join(cpg_cmd)}")
-            print(f"[STDOUT]:\n{cpg_result.stdout}")
-            print(f"[STDERR]:\n{cpg_result.stderr}")
             raise subprocess.CalledProcessError(
                 returncode=cpg_result.returncode,
                 cmd=cpg_cmd,
@@ -74,9 +84,6 @@ def process_file(args):
             check=False,
         )
         if json2dot_result.returncode != 0:
-            print(f"\n[ERROR] json2dot.py 执行失败: {' '.join(json2dot_cmd)}")
-            print(f"[STDOUT]:\n{json2dot_result.stdout}")
-            print(f"[STDERR]:\n{json2dot_result.stderr}")
             raise subprocess.CalledProcessError(
                 returncode=json2dot_result.returncode,
                 cmd=json2dot_cmd,
@@ -84,19 +91,27 @@ def process_file(args):
                 output=json2dot_result.stdout,
             )
 
-        return (file_path, True, f"输出位于 {current_file_cpg_root}")
+        return (file_path, True, f"输出位于 {current_file_cpg_root}", None)
 
     except subprocess.CalledProcessError as e:
         error_details = f"命令 '{' '.join(e.cmd)}' 执行失败，退出代码 {e.returncode}。"
         if hasattr(e, "output") and e.output and e.output.strip():
-            error_details += f"\n标准输出:\n{e.output.strip()}"
+            error_details += f"\n标准输出:\n{truncate_log(e.output)}"
         if e.stderr and e.stderr.strip():
-            error_details += f"\n标准错误:\n{e.stderr.strip()}"
-        return (file_path, False, error_details)
+            error_details += f"\n标准错误:\n{truncate_log(e.stderr)}"
+        failure_class = "cpg" if e.cmd[0] == CPG_NEO4J_EXECUTABLE else "json2dot"
+        return (file_path, False, error_details, failure_class)
     except FileNotFoundError as e:
-        return (file_path, False, f"未找到所需的文件或目录 - {e}")
+        return (file_path, False, f"未找到所需的文件或目录 - {e}", "missing")
     except Exception as e:
-        return (file_path, False, f"发生意外错误 - {type(e).__name__}: {e}")
+        return (file_path, False, f"发生意外错误 - {type(e).__name__}: {e}", "other")
+
+
+def timed_process_file(args):
+    """处理单个文件，返回 (结果元组, 耗时秒数)，耗时用于下次运行时的调度。"""
+    start = time.monotonic()
+    result_tuple = process_file(args)
+    return result_tuple, time.monotonic() - start
 
 
 def main():
@@ -116,6 +131,39 @@ def main():
         type=str,
         help="包含要处理的文件列表的文件路径。如果提供，则从此文件读取文件列表而不使用glob模式搜索",
     )
+    parser.add_argument(
+        "--failure-log",
+        type=str,
+        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "cpg_failures.jsonl"),
+        help="追加写入失败文件的类别和截断后错误消息的 JSONL 文件",
+    )
+    parser.add_argument(
+        "--breaker",
+        action="append",
+        type=class_rate(FAILURE_CLASSES),
+        default=[],
+        metavar="CLASS=RATE",
+        help="某一类失败在最近 --breaker-window 个结果中所占比例超过 RATE 时停止运行，"
+        "可多次指定，RATE 不小于 1 表示该类从不熔断。类别: " + ", ".join(FAILURE_CLASSES),
+    )
+    parser.add_argument(
+        "--breaker-window",
+        type=int,
+        default=100,
+        help="熔断统计的最近结果数，默认 100",
+    )
+    parser.add_argument(
+        "--breaker-min-results",
+        type=int,
+        default=10,
+        help="至少有多少个结果后才可能熔断（不超过 --breaker-window），默认 10",
+    )
+    parser.add_argument(
+        "--breaker-rate",
+        type=float,
+        default=0.5,
+        help="未用 --breaker 指定的类别的熔断阈值，默认 0.5",
+    )
     args = parser.parse_args()
 
     print("--------------------------------------------------------------------------")
@@ -177,18 +225,19 @@ def main():
     # 断点续跑数据库文件
     PROCESSED_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "processed_files.txt")
     FAILED_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "failed_files.txt")
-    processed_files_set = set()
-    if os.path.exists(PROCESSED_DB_PATH):
-        with open(PROCESSED_DB_PATH, "r", encoding="utf-8") as f:
-            for line in f:
-                processed_files_set.add(line.strip())
+    journal = ProgressJournal(PROCESSED_DB_PATH, FAILED_DB_PATH)
+    # 每个文件上次的处理耗时，用于优先调度耗时最长的文件
+    TIMINGS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cpg_timings.jsonl")
+    timings = TimingLog(TIMINGS_PATH)
 
     # 过滤掉已处理的文件
     original_count = len(files_to_process)
-    files_to_process = [fp for fp in files_to_process if os.path.abspath(fp) not in processed_files_set]
+    files_to_process = [fp for fp in files_to_process if fp not in journal]
     filtered_count = original_count - len(files_to_process)
 
     if not files_to_process:
+        journal.close()
+        timings.close()
         if args.file_list:
             print("文件列表中的所有文件均已处理，无需重复处理。")
         else:
@@ -203,45 +252,56 @@ def main():
         print(f"✅ 找到 {len(files_to_process)} 个要处理的文件 (已按文件名排序，已跳过已处理文件)。")
     print("ℹ️  每个文件 'path/to/file.ext' 的输出将位于 'path/to/file/cpg/'。")
 
+    # 预计耗时最长的文件先调度，避免最后剩下几个大文件、其它工作进程空等
     tasks_args = [
         (
             fp,
             LANG,
         )
-        for fp in files_to_process
+        for fp in largest_first(files_to_process, timings)
     ]
     num_workers = args.num_workers
     # num_workers = max(1, min(cpu_cores // 2, 16))
     # num_workers = 1 # 用于调试
 
-    results_log = []  # 存储 (file_path, success_bool, message_str) 元组
+    # 内存中只保留计数，失败的详细信息随结果到达写入 cpg_failures.jsonl
     success_count = 0
     error_count = 0
+    failures = FailureLog(args.failure_log)
+    breaker = CircuitBreaker(
+        args.breaker_window,
+        args.breaker_rate,
+        args.breaker,
+        min_results=args.breaker_min_results,
+    )
     print(f"⚙️  正在使用 {num_workers} 个工作进程初始化并行处理...")
 
     try:
         with multiprocessing.Pool(processes=num_workers) as pool:
             with tqdm(total=len(tasks_args), desc="🚀 处理文件", smoothing=0) as pbar:
-                for result_tuple in pool.imap_unordered(process_file, tasks_args):
-                    results_log.append(result_tuple)
-                    if result_tuple[1]:
+                # chunksize=1：任务按预计耗时顺序逐个分配给空闲的工作进程
+                for result_tuple, seconds in pool.imap_unordered(timed_process_file, tasks_args, chunksize=1):
+                    file_path, success, message, failure_class = result_tuple
+                    journal.record(file_path, success)
+                    if success:
+                        timings.record(file_path, seconds)
                         success_count += 1
                     else:
                         error_count += 1
+                        failures.record(file_path, failure_class, message)
                     pbar.set_postfix({"成功": success_count, "失败": error_count})
                     pbar.update(1)
 
-                    # Panic exit if error rate > 50% and processed > 10
-                    total_processed = success_count + error_count
-                    if total_processed > 10 and error_count / total_processed > 0.5:
-                        print(
-                            "\n🛑 Panic exit: 错误率超过50%，已处理文件数：{}，失败数：{}".format(
-                                total_processed, error_count
-                            )
+                    if breaker.observe(failure_class):
+                        tqdm.write(
+                            f"\n🛑 熔断: 最近 {breaker.seen} 个结果中 '{failure_class}' 类失败"
+                            f"（{FAILURE_CLASSES[failure_class]}）"
+                            f"占 {breaker.share(failure_class):.0%}，"
+                            f"超过阈值 {breaker.rate(failure_class):.0%}"
                         )
                         pool.terminate()
                         pool.join()
-                        raise SystemExit("Panic exit due to high error rate.")
+                        raise SystemExit(f"Circuit breaker tripped by '{failure_class}' failures.")
     except KeyboardInterrupt:
         print("\n🚫 用户通过 (Ctrl+C) 中断了进程。工作进程正在终止。")
         print("   将显示已完成工作的摘要。")
@@ -249,58 +309,40 @@ def main():
         print(f"\n❌ 并行处理期间发生意外错误: {type(e).__name__} - {e}")
         print("   工作进程正在终止。将显示已完成工作的摘要。")
     finally:
-        # 统一写入本轮新成功的文件到 processed_files.txt
-        new_success_files = [os.path.abspath(fp) for fp, success, _ in results_log if success]
-        if new_success_files:
-            with open(PROCESSED_DB_PATH, "a", encoding="utf-8") as f:
-                for fp in new_success_files:
-                    f.write(fp + "\n")
-
-        # 统一写入本轮新失败的文件到 failed_files.txt
-        new_failed_files = [os.path.abspath(fp) for fp, success, _ in results_log if not success]
-        if new_failed_files:
-            with open(FAILED_DB_PATH, "a", encoding="utf-8") as f:
-                for fp in new_failed_files:
-                    f.write(fp + "\n")
+        # 结果到达时已逐条写入 processed_files.txt / failed_files.txt，这里只需落盘
+        journal.close()
+        timings.close()
+        failures.close()
+        total_logged = success_count + error_count
 
         print("\n--- 📊 处理摘要 ---")
 
-        # 根据原始文件名对结果进行排序
-        results_log.sort(key=lambda item: item[0])
-
-        success_count = 0
-        error_count = 0
-
-        if not results_log and files_to_process:
+        if not total_logged and files_to_process:
             print("没有任务完成或记录结果，可能是由于早期中断或错误。")
 
-        for original_fp, success, msg_detail in results_log:
-            if success:
-                success_count += 1
-                # 可以选择在这里打印每个成功的文件的详细信息，如果需要的话
-                # print(f"成功: {original_fp} 已处理。{msg_detail}")
-            else:
-                error_count += 1
-                print(f"处理 {original_fp} 时出错: {msg_detail}")  # 打印失败文件的完整错误消息
-
-        total_attempted_or_logged = len(results_log)
-        print(f"\n处理/尝试的任务数（截至中断/完成）: {total_attempted_or_logged} / {len(files_to_process)}")
+        failure_summary = failures.summary()
+        if failure_summary:
+            print("按类别统计的失败:")
+            for line in failure_summary:
+                print(line)
+
+        print(f"\n处理/尝试的任务数（截至中断/完成）: {total_logged} / {len(files_to_process)}")
         print(f"成功处理: {success_count}")
         print(f"失败或出错: {error_count}")
 
         if error_count > 0:
-            print("⚠️ 请查看上面的错误消息以获取有关失败文件的详细信息。")
-        elif success_count > 0 and total_attempted_or_logged == len(files_to_process) and error_count == 0:
+            print(f"⚠️ 失败文件的类别和（截断的）错误消息保存在: {os.path.abspath(args.failure_log)}")
+        elif success_count > 0 and total_logged == len(files_to_process) and error_count == 0:
             print("✅ 所有文件均已成功处理！")
         elif success_count > 0:
             print("✅ 部分文件已成功处理。")
-        elif total_attempted_or_logged == 0 and len(files_to_process) > 0:
+        elif total_logged == 0 and len(files_to_process) > 0:
             print("ℹ️ 没有文件被处理（可能是在处理开始前立即中断或设置问题）。")
         else:
             print("ℹ️ 处理运行完成。")
 
         print(f"🔗 已处理的文件记录保存在: {PROCESSED_DB_PATH}")
-        if new_failed_files:
+        if error_count > 0:
             print(f"❌ 失败的文件记录保存在: {FAILED_DB_PATH}")
 
 
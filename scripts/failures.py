@@ -0,0 +1,160 @@
+"""
+CodeNet 批处理脚本的失败记录与熔断。
+
+失败按类别记录（类别由各驱动脚本定义，见其 FAILURE_CLASSES）：每个失败的文件
+一行 JSONL，结果一到达就写入磁盘，日志截断到固定长度；主进程内存中只保留
+每个类别的计数和少量示例，长时间的运行不会因错误消息占满内存。
+
+CircuitBreaker 按类别统计最近一段结果中的失败比例，超过阈值时停止运行，
+代替以前 "处理超过 10 个文件后总错误率超过 50% 即退出" 的做法：短暂的集中失败
+（例如几个超时）不会中止长时间的运行，而某一类失败持续占多数
+（例如 Joern 未安装导致全部解析失败）时仍会及早停止——与以前一样，
+看到 10 个结果后即可熔断，不必等窗口填满。
+"""
+
+import argparse
+import json
+import os
+import time
+from collections import Counter, deque
+
+# 失败消息中每段日志保留的最大字符数
+LOG_LIMIT = 2000
+
+
+def truncate_log(text, limit=LOG_LIMIT):
+    """截断日志：保留开头和结尾（异常信息通常在结尾），中间以省略标记代替。"""
+    text = text.strip()
+    if len(text) <= limit:
+        return text
+    head = limit // 4
+    tail = limit - head
+    omitted = len(text) - head - tail
+    return f"{text[:head]}\n... [省略 {omitted} 个字符] ...\n{text[-tail:]}"
+
+
+def class_rate(classes):
+    """
+    返回 argparse 类型：把 '类别=比例' 解析为 (类别, 比例)，
+    类别必须是 classes 之一，拼错的类别名不会被悄悄忽略。
+    """
+
+    def parse(text):
+        failure_class, sep, rate = text.partition("=")
+        try:
+            if not sep or not failure_class:
+                raise ValueError
+            rate = float(rate)
+        except ValueError:
+            raise argparse.ArgumentTypeError(
+                f"应为 类别=比例，例如 timeout=0.8: {text}"
+            )
+        if failure_class not in classes:
+            raise argparse.ArgumentTypeError(
+                f"未知的失败类别 '{failure_class}'，可选: {', '.join(classes)}"
+            )
+        return failure_class, rate
+
+    return parse
+
+
+class FailureLog:
+    """
+    失败记录，只由主进程写入。每行:
+    {"file": 绝对路径, "class": 类别, "message": 截断后的消息, ...附加字段, "time": 时间戳}
+
+    Attributes:
+        counts: 各类别的失败数
+        examples: 各类别最先出现的几个失败 [(文件, 消息), ...]
+    """
+
+    def __init__(self, path, max_examples=3):
+        self.path = path
+        self.max_examples = max_examples
+        self.counts = Counter()
+        self.examples = {}
+        self._file = open(path, "a", encoding="utf-8")  # noqa: SIM115
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def record(self, file_path, failure_class, message, **extra):
+        """记录一个失败的文件。"""
+        message = truncate_log(message)
+        record = {
+            "file": os.path.abspath(file_path),
+            "class": failure_class,
+            "message": message,
+            **extra,
+            "time": round(time.time(), 3),
+        }
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        self.counts[failure_class] += 1
+        examples = self.examples.setdefault(failure_class, [])
+        if len(examples) < self.max_examples:
+            examples.append((file_path, message))
+
+    def summary(self):
+        """按类别汇总的失败数和示例，返回要打印的各行。"""
+        lines = []
+        for failure_class, count in self.counts.most_common():
+            lines.append(f"[{failure_class}] {count} 个文件，例如:")
+            for file_path, message in self.examples[failure_class]:
+                first_line = message.splitlines()[0] if message else ""
+                lines.append(f"    {file_path}: {first_line}")
+        return lines
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class CircuitBreaker:
+    """
+    按失败类别熔断：最近 window 个结果中，某一类失败所占比例超过该类别的阈值时跳闸。
+    已有 min(window, min_results) 个结果后即可跳闸，短的运行和一开始就全部失败的
+    运行也能及早停止；阈值不小于 1 的类别从不跳闸。
+    """
+
+    def __init__(self, window=100, default_rate=0.5, rates=None, min_results=10):
+        self.window = window
+        self.min_results = min(window, min_results)
+        self.default_rate = default_rate
+        self.rates = dict(rates or {})
+        self._recent = deque(maxlen=window)
+        self._counts = Counter()
+
+    def rate(self, failure_class):
+        """类别的熔断阈值。"""
+        return self.rates.get(failure_class, self.default_rate)
+
+    @property
+    def seen(self):
+        """计入比例的结果数（最多 window 个）。"""
+        return len(self._recent)
+
+    def share(self, failure_class):
+        """类别在最近的结果中所占的比例。"""
+        return self._counts[failure_class] / max(1, len(self._recent))
+
+    def observe(self, failure_class):
+        """
+        记录一个结果（成功时 failure_class 为 None）。
+        该类别因此跳闸时返回 True。
+        """
+        if len(self._recent) == self.window:
+            expired = self._recent[0]
+            if expired is not None:
+                self._counts[expired] -= 1
+        self._recent.append(failure_class)
+        if failure_class is None:
+            return False
+        self._counts[failure_class] += 1
+        return len(self._recent) >= self.min_results and self.share(
+            failure_class
+        ) > self.rate(failure_class)
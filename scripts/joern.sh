@@ -27,25 +27,5 @@ do
     joern-export --repr="$repr" --out "./out/joern/$repr"
 done
 
-python src/merge.py \
-    --cfg ./out/joern/cfg/* \
-    --pdg ./out/joern/pdg/* \
-    --ref ./out/joern/all/export.dot \
-    --lang "$lang" \
-    -o "./out/cdfg.dot"
-
-python src/merge.py \
-    --ast ./out/joern/ast/* \
-    --cfg ./out/joern/cfg/* \
-    --pdg ./out/joern/pdg/* \
-    --ref ./out/joern/all/export.dot \
-    --lang "$lang" \
-    -o "./out/ast_cdfg.dot"
-
-python src/filter.py ./out/joern/all/export.dot
-
-python ./src/v2.py ./out/joern/all/export.dot --cfg ./out/joern/cfg/* --lang "$lang"
-
-python ./src/v2.py ./out/joern/all/export.dot --cfg ./out/joern/cfg/* --lang "$lang" --ast -o ./out/ast_v2.dot
-
-python src/visualization.py ./out/joern/all/export.dot
\ No newline at end of file
+# cdfg, ast_cdfg, filtered, v2, ast_v2 and pretty, from a single load of the export
+python src/variants.py ./out/joern --lang "$lang" -o ./out
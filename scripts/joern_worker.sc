@@ -0,0 +1,44 @@
+// 常驻 Joern 进程，供 scripts/codenet.py --joern-server 使用:
+//   joern --script scripts/joern_worker.sc
+// 协议见 codenet.py 中的 JoernWorker：stdin 每行一个请求 "<源文件>\t<输出目录>"，
+// 在输出目录下生成与 joern-export --repr=all 相同的 all/export.dot，
+// 然后输出一行应答。stdin 关闭后退出。
+// 基于 Joern 4.x (flatgraph) 的 API。
+
+import java.nio.file.{Files, Paths}
+import scala.io.StdIn
+import scala.util.{Failure, Success, Try}
+
+val Reply = "@@joern-worker"
+
+def reply(status: String, message: String = ""): Unit = {
+  println(s"$Reply $status\t${message.replace('\n', ' ')}")
+  Console.flush()
+}
+
+def process(source: String, outDir: String): Unit = {
+  val projectName = Paths.get(outDir).getParent.getFileName.toString
+  importCode(inputPath = source, projectName = projectName)
+  try {
+    val allDir = Paths.get(outDir, "all")
+    Files.createDirectories(allDir)
+    flatgraph.formats.dot.DotExporter.runExport(cpg.graph, allDir)
+  } finally {
+    // 不保留 workspace，避免 JVM 内存和磁盘随处理的文件数增长
+    Try(delete(projectName))
+  }
+}
+
+reply("ready")
+var line = StdIn.readLine()
+while (line != null) {
+  line.split("\t", 2) match {
+    case Array(source, outDir) =>
+      Try(process(source, outDir)) match {
+        case Success(_) => reply("ok", outDir)
+        case Failure(e) => reply("error", s"${e.getClass.getName}: ${e.getMessage}")
+      }
+    case _ => reply("error", s"无效请求: $line")
+  }
+  line = StdIn.readLine()
+}
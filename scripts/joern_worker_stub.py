@@ -0,0 +1,70 @@
+"""
+常驻 Joern 进程的替身，实现与 scripts/joern_worker.sc 相同的协议，
+用于在没有安装 Joern 的环境中测试 codenet.py 的常驻进程模式：
+
+    python scripts/codenet.py --file_list files.txt \
+        --joern-worker-cmd "python scripts/joern_worker_stub.py"
+
+每个请求生成一个小的合成 all/export.dot (见 src/benchmark.py)。请求的是目录时
+（--batch-size 批处理模式），目录中每个文件各占一部分方法，并带有 FILENAME。
+源文件中包含 JOERN_STUB_FAIL 时返回错误，包含 JOERN_STUB_CRASH 时进程退出，
+包含 JOERN_STUB_HANG 时不再应答，用于测试错误处理、超时和进程重启。
+"""
+
+import os
+import sys
+import time
+import zlib
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+)
+from benchmark import synthetic_export
+
+REPLY = "@@joern-worker"
+
+
+def reply(status, message=""):
+    print(f"{REPLY} {status}\t{message}", flush=True)
+
+
+def main():
+    # 模拟 Joern 启动时的输出，驱动程序应当忽略这些行
+    print("Compiling script... (joern_worker_stub)", flush=True)
+    reply("ready")
+    for line in sys.stdin:
+        source, _, output_dir = line.rstrip("\n").partition("\t")
+        try:
+            if os.path.isdir(source):
+                filenames = sorted(os.listdir(source))
+                paths = [os.path.join(source, name) for name in filenames]
+            else:
+                filenames = None
+                paths = [source]
+            code = ""
+            for path in paths:
+                with open(path, "r", encoding="utf-8") as f:
+                    code += f.read()
+            if "JOERN_STUB_CRASH" in code:
+                print(f"java.lang.OutOfMemoryError while parsing {source}", flush=True)
+                sys.exit(1)
+            if "JOERN_STUB_HANG" in code:
+                time.sleep(3600)
+            if "JOERN_STUB_FAIL" in code:
+                raise RuntimeError(f"failed to parse {source}")
+            os.makedirs(os.path.join(output_dir, "all"), exist_ok=True)
+            synthetic_export(
+                os.path.join(output_dir, "all", "export.dot"),
+                methods=5 * len(paths),
+                statements=5,
+                seed=zlib.crc32(code.encode()),
+                filenames=filenames,
+            )
+            print(f"Imported {source}", flush=True)
+            reply("ok", output_dir)
+        except Exception as e:
+            reply("error", f"{type(e).__name__}: {e}")
+
+
+if __name__ == "__main__":
+    main()
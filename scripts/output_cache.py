@@ -0,0 +1,182 @@
+"""
+codenet.py 的内容寻址输出缓存。
+
+CodeNet 中有大量内容相同（或只有行尾空白不同）的提交，重跑时源文件也大多没变。
+缓存以规范化后的源码哈希加上流水线版本为键，每个键只保存一份生成的
+v2.dot / ast_v2.dot，命中时硬链接（跨文件系统时复制）到文件的 'joern/' 目录，
+不再运行 Joern 和 v2。输出中的 FILENAME 等属性带有源文件名，缓存项记录它来自
+的源文件，命中的是另一个路径的文件时，复制一份并把文件名改为该文件的。
+
+缓存目录结构: <root>/<键的前两位>/<键>/{v2.dot, ast_v2.dot, source}
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+CACHED_FILES = ("v2.dot", "ast_v2.dot")
+# 缓存项中记录输出来自的源文件路径的文件
+SOURCE_FILE = "source"
+
+
+def normalize_source(data: bytes) -> bytes:
+    """
+    规范化源码：统一换行符，去掉行尾空白和文件末尾的空行。
+    这些差异不改变行号和列号，一般也不出现在节点的 CODE 中。
+    """
+    lines = data.replace(b"\r\n", b"\n").replace(b"\r", b"\n").split(b"\n")
+    return b"\n".join(line.rstrip() for line in lines).rstrip(b"\n")
+
+
+def pipeline_version(*parts) -> str:
+    """
+    流水线版本：src 下所有 Python 源码的哈希，加上调用方给出的其它部分
+    （例如 Joern 的版本和命令），其中的文件路径按文件内容计入。
+    任何一部分改变都会使旧的缓存项失效。
+    """
+    digest = hashlib.sha256()
+    src_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+    for dirpath, dirnames, filenames in os.walk(src_dir):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.endswith(".py"):
+                path = os.path.join(dirpath, filename)
+                digest.update(os.path.relpath(path, src_dir).encode())
+                with open(path, "rb") as f:
+                    digest.update(f.read())
+    for part in parts:
+        digest.update(b"\0" + str(part).encode())
+        if part and os.path.isfile(part):
+            with open(os.path.realpath(part), "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def link_or_copy(src, dst):
+    """优先硬链接，跨文件系统时复制。"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+class OutputCache:
+    """
+    v2.dot / ast_v2.dot 的内容寻址缓存，只由主进程读写。
+
+    renamer(renames) 返回把文本中的源文件名 (renames 的键) 换成新文件名的函数，
+    见 src/split.py 的 renamer；为 None 时命中的输出总是原样链接。
+
+    Attributes:
+        hits: 命中次数
+        misses: 未命中次数
+    """
+
+    def __init__(self, root, version, renamer=None):
+        self.root = root
+        self.version = version
+        self.renamer = renamer
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(root, exist_ok=True)
+
+    def key(self, file_path) -> str:
+        """返回源文件的缓存键。"""
+        with open(file_path, "rb") as f:
+            data = normalize_source(f.read())
+        digest = hashlib.sha256(self.version.encode())
+        digest.update(b"\0" + data)
+        return digest.hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def restore(self, key, dest_dir, file_path) -> bool:
+        """
+        把缓存的输出放入源文件 file_path 的输出目录 dest_dir。
+        缓存项不存在或不完整时返回 False。
+        """
+        entry = self._entry(key)
+        if not all(
+            os.path.isfile(os.path.join(entry, f)) for f in (*CACHED_FILES, SOURCE_FILE)
+        ):
+            self.misses += 1
+            return False
+        with open(os.path.join(entry, SOURCE_FILE), "r", encoding="utf-8") as f:
+            source = f.read()
+        rename = None
+        if source != file_path and self.renamer is not None:
+            rename = self.renamer(
+                {
+                    os.path.basename(source): os.path.basename(file_path),
+                    source: file_path,
+                }
+            )
+        os.makedirs(dest_dir, exist_ok=True)
+        for filename in CACHED_FILES:
+            dst = os.path.join(dest_dir, filename)
+            if os.path.lexists(dst):
+                os.remove(dst)
+            if rename is None:
+                link_or_copy(os.path.join(entry, filename), dst)
+                continue
+            with open(os.path.join(entry, filename), "r", encoding="utf-8") as f:
+                text = f.read()
+            with open(dst, "w", encoding="utf-8") as f:
+                f.write(rename(text))
+        # 记录最近使用时间，淘汰时先删除最久未用的缓存项
+        os.utime(entry)
+        self.hits += 1
+        return True
+
+    def store(self, key, src_dir, file_path):
+        """
+        把源文件 file_path 在 src_dir 中生成的输出加入缓存。
+        缓存项已存在时什么也不做。
+        """
+        entry = self._entry(key)
+        if os.path.isdir(entry):
+            return
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        # 先写到临时目录再改名，中断时不会留下不完整的缓存项
+        tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(entry), prefix=".tmp-")
+        try:
+            for filename in CACHED_FILES:
+                link_or_copy(
+                    os.path.join(src_dir, filename), os.path.join(tmp_dir, filename)
+                )
+            with open(os.path.join(tmp_dir, SOURCE_FILE), "w", encoding="utf-8") as f:
+                f.write(file_path)
+            os.rename(tmp_dir, entry)
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def evict(self, max_bytes):
+        """
+        按最近使用时间淘汰缓存项，直到总大小不超过 max_bytes。
+        返回 (删除的缓存项数, 释放的字节数)。
+        """
+        entries = []
+        total = 0
+        for prefix in os.scandir(self.root):
+            if not prefix.is_dir():
+                continue
+            for entry in os.scandir(prefix.path):
+                if entry.name.startswith(".tmp-"):
+                    # 中断的写入
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                    continue
+                size = sum(f.stat().st_size for f in os.scandir(entry.path))
+                entries.append((entry.stat().st_mtime, size, entry.path))
+                total += size
+
+        removed = freed = 0
+        for _, size, path in sorted(entries):
+            if total <= max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            removed += 1
+            freed += size
+        return removed, freed
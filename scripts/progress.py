@@ -0,0 +1,110 @@
+"""
+CodeNet 批处理脚本 (codenet.py, codenet_cpg.py) 共用的断点续跑记录。
+
+processed_files.txt 记录处理成功的文件，failed_files.txt 记录失败的文件，
+每行一个绝对路径，格式与以前相同。两个文件都是只追加的日志：每个结果一到达
+就写入内核（进程被 SIGKILL / OOM 杀死也不会丢失），并按条数或时间批量 fsync
+（机器掉电时最多丢失最后一批）。
+"""
+
+import os
+import time
+
+
+class ProgressJournal:
+    """
+    断点续跑记录。
+
+    打开时读入已成功的文件集合，之后每个文件是否已处理是 O(1) 的集合查找。
+    崩溃时写了一半的最后一行会被截掉；重复的行和之后已成功的失败记录
+    在打开时通过压缩（写临时文件后原子替换）清除，日志不会无限增长。
+    """
+
+    def __init__(self, processed_path, failed_path, sync_every=64, sync_interval=5.0):
+        self.processed_path = processed_path
+        self.failed_path = failed_path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+
+        processed_lines = self._read_lines(processed_path)
+        failed_lines = self._read_lines(failed_path)
+        self.processed = set(processed_lines)
+        failed = dict.fromkeys(fp for fp in failed_lines if fp not in self.processed)
+        if len(self.processed) < len(processed_lines) or len(failed) < len(
+            failed_lines
+        ):
+            self._rewrite(processed_path, dict.fromkeys(processed_lines))
+            self._rewrite(failed_path, failed)
+
+        self._files = {
+            True: open(processed_path, "a", encoding="utf-8"),  # noqa: SIM115
+            False: open(failed_path, "a", encoding="utf-8"),  # noqa: SIM115
+        }
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def __contains__(self, file_path):
+        return os.path.abspath(file_path) in self.processed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def record(self, file_path, success):
+        """记录一个文件的处理结果。"""
+        file_path = os.path.abspath(file_path)
+        f = self._files[success]
+        f.write(file_path + "\n")
+        f.flush()
+        if success:
+            self.processed.add(file_path)
+        self._pending += 1
+        if (
+            self._pending >= self.sync_every
+            or time.monotonic() - self._last_sync >= self.sync_interval
+        ):
+            self.sync()
+
+    def sync(self):
+        """把已写入的记录 fsync 到磁盘。"""
+        for f in self._files.values():
+            f.flush()
+            os.fsync(f.fileno())
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        if self._files is None:
+            return
+        self.sync()
+        for f in self._files.values():
+            f.close()
+        self._files = None
+
+    @staticmethod
+    def _read_lines(path):
+        """读取记录，截掉崩溃时写了一半的最后一行。"""
+        if not os.path.exists(path):
+            return []
+        with open(path, "rb+") as f:
+            data = f.read()
+            complete = data.rfind(b"\n") + 1
+            if complete < len(data):
+                f.truncate(complete)
+        return [
+            line.strip()
+            for line in data[:complete].decode("utf-8").splitlines()
+            if line.strip()
+        ]
+
+    @staticmethod
+    def _rewrite(path, lines):
+        """原子地重写记录文件：先写临时文件并 fsync，再替换原文件。"""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(line + "\n" for line in lines)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
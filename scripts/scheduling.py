@@ -0,0 +1,268 @@
+"""
+CodeNet 批处理脚本的调度工具：按可用内存限制同时运行的 JVM 数、分阶段超时，
+以及按历史耗时估计开销、优先调度耗时最长的文件。
+
+每个 Joern JVM 要占用数 GB 内存，工作进程数按 CPU 核数设置时很容易 OOM；
+而 Python 的 v2 阶段只占 CPU。JvmSlots 只限制同时运行的 JVM，
+其余工作进程照常执行 v2。超时后整个进程组被杀掉，不会留下孤儿 JVM。
+
+文件按路径顺序处理时，排在最后的几个大文件会让其它工作进程空等；
+TimingLog 记录每个文件的耗时，下次运行时 largest_first 先调度预计最慢的文件。
+"""
+
+import contextlib
+import json
+import multiprocessing
+import os
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+
+# 当前进程中 run_command 正在运行的命令
+_running = set()
+
+
+class StageTimeout(Exception):
+    """某个处理阶段超时。"""
+
+    def __init__(self, stage, seconds):
+        super().__init__(f"{stage} 超过 {seconds:g} 秒未完成")
+        self.stage = stage
+        self.seconds = seconds
+
+
+def available_memory():
+    """返回可用内存（/proc/meminfo 的 MemAvailable，字节），无法读取时返回 None。"""
+    try:
+        with open("/proc/meminfo", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def jvm_slots_for(jvm_memory, limit):
+    """按当前可用内存计算最多能同时运行几个 JVM（至少 1 个，最多 limit 个）。"""
+    available = available_memory()
+    if available is None:
+        return limit
+    return max(1, min(limit, available // jvm_memory))
+
+
+class JvmSlots:
+    """
+    限制同时运行的 JVM 数：最多 slots 个，并且在可用内存不足一个 JVM 时
+    （例如机器上的其它程序占用了内存）先等待，最多等待 max_wait 秒。
+    在主进程创建，通过 Pool 的 initargs 传给工作进程。
+    """
+
+    def __init__(self, slots, jvm_memory, max_wait=60.0, poll_interval=1.0):
+        self.slots = slots
+        self.jvm_memory = jvm_memory
+        self.max_wait = max_wait
+        self.poll_interval = poll_interval
+        self._semaphore = multiprocessing.BoundedSemaphore(slots)
+
+    @contextlib.contextmanager
+    def acquire(self):
+        with self._semaphore:
+            deadline = time.monotonic() + self.max_wait
+            while time.monotonic() < deadline:
+                available = available_memory()
+                if available is None or available >= self.jvm_memory:
+                    break
+                time.sleep(self.poll_interval)
+            yield
+
+
+@contextlib.contextmanager
+def time_limit(seconds, stage):
+    """
+    超过 seconds 秒时在当前进程中抛出 StageTimeout（基于 SIGALRM，只能在主线程使用）。
+    seconds 为 None 或 0 时不限时。
+    """
+    if not seconds:
+        yield
+        return
+
+    def on_alarm(signum, frame):
+        raise StageTimeout(stage, seconds)
+
+    previous = signal.signal(signal.SIGALRM, on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def kill_process_group(process):
+    """杀掉子进程所在的整个进程组（子进程需以 start_new_session=True 启动）。"""
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def kill_running_commands():
+    """杀掉当前进程中 run_command 正在运行的所有命令的进程组。"""
+    for process in list(_running):
+        kill_process_group(process)
+
+
+def run_command(cmd, cwd, timeout, stage, recorder=None):
+    """
+    运行命令并捕获输出，与 subprocess.run(..., text=True) 相同，但超时后
+    杀掉整个进程组（Joern 的启动脚本会再启动 JVM 子进程）并抛出 StageTimeout。
+    recorder（telemetry.StageRecorder）不为 None 时，把命令的墙钟时间、
+    CPU 时间和峰值 RSS 记为 stage 阶段。
+    """
+    with tempfile.TemporaryFile() as stdout, tempfile.TemporaryFile() as stderr:
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            cmd, cwd=cwd, stdout=stdout, stderr=stderr, start_new_session=True
+        )
+        _running.add(process)
+        timed_out = threading.Event()
+
+        def on_timeout():
+            timed_out.set()
+            kill_process_group(process)
+
+        timer = threading.Timer(timeout, on_timeout) if timeout else None
+        if timer is not None:
+            timer.daemon = True
+            timer.start()
+        try:
+            # 用 wait4 回收子进程，以取得它自己的 CPU 时间和峰值 RSS
+            _, status, rusage = os.wait4(process.pid, 0)
+        except BaseException:
+            kill_process_group(process)
+            process.wait()
+            raise
+        finally:
+            _running.discard(process)
+            if timer is not None:
+                timer.cancel()
+        process.returncode = os.waitstatus_to_exitcode(status)
+        if recorder is not None:
+            recorder.add_rusage(stage, time.perf_counter() - start, rusage)
+        if timed_out.is_set():
+            raise StageTimeout(stage, timeout)
+
+        stdout.seek(0)
+        stderr.seek(0)
+        return subprocess.CompletedProcess(
+            cmd,
+            process.returncode,
+            stdout.read().decode(errors="replace"),
+            stderr.read().decode(errors="replace"),
+        )
+
+
+class TimingLog:
+    """
+    每个文件最近一次处理成功的耗时，用于估计下次运行的开销。
+
+    JSONL 文件，每行 {"file": 绝对路径, "size": 字节数, "seconds": 秒数}，
+    后写的记录覆盖先写的；重复记录过多时在打开时压缩。
+    没有历史耗时的文件（或大小已改变的文件）按已知文件拟合的
+    "固定开销 + 每字节耗时" 估计。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.timings = {}  # 绝对路径 -> (字节数, 秒数)
+        lines = 0
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 崩溃时写了一半的最后一行
+                        continue
+                    self.timings[record["file"]] = (record["size"], record["seconds"])
+                    lines += 1
+        if lines > 2 * len(self.timings):
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.writelines(
+                    self._format(file_path, size, seconds)
+                    for file_path, (size, seconds) in self.timings.items()
+                )
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        self._file = open(path, "a", encoding="utf-8")  # noqa: SIM115
+        self._fit = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def record(self, file_path, seconds):
+        """记录一个文件的处理耗时。"""
+        file_path = os.path.abspath(file_path)
+        size = os.path.getsize(file_path)
+        self.timings[file_path] = (size, seconds)
+        self._file.write(self._format(file_path, size, seconds))
+        self._file.flush()
+        self._fit = None
+
+    def estimate(self, file_path):
+        """
+        预计耗时（秒）：文件大小未变时用上次的耗时，否则按拟合估计。
+        还没有任何历史耗时时返回 None。
+        """
+        file_path = os.path.abspath(file_path)
+        size = os.path.getsize(file_path)
+        known = self.timings.get(file_path)
+        if known is not None and known[0] == size:
+            return known[1]
+        if not self.timings:
+            return None
+        if self._fit is None:
+            self._fit = self._fit_cost()
+        overhead, per_byte = self._fit
+        return overhead + per_byte * size
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _fit_cost(self):
+        """最小二乘拟合 秒数 = 固定开销 + 每字节耗时 * 字节数，两项都不小于 0。"""
+        n = len(self.timings)
+        sum_x = sum(size for size, _ in self.timings.values())
+        sum_y = sum(seconds for _, seconds in self.timings.values())
+        sum_xx = sum(size * size for size, _ in self.timings.values())
+        sum_xy = sum(size * seconds for size, seconds in self.timings.values())
+        variance = n * sum_xx - sum_x * sum_x
+        per_byte = (n * sum_xy - sum_x * sum_y) / variance if variance else 0.0
+        per_byte = max(0.0, per_byte)
+        overhead = max(0.0, (sum_y - per_byte * sum_x) / n)
+        return overhead, per_byte
+
+    @staticmethod
+    def _format(file_path, size, seconds):
+        record = {"file": file_path, "size": size, "seconds": round(seconds, 3)}
+        return json.dumps(record, ensure_ascii=False) + "\n"
+
+
+def largest_first(file_paths, timings):
+    """按预计耗时从大到小排列文件；还没有历史耗时时按文件大小。"""
+
+    def cost(file_path):
+        estimate = timings.estimate(file_path)
+        return estimate if estimate is not None else os.path.getsize(file_path)
+
+    return sorted(file_paths, key=cost, reverse=True)
@@ -0,0 +1,216 @@
+"""
+CodeNet 批处理脚本的分阶段遥测：每个文件每个阶段的墙钟时间、CPU 时间和峰值 RSS。
+
+工作进程用 StageRecorder 记录各阶段，主进程用 TelemetryLog 把每个文件的记录
+追加到 JSONL 文件（每行一个文件），运行结束时按阶段汇总百分位数。
+
+峰值 RSS 的测量方式：
+  - 进程内的阶段（例如 v2 的解析、剪枝、写出）：阶段开始前向 /proc/self/clear_refs
+    写入 "5" 清零峰值 (VmHWM)，结束时读取 VmHWM；
+  - 子进程（joern-parse / joern-export）：wait4 返回的该子进程的 rusage；
+  - 常驻 Joern 进程：对其进程组中的每个进程同样清零再读取 VmHWM，
+    CPU 时间取 /proc/<pid>/stat 的差值。
+"""
+
+import contextlib
+import json
+import math
+import os
+import resource
+import time
+from array import array
+
+METRICS = ("wall", "cpu", "peak_rss_mb")
+PERCENTILES = (50, 90, 99)
+
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+
+def _read_hwm(pid="self"):
+    """返回进程的峰值 RSS（字节），无法读取时返回 None。"""
+    try:
+        with open(f"/proc/{pid}/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _reset_hwm(pid="self"):
+    """把进程的峰值 RSS 清零为当前 RSS（Linux 4.0 起支持）。"""
+    try:
+        with open(f"/proc/{pid}/clear_refs", "w", encoding="utf-8") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss():
+    """当前进程的峰值 RSS（字节）。"""
+    hwm = _read_hwm()
+    if hwm is not None:
+        return hwm
+    # ru_maxrss 在 Linux 上以 KiB 为单位，且无法清零
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _group_members(pgid):
+    """返回进程组中各进程的 (pid, CPU 秒数)。"""
+    members = []
+    for entry in os.scandir("/proc"):
+        if not entry.name.isdigit():
+            continue
+        try:
+            with open(os.path.join(entry.path, "stat"), "r", encoding="utf-8") as f:
+                # 进程名可能含空格，从最后一个 ')' 之后开始按字段切分
+                fields = f.read().rpartition(")")[2].split()
+        except OSError:
+            continue
+        if int(fields[2]) == pgid:
+            cpu = (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS
+            members.append((int(entry.name), cpu))
+    return members
+
+
+def reset_group_peak(pgid):
+    """把进程组中每个进程的峰值 RSS 清零。"""
+    for pid, _ in _group_members(pgid):
+        _reset_hwm(pid)
+
+
+def group_usage(pgid):
+    """返回进程组的 (CPU 秒数, 各进程峰值 RSS 之和（字节）)。"""
+    cpu = rss = 0
+    for pid, member_cpu in _group_members(pgid):
+        cpu += member_cpu
+        rss += _read_hwm(pid) or 0
+    return cpu, rss
+
+
+class StageRecorder:
+    """
+    一个文件（或一批文件）各阶段的资源使用。同名阶段多次出现时，
+    墙钟时间和 CPU 时间累加，峰值 RSS 取最大值。
+
+    Attributes:
+        stages: {阶段: {"wall": 秒, "cpu": 秒, "peak_rss_mb": MB}}
+    """
+
+    def __init__(self, stages=None):
+        self.stages = stages if stages is not None else {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """测量在当前进程中运行的阶段。阶段抛出异常时同样记录。"""
+        _reset_hwm()
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            self.add(
+                name,
+                time.perf_counter() - wall,
+                time.process_time() - cpu,
+                peak_rss(),
+            )
+
+    def add(self, name, wall, cpu, rss):
+        """记录一个阶段，rss 以字节为单位。"""
+        metrics = self.stages.setdefault(
+            name, {"wall": 0.0, "cpu": 0.0, "peak_rss_mb": 0.0}
+        )
+        metrics["wall"] += wall
+        metrics["cpu"] += cpu
+        metrics["peak_rss_mb"] = max(metrics["peak_rss_mb"], rss / 1024 / 1024)
+
+    def add_rusage(self, name, wall, rusage):
+        """记录一个子进程阶段，rusage 为 wait4 返回的该子进程的资源使用。"""
+        self.add(name, wall, rusage.ru_utime + rusage.ru_stime, rusage.ru_maxrss * 1024)
+
+    def shared(self, count):
+        """
+        把整批的阶段平均分给 count 个文件：返回每个文件的一份副本，
+        墙钟时间和 CPU 时间除以 count，峰值 RSS 不变。
+        """
+        return {
+            name: {
+                "wall": metrics["wall"] / count,
+                "cpu": metrics["cpu"] / count,
+                "peak_rss_mb": metrics["peak_rss_mb"],
+            }
+            for name, metrics in self.stages.items()
+        }
+
+
+def percentile(sorted_values, p):
+    """最近秩法的 p 百分位数，sorted_values 须已排序且非空。"""
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class TelemetryLog:
+    """
+    每个文件一行的遥测记录，只由主进程写入：
+    {"file": 绝对路径, "success": 是否成功, ...附加字段, "stages": StageRecorder.stages}
+    同时按阶段保存各项指标（紧凑的 array），用于运行结束时的汇总。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")  # noqa: SIM115
+        self._values = {}  # 阶段 -> {指标: array('d')}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def record(self, file_path, success, stages, **extra):
+        """记录一个文件的一次处理。"""
+        record = {"file": os.path.abspath(file_path), "success": success, **extra}
+        record["stages"] = {
+            name: {metric: round(value, 3) for metric, value in metrics.items()}
+            for name, metrics in stages.items()
+        }
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        for name, metrics in stages.items():
+            values = self._values.setdefault(
+                name, {metric: array("d") for metric in METRICS}
+            )
+            for metric in METRICS:
+                values[metric].append(metrics[metric])
+
+    def summary(self):
+        """按阶段汇总的百分位数，返回要打印的各行。"""
+        lines = []
+        for name, values in self._values.items():
+            wall = sorted(values["wall"])
+            cpu = sorted(values["cpu"])
+            rss = sorted(values["peak_rss_mb"])
+            total = sum(wall)
+
+            def spread(sorted_values, fmt):
+                parts = [
+                    f"p{p} {percentile(sorted_values, p):{fmt}}" for p in PERCENTILES
+                ]
+                parts.append(f"max {sorted_values[-1]:{fmt}}")
+                return " ".join(parts)
+
+            lines.append(
+                f"{name}: {len(wall)} 次，累计 {total:.1f} 秒，"
+                f"单进程 {len(wall) / total if total else 0:.2f} 次/秒\n"
+                f"    墙钟(秒) {spread(wall, '.2f')}\n"
+                f"    CPU(秒)  {spread(cpu, '.2f')}\n"
+                f"    峰值RSS(MB) {spread(rss, '.0f')}"
+            )
+        return lines
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,566 @@
+import argparse
+import functools
+import logging
+import multiprocessing
+import os
+import random
+import resource
+import tempfile
+import time
+import timeit
+
+import networkx as nx
+
+import dot_reader
+import merge
+import pruner.predicates
+import ref_index
+import utils
+from cpg import CPG, CPGTemplate
+from label_index import LabelIndex
+from pruner.rules import compile_predicates
+
+logger = logging.getLogger(__name__)
+
+
+def synthetic_export(output_file, methods=200, statements=50, seed=0, filenames=None):
+    """
+    Write a Joern-like `all/export.dot` so benchmarks can run without Joern.
+
+    Every method gets a METHOD / BLOCK / METHOD_RETURN skeleton, `statements`
+    CALL nodes with IDENTIFIER and LITERAL arguments, a CFG chain with a few
+    branches and REACHING_DEF edges between statements. TYPE, NAMESPACE_BLOCK
+    and META_DATA nodes are sprinkled in as Joern does for C++ files.
+
+    With `filenames`, the methods are spread over these files as in a project
+    of several files: each file gets its own NAMESPACE_BLOCK and the FILENAME
+    of its methods, the TYPE nodes are shared.
+    """
+    rng = random.Random(seed)
+    next_id = iter(range(1000, 1 << 62))
+
+    def node(label, **props):
+        node_id = next(next_id)
+        props = " ".join(
+            f"{k}={v}" if isinstance(v, int) else f'{k}="{v}"' for k, v in props.items()
+        )
+        fp.write(f"  {node_id} [label={label} {props}]\n")
+        return node_id
+
+    def edge(u, v, label, prop=None):
+        prop = f' property="{prop}"' if prop is not None else ""
+        edges.append(f"  {u} -> {v} [label={label}{prop}]\n")
+
+    with open(output_file, "w", encoding="utf-8") as fp:
+        fp.write("digraph {\n")
+        edges = []
+        node("META_DATA", LANGUAGE="NEWC", VERSION="0.1")
+        if filenames:
+            namespaces = [
+                node(
+                    "NAMESPACE_BLOCK",
+                    FULL_NAME=f"{filename}:<global>",
+                    NAME="<global>",
+                    FILENAME=filename,
+                )
+                for filename in filenames
+            ]
+        else:
+            namespaces = [
+                node("NAMESPACE_BLOCK", FULL_NAME="<global>", NAME="<global>")
+            ]
+        types = [node("TYPE", FULL_NAME=t, NAME=t) for t in ("int", "char", "ANY")]
+        for i in range(methods):
+            line = i * (statements + 2) + 1
+            implicit = i % 10 == 9
+            name = f"<operator>.op{i}" if implicit else f"f{i}"
+            props = {"FULL_NAME": name, "NAME": name, "CODE": f"int {name}() {{\n}}"}
+            if not implicit:
+                props["LINE_NUMBER"] = line
+            namespace = namespaces[i % len(namespaces)]
+            if filenames:
+                props["FILENAME"] = filenames[i % len(filenames)]
+            method = node("METHOD", **props)
+            edge(namespace, method, "AST")
+            block = node("BLOCK", CODE="<empty>", LINE_NUMBER=line)
+            ret = node("METHOD_RETURN", CODE="RET", EVALUATION_STRATEGY="BY_VALUE")
+            edge(method, block, "AST")
+            edge(method, ret, "AST")
+            edge(ret, rng.choice(types), "EVAL_TYPE")
+            previous = method
+            calls = []
+            for j in range(statements):
+                var = f"x{rng.randrange(8)}"
+                call = node(
+                    "CALL",
+                    CODE=f"{var} = {j}",
+                    NAME="<operator>.assignment",
+                    METHOD_FULL_NAME="<operator>.assignment",
+                    LINE_NUMBER=line + j + 1,
+                )
+                ident = node("IDENTIFIER", CODE=var, NAME=var, LINE_NUMBER=line + j + 1)
+                literal = node("LITERAL", CODE=str(j), LINE_NUMBER=line + j + 1)
+                edge(block, call, "AST")
+                edge(call, ident, "AST")
+                edge(call, literal, "AST")
+                edge(call, ident, "ARGUMENT")
+                edge(call, literal, "ARGUMENT")
+                edge(ident, rng.choice(types), "EVAL_TYPE")
+                edge(method, call, "CONTAINS")
+                edge(ident, literal, "CFG")
+                edge(literal, call, "CFG")
+                edge(previous, ident, "CFG")
+                if calls and rng.random() < 0.1:
+                    edge(rng.choice(calls), ident, "CFG")
+                    edge(rng.choice(calls), call, "CDG")
+                for source in rng.sample(calls, min(2, len(calls))):
+                    edge(source, call, "REACHING_DEF", var)
+                edge(method, ident, "REACHING_DEF", "")
+                previous = call
+                calls.append(call)
+            edge(previous, ret, "CFG")
+            edge(previous, ret, "REACHING_DEF", "&lt;RET&gt;")
+        fp.writelines(edges)
+        fp.write("}\n")
+
+
+def _measure(func, *args):
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return elapsed, rss_before, rss_after, str(result)
+
+
+def run_isolated(func, *args):
+    """
+    Run `func(*args)` in a fresh interpreter so peak RSS is not polluted by
+    previous runs. Returns (wall time in s, peak RSS in MiB, peak RSS growth
+    during the call in MiB, str of the result).
+    """
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        elapsed, rss_before, rss_after, result = pool.apply(_measure, (func, *args))
+    # ru_maxrss is in KiB on Linux
+    return elapsed, rss_after / 1024, (rss_after - rss_before) / 1024, result
+
+
+def report(title, rows):
+    print(f"\n{title}")
+    print(
+        f"{'variant':<28}{'wall (s)':>10}{'peak RSS (MiB)':>16}{'growth':>10}  result"
+    )
+    for name, (elapsed, rss, growth, result) in rows.items():
+        print(f"{name:<28}{elapsed:>10.3f}{rss:>16.1f}{growth:>10.1f}  {result}")
+
+
+def bench_read(args):
+    import networkx.drawing.nx_agraph
+
+    rows = {
+        "nx_agraph.read_dot": run_isolated(
+            networkx.drawing.nx_agraph.read_dot, args.input_file
+        ),
+        "dot_reader.read_dot": run_isolated(dot_reader.read_dot, args.input_file),
+    }
+    report(f"Reading {args.input_file}", rows)
+
+
+V2_TEMPLATE = CPGTemplate(
+    (CPG.METHOD_ + CPG.AST + CPG.CALLGRAPH_CALL_ + CPG.PDG_DDG_).node_labels,
+    (CPG.METHOD_ + CPG.CALLGRAPH_CALL_ + CPG.PDG_DDG_).edge_labels,
+)
+
+
+def _read_then_filter(file_path, template):
+    graph = dot_reader.read_dot(file_path)
+    return utils.filter_graph(graph, template)
+
+
+def bench_filter(args):
+    rows = {
+        "read, then filter": run_isolated(
+            _read_then_filter, args.input_file, V2_TEMPLATE
+        ),
+        "filter while parsing": run_isolated(
+            utils.read_dot_file, args.input_file, V2_TEMPLATE
+        ),
+    }
+    report(f"Loading {args.input_file} with the v2.py filter", rows)
+
+
+def _filter_loops(graph, node_labels, edge_labels):
+    # the comprehensions of utils.filter_graph, as run by v2.py and filter.py
+    nodes = [
+        node
+        for node, data in graph.nodes(data=True)
+        if data.get("label") not in node_labels
+    ]
+    edges = [
+        (u, v, k)
+        for u, v, k, data in graph.edges(keys=True, data=True)
+        if data.get("label") not in edge_labels
+    ]
+    return nodes, edges
+
+
+def bench_labels(args):
+    import filter as filter_script
+
+    graph = dot_reader.read_dot(args.input_file)
+    templates = {
+        "v2.py": V2_TEMPLATE,
+        "filter.py": CPGTemplate(
+            filter_script.node_filter.node_labels,
+            filter_script.edge_filter.edge_labels,
+        ),
+    }
+    print(f"\nLabel filter loops over {graph}")
+    print(f"{'template':<12}{'labels':<12}{'best of 5 (s)':>16}")
+    for name, template in templates.items():
+        variants = {
+            "list": (sorted(template.node_labels), sorted(template.edge_labels)),
+            "frozenset": (template.node_labels, template.edge_labels),
+        }
+        for kind, (node_labels, edge_labels) in variants.items():
+            elapsed = min(
+                timeit.repeat(
+                    lambda node_labels=node_labels, edge_labels=edge_labels: (
+                        _filter_loops(graph, node_labels, edge_labels)
+                    ),
+                    number=1,
+                    repeat=5,
+                )
+            )
+            print(f"{name:<12}{kind:<12}{elapsed:>16.4f}")
+
+
+def _with_includes(graph, size):
+    """
+    Return `graph`, grafting an `<includes>:<global>` METHOD with an AST
+    subtree of `size` nodes if it has none, with a CFG edge from the subtree
+    into the program as Joern's export has.
+    """
+    if any(
+        data.get("FULL_NAME") == "<includes>:<global>"
+        for _, data in graph.nodes(data=True)
+    ):
+        return graph
+    program = next(
+        (node for node, label in graph.nodes(data="label") if label == "METHOD"),
+        None,
+    )
+    root = "includes"
+    graph.add_node(root, label="METHOD", FULL_NAME="<includes>:<global>")
+    parent = root
+    for i in range(size):
+        node = f"includes-{i}"
+        graph.add_node(node, label="CALL" if i % 2 else "BLOCK")
+        graph.add_edge(parent, node, label="AST")
+        parent = node if i % 5 == 0 else parent
+    if program is not None:
+        graph.add_edge(parent, program, label="CFG")
+    return graph
+
+
+def bench_includes(args):
+    from pruner.langs.cpp import remove_global_import
+
+    graph = _with_includes(dot_reader.read_dot(args.input_file), args.statements)
+    print(f"\n<includes>:<global> removal over {graph}")
+    print(f"{'lookup':<12}{'best of 5 (s)':>16}  removed")
+    for name, use_index in (("scan", False), ("index", True)):
+        timings = []
+        for _ in range(5):
+            copy = graph.copy()
+            copy_index = LabelIndex(copy) if use_index else None
+            start = time.perf_counter()
+            remove_global_import(copy, index=copy_index)
+            timings.append(time.perf_counter() - start)
+        removed = len(graph) - len(copy)
+        print(f"{name:<12}{min(timings):>16.4f}  {removed} nodes")
+
+
+def _callback_loops(graph, node_predicates, edge_predicates):
+    # the loops of GraphPruner before predicates were compiled
+    edges = [
+        (u, v, k)
+        for u, v, k, data in graph.edges(keys=True, data=True)
+        if any(predicate((u, v, k), data, graph) for predicate in edge_predicates)
+    ]
+    nodes = [
+        node
+        for node, data in graph.nodes(data=True)
+        if any(predicate(node, data, graph) for predicate in node_predicates)
+    ]
+    return nodes, edges
+
+
+def _compiled_loops(graph, node_predicates, edge_predicates, index=None):
+    # the passes of GraphPruner._prune_edges / _prune_nodes
+    edges = compile_predicates(edge_predicates).select_edges(graph, index)
+    nodes = compile_predicates(node_predicates).select_nodes(graph, index)
+    return nodes, edges
+
+
+def bench_prune(args):
+    nodes = pruner.predicates.nodes
+    edges = pruner.predicates.edges
+    predicate_sets = {
+        "v2.py": (
+            [nodes.is_method_implicitly_defined],
+            [edges.null_ddg, edges.cdg],
+        ),
+        "filter.py": (
+            [nodes.is_method_implicitly_defined, nodes.operator_fieldaccess],
+            [edges.null_ddg, edges.cdg],
+        ),
+        "declarative only": (
+            [nodes.is_ast_leaf, nodes.operator_fieldaccess],
+            [edges.null_ddg, edges.cdg],
+        ),
+    }
+    graph = utils.read_dot_file(args.input_file, V2_TEMPLATE)
+    index = LabelIndex(graph)
+    print(f"\nPredicate passes over {graph}")
+    print(f"{'predicates':<20}{'loop':<12}{'best of 5 (s)':>16}  removed")
+    for name, (node_predicates, edge_predicates) in predicate_sets.items():
+        for kind, loops in (
+            ("callbacks", _callback_loops),
+            ("compiled", _compiled_loops),
+            ("indexed", functools.partial(_compiled_loops, index=index)),
+        ):
+            elapsed = min(
+                timeit.repeat(
+                    lambda loops=loops, nodes=node_predicates, edges=edge_predicates: (
+                        loops(graph, nodes, edges)
+                    ),
+                    number=1,
+                    repeat=5,
+                )
+            )
+            removed = loops(graph, node_predicates, edge_predicates)
+            counts = f"{len(removed[0])} nodes, {len(removed[1])} edges"
+            print(f"{name:<20}{kind:<12}{elapsed:>16.4f}  {counts}")
+
+
+def method_exports(input_file, output_dir):
+    """
+    Split an `all` export into one .dot file per method, each holding the
+    nodes of the method's AST, like Joern's per-method `--repr` exports.
+    Returns the paths of the files.
+    """
+    graph = dot_reader.read_dot(input_file)
+    methods = [node for node, label in graph.nodes(data="label") if label == "METHOD"]
+    parts = {
+        i: utils.reachable_from(graph, [method], {"AST"})
+        for i, method in enumerate(methods)
+    }
+    output_files = {i: os.path.join(output_dir, f"{i}-cfg.dot") for i in parts}
+    dot_reader.split_dot(input_file, parts, output_files)
+    return list(output_files.values())
+
+
+def isolated_method_exports(input_file, output_dir):
+    """
+    `method_exports` in a fresh interpreter: peak RSS survives the exec of
+    the processes started by `run_isolated`, so the export must not be
+    loaded here.
+    """
+    run_isolated(method_exports, input_file, output_dir)
+    count = len(os.listdir(output_dir))
+    return [os.path.join(output_dir, f"{i}-cfg.dot") for i in range(count)]
+
+
+def bench_methods(args):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if os.path.isdir(args.input_file):
+            file_paths = sorted(
+                os.path.join(args.input_file, name)
+                for name in os.listdir(args.input_file)
+                if name.endswith(".dot")
+            )
+        else:
+            file_paths = method_exports(args.input_file, tmp_dir)
+        print(f"\nReading {len(file_paths)} per-method .dot files")
+        print(f"{'jobs':<12}{'best of 3 (s)':>16}  result")
+        expected = None
+        for jobs in sorted({1, 2, os.cpu_count() or 1}):
+            elapsed = min(
+                timeit.repeat(
+                    lambda jobs=jobs: utils.read_dot_files(file_paths, jobs=jobs),
+                    number=1,
+                    repeat=3,
+                )
+            )
+            graphs = utils.read_dot_files(file_paths, jobs=jobs)
+            result = [
+                (list(g.nodes(data=True)), list(g.edges(data=True))) for g in graphs
+            ]
+            if expected is None:
+                expected = result
+            same = "same graphs, same order" if result == expected else "DIFFERENT"
+            print(f"{jobs:<12}{elapsed:>16.4f}  {same}")
+
+
+def _merge_via_digraphs(input_graphs):
+    # merge.merge_graphs before the single-pass merge
+    ast_graph = nx.DiGraph()
+    for graph in input_graphs["ast"]:
+        ast_graph.update(graph)
+    cfg_graph = nx.DiGraph()
+    for graph in input_graphs["cfg"]:
+        cfg_graph.update(graph)
+    pdg_graph = nx.MultiDiGraph()
+    for graph in input_graphs["pdg"]:
+        pdg_graph.update(graph)
+    merged_graph = nx.MultiDiGraph()
+    merged_graph.update(ast_graph)
+    merged_graph.update(cfg_graph)
+    merged_graph.update(pdg_graph)
+    return merged_graph
+
+
+def _load_then_merge(merge_func, file_paths):
+    # every file serves as AST, CFG and PDG input, as merge.py --ast/--cfg/--pdg
+    input_graphs = merge.add_edge_label(
+        merge.read_dot_files(file_paths, file_paths, file_paths)
+    )
+    start = time.perf_counter()
+    merged_graph = merge_func(input_graphs)
+    return f"{merged_graph}, merged in {time.perf_counter() - start:.3f} s"
+
+
+def bench_merge(args):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_paths = isolated_method_exports(args.input_file, tmp_dir)
+        rows = {
+            "DiGraph unions": run_isolated(
+                _load_then_merge, _merge_via_digraphs, file_paths
+            ),
+            "single pass": run_isolated(
+                _load_then_merge, merge.merge_graphs, file_paths
+            ),
+        }
+        report(f"Merging {len(file_paths)} per-method .dot files", rows)
+
+
+def _merge_with_reference(reference, file_paths, index_path=None):
+    # merge.py --cfg <file_paths> --ref <reference>, up to the pruning
+    merged_graph = merge.merge_graphs(
+        merge.add_edge_label(merge.read_dot_files(None, file_paths, None))
+    )
+    if index_path is None:
+        # before the reference index: load the whole export
+        ref_graph = utils.read_dot_file(reference)
+        for node in merged_graph.nodes():
+            if node in ref_graph.nodes:
+                merged_graph.nodes[node].update(ref_graph.nodes[node])
+        for u, v, k, data in ref_graph.edges(keys=True, data=True):
+            if (
+                data["label"] == "CALL"
+                and merged_graph.has_node(u)
+                and merged_graph.has_node(v)
+            ):
+                merged_graph.add_edge(u, v, **data)
+    else:
+        with ref_index.open_index(reference, index_path) as index:
+            merge.copy_node_data(merged_graph, index)
+            merge.add_call_edges(merged_graph, index)
+    return merged_graph
+
+
+def bench_ref(args):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        method_dir = os.path.join(tmp_dir, "methods")
+        os.mkdir(method_dir)
+        file_paths = isolated_method_exports(args.input_file, method_dir)[:50]
+        index_path = os.path.join(tmp_dir, "export.dot.refidx")
+        rows = {
+            "load the reference": run_isolated(
+                _merge_with_reference, args.input_file, file_paths
+            ),
+            "build the index": run_isolated(
+                _merge_with_reference, args.input_file, file_paths, index_path
+            ),
+            "reuse the index": run_isolated(
+                _merge_with_reference, args.input_file, file_paths, index_path
+            ),
+        }
+        report(f"Merging {len(file_paths)} methods against {args.input_file}", rows)
+
+
+def main():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument(
+        "input_file",
+        help="Path to a Joern all/export.dot (for 'methods', also a directory of "
+        "per-method .dot files). A synthetic export is generated if omitted.",
+        nargs="?",
+    )
+    common.add_argument(
+        "--methods", type=int, default=200, help="Methods in the synthetic export"
+    )
+    common.add_argument(
+        "--statements",
+        type=int,
+        default=50,
+        help="Statements per method in the synthetic export",
+    )
+    common.add_argument(
+        "-v", "--verbose", action="store_true", help="Enable verbose output"
+    )
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark the graph processing pipeline."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser(
+        "read", parents=[common], help="DOT reading: pygraphviz vs streaming reader"
+    ).set_defaults(func=bench_read)
+    subparsers.add_parser(
+        "filter", parents=[common], help="v2.py label filter: after vs while parsing"
+    ).set_defaults(func=bench_filter)
+    subparsers.add_parser(
+        "labels", parents=[common], help="label filter loops: list vs frozenset"
+    ).set_defaults(func=bench_labels)
+    subparsers.add_parser(
+        "prune",
+        parents=[common],
+        help="GraphPruner: callback loop vs compiled vs indexed pass",
+    ).set_defaults(func=bench_prune)
+    subparsers.add_parser(
+        "includes",
+        parents=[common],
+        help="cpp <includes>:<global> removal: subtree size and time",
+    ).set_defaults(func=bench_includes)
+    subparsers.add_parser(
+        "methods",
+        parents=[common],
+        help="per-method .dot files: sequential vs parallel loading",
+    ).set_defaults(func=bench_methods)
+    subparsers.add_parser(
+        "merge",
+        parents=[common],
+        help="merge.py graph union: DiGraph copies vs single pass",
+    ).set_defaults(func=bench_merge)
+    subparsers.add_parser(
+        "ref",
+        parents=[common],
+        help="merge.py reference lookups: full export vs persisted index",
+    ).set_defaults(func=bench_ref)
+
+    args = parser.parse_args()
+    utils.setup_logging(args.verbose)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.input_file is None:
+            args.input_file = os.path.join(tmp_dir, "export.dot")
+            synthetic_export(args.input_file, args.methods, args.statements)
+            size = os.path.getsize(args.input_file) / (1 << 20)
+            logger.info(f"Generated {args.input_file} ({size:.1f} MiB)")
+        args.func(args)
+
+
+if __name__ == "__main__":
+    main()
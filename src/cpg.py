@@ -1,18 +1,37 @@
+import sys
 from dataclasses import dataclass, field
 
 
 @dataclass(frozen=True)
 class CPGTemplate:
-    node_labels: list = field(default_factory=list)
-    edge_labels: list = field(default_factory=list)
+    """
+    Node and edge labels of one or more CPG layers.
+
+    Labels are stored as frozensets, so `label in template.node_labels` is a
+    hash lookup and adding templates drops duplicates. Labels are interned, as
+    are the ones read by `dot_reader`, so the lookup usually ends with an
+    identity check instead of a string comparison.
+    """
+
+    node_labels: frozenset[str] = field(default_factory=frozenset)
+    edge_labels: frozenset[str] = field(default_factory=frozenset)
+
+    def __post_init__(self):
+        # frozen dataclass, so bypass __setattr__ to normalize the inputs
+        object.__setattr__(
+            self, "node_labels", frozenset(map(sys.intern, self.node_labels))
+        )
+        object.__setattr__(
+            self, "edge_labels", frozenset(map(sys.intern, self.edge_labels))
+        )
 
     def __add__(self, other):
         if not isinstance(other, self.__class__):
             return NotImplemented
 
-        # Concatenate the lists of node and edge labels
-        new_node_labels = self.node_labels + other.node_labels
-        new_edge_labels = self.edge_labels + other.edge_labels
+        # Union of the node and edge labels
+        new_node_labels = self.node_labels | other.node_labels
+        new_edge_labels = self.edge_labels | other.edge_labels
         return self.__class__(new_node_labels, new_edge_labels)
 
 
@@ -0,0 +1,335 @@
+"""
+Streaming reader for the DOT dialect emitted by Joern.
+
+`networkx.drawing.nx_agraph.read_dot` parses the whole file into a libcgraph
+AGraph and then copies every node and edge into NetworkX, so the graph lives
+in memory twice. Joern only emits a tiny subset of DOT (one statement per
+line, no subgraphs, no ports), which we can tokenize with a handful of regexes
+and feed straight into a `MultiDiGraph`.
+
+The result matches `read_dot` for this subset: node ids and attribute values
+are strings, quoted strings are unescaped the way graphviz does it, HTML-like
+labels lose their outer `<>` and attributes equal to their default (`""`
+unless declared otherwise) are dropped. Two differences remain: successors
+are ordered as they appear in the file rather than by node creation, and
+`graph.graph["node"]` / `["edge"]` only hold explicitly declared defaults.
+Anything outside the subset raises `DotSyntaxError`, so callers can fall back
+to pygraphviz.
+"""
+
+import contextlib
+import re
+import sys
+from collections.abc import Iterator
+
+import networkx as nx
+
+from cpg import CPGTemplate
+
+__all__ = [
+    "DotSyntaxError",
+    "iter_dot",
+    "read_dot",
+    "split_dot",
+]
+
+CHUNK_SIZE = 1 << 20
+# A statement still incomplete after this many characters is not something
+# Joern emits (e.g. an unterminated string), give up instead of reading on.
+MAX_STATEMENT_SIZE = 16 * CHUNK_SIZE
+
+# A DOT identifier: quoted string, HTML-like string (3 levels of nesting are
+# enough for Joern's `<(METHOD,main)<SUB>1</SUB>>`), alphanumeric or numeral.
+# Graphviz only treats `\"` and `\<newline>` as escapes, any other backslash
+# is literal, hence the possessive loop.
+_ID = (
+    r'"(?:[^"\\]+|\\["\n]?)*+"'
+    r"|<(?:[^<>]+|<(?:[^<>]+|<[^<>]*+>)*+>)*+>"
+    r"|[^\W\d]\w*"
+    r"|-?(?:\.\d+|\d+(?:\.\d*)?)"
+)
+_ATTRS = rf"(?:(?:{_ID})\s*=\s*(?:{_ID})\s*[,;]?\s*)*+"
+_END = r"[ \t]*;?[ \t]*(?:\n|\Z)"
+
+_ATTR_RE = re.compile(rf"({_ID})\s*=\s*({_ID})")
+_LABEL_RE = re.compile(rf"label\s*=\s*({_ID})")
+_STMT_RE = re.compile(
+    rf"""\s*(?:
+        (?P<src>{_ID})\s*->\s*(?P<dst>{_ID})\s*(?:\[\s*(?P<edge_attrs>{_ATTRS})\])?
+      | (?P<kind>graph|node|edge)\s*\[\s*(?P<kind_attrs>{_ATTRS})\]
+      | (?P<node>{_ID})\s*(?:\[\s*(?P<node_attrs>{_ATTRS})\])?
+      | (?P<key>{_ID})\s*=\s*(?P<value>{_ID})
+      | (?P<close>\}})
+      | (?P<strict>strict\s+)?(?P<digraph>digraph|graph)\s*(?P<name>{_ID})?\s*\{{
+    ){_END}""",
+    re.VERBOSE,
+)
+
+
+class DotSyntaxError(ValueError):
+    """Raised when the input leaves the DOT subset handled by this module."""
+
+
+def _unquote(token: str) -> str:
+    if token[0] == '"':
+        token = token[1:-1]
+        if "\\" in token:
+            token = token.replace("\\\n", "").replace('\\"', '"')
+    elif token[0] == "<":
+        token = token[1:-1]
+    return token
+
+
+def _parse_attrs(text, defaults: dict) -> dict:
+    # Keys and labels repeat on every node, share one string object for each
+    # instead of keeping a copy per node.
+    attrs = {}
+    if text:
+        for key, value in _ATTR_RE.findall(text):
+            key = sys.intern(_unquote(key))
+            value = _unquote(value)
+            if key == "label":
+                value = sys.intern(value)
+            if value != defaults.get(key, ""):
+                attrs[key] = value
+    return attrs
+
+
+def _find_label(text, defaults: dict):
+    """Return the `label` attribute of an attribute list without parsing it all."""
+    if not text:
+        return None
+    # Joern writes the label first
+    match = _LABEL_RE.match(text)
+    if match is not None:
+        value = _unquote(match[1])
+    else:
+        for key, value in _ATTR_RE.findall(text):
+            if _unquote(key) == "label":
+                value = _unquote(value)
+                break
+        else:
+            return None
+    return sys.intern(value) if value != defaults.get("label", "") else None
+
+
+def _read_statements(fp) -> Iterator[re.Match]:
+    """
+    Yield one regex match per DOT statement.
+
+    The file is read in chunks cut after the last newline, so a statement can
+    only be incomplete when a quoted string spans lines; in that case the
+    statement regex does not match and we read more before trying again.
+    """
+    buffer = ""
+    tail = ""
+    pos = 0
+    eof = False
+    while True:
+        match = _STMT_RE.match(buffer, pos)
+        if match is not None:
+            pos = match.end()
+            yield match
+            continue
+
+        buffer = buffer[pos:]
+        pos = 0
+        if eof:
+            if buffer and not buffer.isspace():
+                snippet = buffer.strip().splitlines()[0][:80]
+                raise DotSyntaxError(f"Unsupported DOT statement: {snippet!r}")
+            return
+        if len(buffer) > MAX_STATEMENT_SIZE:
+            snippet = buffer.strip().splitlines()[0][:80]
+            raise DotSyntaxError(f"Unterminated DOT statement: {snippet!r}")
+
+        chunk = fp.read(CHUNK_SIZE)
+        if not chunk:
+            eof = True
+            buffer += tail
+            continue
+        chunk = tail + chunk
+        cut = chunk.rfind("\n") + 1
+        buffer += chunk[:cut]
+        tail = chunk[cut:]
+
+
+def iter_dot(file_path, template: CPGTemplate | None = None) -> Iterator[tuple]:
+    """
+    Parse a DOT file statement by statement.
+
+    With a `template`, edges whose label is not in `template.edge_labels` are
+    skipped and nodes whose label is not in `template.node_labels` are reported
+    as dropped, in both cases before their remaining attributes are parsed.
+
+    Yields:
+        ("graph", name, attrs) for the graph header, `graph [...]` and
+        `key = value` statements,
+        ("default", kind, attrs) for `node [...]` and `edge [...]` statements,
+        ("node", node, attrs) for node statements,
+        ("dropped", node) for node statements filtered out by `template` and
+        ("edge", u, v, key, attrs) for edge statements, `key` being None
+        unless the edge carries a `key` attribute.
+    """
+    node_defaults = {}
+    edge_defaults = {}
+    opened = False
+    if template is not None:
+        node_labels = template.node_labels
+        edge_labels = template.edge_labels
+
+    with open(file_path, "r", encoding="utf-8") as fp:
+        for match in _read_statements(fp):
+            src = match["src"]
+            if src is not None:
+                text = match["edge_attrs"]
+                if (
+                    template is not None
+                    and _find_label(text, edge_defaults) not in edge_labels
+                ):
+                    continue
+                attrs = _parse_attrs(text, edge_defaults)
+                key = attrs.pop("key", None)
+                yield ("edge", _unquote(src), _unquote(match["dst"]), key, attrs)
+                continue
+
+            node = match["node"]
+            if node is not None:
+                text = match["node_attrs"]
+                if (
+                    template is not None
+                    and _find_label(text, node_defaults) not in node_labels
+                ):
+                    yield ("dropped", _unquote(node))
+                    continue
+                yield ("node", _unquote(node), _parse_attrs(text, node_defaults))
+                continue
+
+            kind = match["kind"]
+            if kind == "graph":
+                yield ("graph", None, _parse_attrs(match["kind_attrs"], {}))
+            elif kind is not None:
+                attrs = _parse_attrs(match["kind_attrs"], {})
+                (node_defaults if kind == "node" else edge_defaults).update(attrs)
+                yield ("default", kind, attrs)
+            elif match["key"] is not None:
+                attrs = {_unquote(match["key"]): _unquote(match["value"])}
+                yield ("graph", None, attrs)
+            elif match["digraph"] is not None:
+                if opened or match["strict"] or match["digraph"] != "digraph":
+                    raise DotSyntaxError(
+                        f"Only a single non-strict digraph is supported: {file_path}"
+                    )
+                opened = True
+                name = match["name"]
+                yield ("graph", _unquote(name) if name else None, {})
+            else:
+                if not opened:
+                    raise DotSyntaxError(f"Unbalanced '}}' in {file_path}")
+                opened = False
+
+
+def read_dot(file_path, template: CPGTemplate | None = None) -> nx.MultiDiGraph:
+    """
+    Read a Joern DOT export into a `MultiDiGraph` without going through pygraphviz.
+
+    With a `template`, nodes and edges whose label is not in the template are
+    discarded while parsing. The only exception are dropped nodes on a CFG
+    path when CFG edges are kept: they are added without attributes together
+    with their CFG edges, so that `utils.filter_graph` can splice the CFG
+    around them exactly as it does for a fully loaded graph.
+
+    Args:
+        file_path (str): Path to the .dot file
+        template (CPGTemplate): Node and edge labels to keep, None keeps all
+
+    Returns:
+        networkx.MultiDiGraph: The parsed graph
+    """
+    graph = nx.MultiDiGraph()
+    defaults = {"graph": {}, "node": {}, "edge": {}}
+    add_node = graph.add_node
+    add_edge = graph.add_edge
+    dropped = set()
+    cfg_edges = []
+
+    for event in iter_dot(file_path, template):
+        kind = event[0]
+        if kind == "edge":
+            _, u, v, key, attrs = event
+            if dropped and (u in dropped or v in dropped):
+                if attrs.get("label") == "CFG":
+                    cfg_edges.append(event)
+                continue
+            add_edge(u, v, key, **attrs)
+        elif kind == "node":
+            add_node(event[1], **event[2])
+        elif kind == "dropped":
+            # a node first seen as an edge endpoint is already in the graph,
+            # leave it there without attributes so it gets filtered later
+            if event[1] not in graph:
+                dropped.add(event[1])
+        elif kind == "default":
+            defaults[event[1]].update(event[2])
+        else:
+            _, name, attrs = event
+            if name:
+                graph.name = name
+            graph.graph.update(attrs)
+            defaults["graph"].update(attrs)
+
+    for _, u, v, key, attrs in cfg_edges:
+        add_edge(u, v, key, **attrs)
+
+    graph.graph.update(defaults)
+    return graph
+
+
+def split_dot(file_path, parts: dict, output_files: dict, rewrite=None):
+    """
+    Copy the statements of a DOT file into several files, verbatim.
+
+    Node statements go to the parts holding the node, edge statements to the
+    parts holding both endpoints; everything else (header, defaults, closing
+    brace) goes to every part. Nodes outside all parts are dropped.
+
+    Args:
+        file_path (str): Path to the .dot file
+        parts (dict): Part key -> collection of node ids
+        output_files (dict): Part key -> path of the .dot file to write
+        rewrite (callable): Applied to the text of each node statement before
+            it is written, e.g. to rename attribute values
+    """
+    node_parts = {}
+    for key, nodes in parts.items():
+        for node in nodes:
+            node_parts.setdefault(node, []).append(key)
+
+    with contextlib.ExitStack() as stack:
+        outputs = {
+            key: stack.enter_context(open(output_files[key], "w", encoding="utf-8"))
+            for key in parts
+        }
+        everywhere = list(outputs.values())
+        with open(file_path, "r", encoding="utf-8") as fp:
+            for match in _read_statements(fp):
+                text = match[0]
+                src = match["src"]
+                if src is not None:
+                    dst_parts = node_parts.get(_unquote(match["dst"]), ())
+                    targets = [
+                        outputs[key]
+                        for key in node_parts.get(_unquote(src), ())
+                        if key in dst_parts
+                    ]
+                elif match["node"] is not None:
+                    targets = [
+                        outputs[key]
+                        for key in node_parts.get(_unquote(match["node"]), ())
+                    ]
+                    if targets and rewrite is not None:
+                        text = rewrite(text)
+                else:
+                    targets = everywhere
+                for output in targets:
+                    output.write(text)
@@ -24,6 +24,38 @@ edge_filter: CPGTemplate = (
 )
 
 
+def build_filtered(graph, fixed_point: bool = False):
+    """
+    Prune and decorate a graph loaded with `node_filter` / `edge_filter`,
+    in place.
+
+    Args:
+        graph (networkx.MultiDiGraph): The graph
+        fixed_point (bool): See `GraphPruner.prune`
+
+    Returns:
+        networkx.MultiDiGraph: The same graph
+    """
+    graph_pruner = pruner.GraphPruner(graph)
+    utils.replace_ddg_label(graph, graph_pruner.index)
+
+    graph_pruner.add_edge_predicate(pruner.predicates.edges.null_ddg)
+    graph_pruner.add_edge_predicate(pruner.predicates.edges.cdg)
+
+    # graph_pruner.add_node_predicate(pruner.predicates.nodes.ast_leaves)
+    graph_pruner.add_node_predicate(
+        pruner.predicates.nodes.is_method_implicitly_defined
+    )
+    graph_pruner.add_node_predicate(pruner.predicates.nodes.operator_fieldaccess)
+
+    graph_pruner.prune(fixed_point=fixed_point)
+    graph_pruner.remove_isolated_nodes()
+
+    # Render the graph as an SVG file
+    pretty_graph(graph, graph_pruner.index)
+    return graph
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Delete nodes and edges from a Graphviz .dot file."
@@ -41,6 +73,11 @@ def main():
         default="out/filtered.dot",
     )
 
+    parser.add_argument(
+        "--fixed-point",
+        action="store_true",
+        help="Prune until no predicate matches and no node is isolated",
+    )
     parser.add_argument(
         "-v", "--verbose", action="store_true", help="Enable verbose output"
     )
@@ -49,43 +86,11 @@ def main():
 
     utils.setup_logging(args.verbose)
 
-    graph = utils.read_dot_file(args.input_file)
-
-    # Delete nodes with specified labels (partial match)
-    nodes_to_remove = [
-        node
-        for node, data in graph.nodes(data=True)
-        if data.get("label") not in node_filter.node_labels
-    ]
-    logger.debug(f"Nodes to remove: {nodes_to_remove}")
-    utils.remove_nodes_from(graph, nodes_to_remove)
-
-    # Delete edges with specified labels, considering MultiDiGraph
-    edges_to_remove = [
-        (u, v, k)
-        for u, v, k, data in graph.edges(keys=True, data=True)
-        if data.get("label") not in edge_filter.edge_labels
-    ]
-    utils.remove_edges_from(graph, edges_to_remove)
-
-    utils.replace_ddg_label(graph)
-
-    graph_pruner = pruner.GraphPruner(graph)
-
-    graph_pruner.add_edge_predicate(pruner.predicates.edges.null_ddg)
-    graph_pruner.add_edge_predicate(pruner.predicates.edges.cdg)
-
-    # graph_pruner.add_node_predicate(pruner.predicates.nodes.ast_leaves)
-    graph_pruner.add_node_predicate(
-        pruner.predicates.nodes.is_method_implicitly_defined
+    graph = utils.read_dot_file(
+        args.input_file,
+        CPGTemplate(node_filter.node_labels, edge_filter.edge_labels),
     )
-    graph_pruner.add_node_predicate(pruner.predicates.nodes.operator_fieldaccess)
-
-    graph_pruner.prune()
-    graph_pruner.remove_isolated_nodes()
-
-    # Render the graph as an SVG file
-    pretty_graph(graph)
+    build_filtered(graph, fixed_point=args.fixed_point)
     utils.write_dot_file(graph, args.output_file)
 
 
@@ -6,6 +6,8 @@ import traceback
 import networkx as nx
 from networkx.drawing.nx_agraph import to_agraph
 
+from overlay import OverlayGraph
+
 
 def sanitize_node_id(node_id):
     """Sanitize node ID to ensure it is a valid DOT identifier"""
@@ -227,7 +229,8 @@ def process_graph(input_path, output_path):
         graph.remove_edges_from(other_edges)
 
         # STEP 4: export the graph with AST and simplified CDFG edges to a DOT file
-        graph_with_eog_pass = graph.copy()
+        # the overlay only records the rerouted EOG edges, `graph` is left as is for STEP 5
+        graph_with_eog_pass = OverlayGraph(graph)
         eog_pass(graph_with_eog_pass)
         remove_isolated_nodes(graph_with_eog_pass)
 
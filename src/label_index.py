@@ -0,0 +1,110 @@
+"""
+Label index over a CPG.
+
+Most passes only care about a handful of nodes or edges with a given label
+(METHOD nodes, REACHING_DEF edges, ...). `LabelIndex` maps each label to its
+nodes and edges so those passes can skip the rest of the graph.
+
+The index does not watch the graph: code mutating an indexed graph has to
+keep it in sync, either through the helpers taking an `index` argument
+(`utils.remove_nodes_from`, `utils.remove_edges_from`, ...) or through the
+methods below. Buckets keep insertion order, so passes iterating them stay
+deterministic.
+"""
+
+import networkx as nx
+
+__all__ = [
+    "LabelIndex",
+]
+
+
+class LabelIndex:
+    """
+    Node label -> nodes and edge label -> (u, v, key) index of a MultiDiGraph.
+
+    Unlabeled nodes and edges are indexed under None.
+    """
+
+    def __init__(self, graph: nx.MultiDiGraph):
+        self.graph = graph
+        self._nodes: dict[str | None, dict] = {}
+        self._edges: dict[str | None, dict] = {}
+        for node, data in graph.nodes(data=True):
+            self._nodes.setdefault(data.get("label"), {})[node] = None
+        for u, v, k, data in graph.edges(keys=True, data=True):
+            self._edges.setdefault(data.get("label"), {})[(u, v, k)] = None
+
+    def __repr__(self):
+        return (
+            f"LabelIndex with {len(self._nodes)} node labels "
+            f"and {len(self._edges)} edge labels"
+        )
+
+    def nodes(self, *labels) -> list:
+        """Return the nodes carrying one of `labels`."""
+        return [node for label in labels for node in self._nodes.get(label, ())]
+
+    def edges(self, *labels) -> list:
+        """Return the (u, v, key) edges carrying one of `labels`."""
+        return [edge for label in labels for edge in self._edges.get(label, ())]
+
+    def node_labels(self) -> list:
+        """Return the labels carried by at least one node."""
+        return [label for label, bucket in self._nodes.items() if bucket]
+
+    def edge_labels(self) -> list:
+        """Return the labels carried by at least one edge."""
+        return [label for label, bucket in self._edges.items() if bucket]
+
+    def add_nodes(self, nodes):
+        """Index nodes already added to the graph."""
+        graph_nodes = self.graph.nodes
+        for node in nodes:
+            label = graph_nodes[node].get("label")
+            self._nodes.setdefault(label, {})[node] = None
+
+    def add_edges(self, edges):
+        """Index (u, v, key) edges already added to the graph."""
+        succ = self.graph.succ
+        for u, v, k in edges:
+            label = succ[u][v][k].get("label")
+            self._edges.setdefault(label, {})[(u, v, k)] = None
+
+    def add_edges_from(self, ebunch):
+        """Add (u, v, data) edges to the graph and index them."""
+        ebunch = list(ebunch)
+        keys = self.graph.add_edges_from(ebunch)
+        self.add_edges((u, v, k) for (u, v, _), k in zip(ebunch, keys))
+
+    def discard_nodes(self, nodes):
+        """
+        Unindex nodes and their incident edges. Must be called before the
+        nodes are removed from the graph; nodes not in the graph are ignored.
+        """
+        graph = self.graph
+        for node in nodes:
+            if node not in graph:
+                continue
+            self._nodes.get(graph.nodes[node].get("label"), {}).pop(node, None)
+            self.discard_edges(graph.out_edges(node, keys=True))
+            self.discard_edges(graph.in_edges(node, keys=True))
+
+    def discard_edges(self, edges):
+        """
+        Unindex (u, v, key) edges. Must be called before the edges are removed
+        from the graph; edges not in the graph are ignored.
+        """
+        succ = self.graph.succ
+        for u, v, k in edges:
+            data = succ.get(u, {}).get(v, {}).get(k)
+            if data is not None:
+                self._edges.get(data.get("label"), {}).pop((u, v, k), None)
+
+    def relabel_edge(self, edge, label):
+        """Set the label of a (u, v, key) edge and move it to its new bucket."""
+        u, v, k = edge
+        data = self.graph.succ[u][v][k]
+        self._edges.get(data.get("label"), {}).pop(edge, None)
+        data["label"] = label
+        self._edges.setdefault(label, {})[edge] = None
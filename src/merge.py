@@ -7,13 +7,16 @@ import networkx as nx
 import pruner
 import pruner.langs
 import pruner.predicates
+import ref_index
 import utils
 import visualization
 
 logger = logging.getLogger(__name__)
 
 
-def read_dot_files(ast_files, cfg_files, pdg_files) -> dict[str, list[nx.Graph]]:
+def read_dot_files(
+    ast_files, cfg_files, pdg_files, jobs=1
+) -> dict[str, list[nx.Graph]]:
     """
     Read multiple .dot files and return a list of graphs.
 
@@ -21,18 +24,24 @@ def read_dot_files(ast_files, cfg_files, pdg_files) -> dict[str, list[nx.Graph]]
         ast_files (list): List of AST .dot file paths
         cfg_files (list): List of CFG .dot file paths
         pdg_files (list): List of PDG .dot file paths
+        jobs (int): Processes parsing the files, see `utils.read_dot_files`
 
     Returns:
         list: List of graphs read from the .dot files
     """
+    typed_files = [
+        (graph_type, file_path)
+        for graph_type, files in zip(
+            ["ast", "cfg", "pdg"], [ast_files, cfg_files, pdg_files]
+        )
+        for file_path in files or []
+    ]
+    graphs = utils.read_dot_files(
+        [file_path for _, file_path in typed_files], jobs=jobs
+    )
     input_graphs = defaultdict(list)
-    for graph_type, files in zip(
-        ["ast", "cfg", "pdg"], [ast_files, cfg_files, pdg_files]
-    ):
-        if files is not None:
-            for file_path in files:
-                graph = utils.read_dot_file(file_path)
-                input_graphs[graph_type].append(graph)
+    for (graph_type, _), graph in zip(typed_files, graphs):
+        input_graphs[graph_type].append(graph)
     return input_graphs
 
 
@@ -52,44 +61,127 @@ def add_edge_label(input_graphs):
 
 
 def merge_graphs(input_graphs):
-    ast_graph = nx.DiGraph()
-    for graph in input_graphs["ast"]:
-        ast_graph.update(graph)
-    cfg_graph = nx.DiGraph()
-    for graph in input_graphs["cfg"]:
-        cfg_graph.update(graph)
-    pdg_graph = nx.MultiDiGraph()
-    for graph in input_graphs["pdg"]:
-        pdg_graph.update(graph)
-    # Merge the graphs into a single graph
+    """
+    Merge the AST, CFG and PDG graphs into a single MultiDiGraph.
+
+    The edges of each graph type are gathered into a plain adjacency dict and
+    added to the result at once, without intermediate graphs. Within the AST
+    graphs, and within the CFG graphs, edges between the same pair of nodes
+    collapse into one whose attributes are updated by every duplicate, as a
+    union into a DiGraph would do; every PDG edge is kept. Edges are added in
+    the order such a union yields them: by source in order of first
+    appearance, then by target in order of the first edge between the two,
+    so successor and predecessor order match the union's. Node and graph
+    attributes are updated in the order of the inputs.
+    """
     merged_graph = nx.MultiDiGraph()
-    merged_graph.update(ast_graph)
-    merged_graph.update(cfg_graph)
-    merged_graph.update(pdg_graph)
+    for graph_type in ["ast", "cfg", "pdg"]:
+        collapse = graph_type != "pdg"
+        # u -> v -> [attributes, ...], one entry per merged edge
+        adjacency = {}
+        for graph in input_graphs[graph_type]:
+            merged_graph.add_nodes_from(graph.nodes(data=True))
+            for node in graph:
+                adjacency.setdefault(node, {})
+            for u, v, data in graph.edges(data=True):
+                parallel = adjacency.setdefault(u, {}).setdefault(v, [])
+                adjacency.setdefault(v, {})
+                if collapse and parallel:
+                    # never update the attributes of an input edge
+                    parallel[0] = {**parallel[0], **data}
+                else:
+                    parallel.append(data)
+            merged_graph.graph.update(graph.graph)
+        merged_graph.add_edges_from(
+            (u, v, data)
+            for u, successors in adjacency.items()
+            for v, parallel in successors.items()
+            for data in parallel
+        )
     return merged_graph
 
 
-def add_call_edges(merged_graph, ref_graph):
-    for u, v, k, data in ref_graph.edges(keys=True, data=True):
-        if data["label"] == "CALL":
-            # If method not explicitly implemented, the "artifact" node only presents in AST graph.
-            # If we not import AST graph, the call edge should be ignored.
-            if merged_graph.has_node(u) and merged_graph.has_node(v):
-                merged_graph.add_edge(u, v, **data)
+def add_call_edges(merged_graph, reference: ref_index.RefIndex):
+    for u, v, data in reference.call_edges():
+        # If method not explicitly implemented, the "artifact" node only presents in AST graph.
+        # If we not import AST graph, the call edge should be ignored.
+        if merged_graph.has_node(u) and merged_graph.has_node(v):
+            merged_graph.add_edge(u, v, **data)
 
     return merged_graph
 
 
-def copy_node_data(merged_graph, ref_graph):
-    for node in merged_graph.nodes():
-        if node in ref_graph.nodes.keys():
-            ref_data = ref_graph.nodes[node]
-            merged_graph.nodes[node].update(ref_data)
+def copy_node_data(merged_graph, reference: ref_index.RefIndex):
+    # a hash join: one index probe per merged node, the reference is never loaded
+    for node, data in merged_graph.nodes(data=True):
+        ref_data = reference.get(node)
+        if ref_data is not None:
+            data.update(ref_data)
         else:
             logger.warning(f"Node {node} not found in reference graph")
     return merged_graph
 
 
+def build_merged(
+    input_graphs, reference, lang=None, fixed_point: bool = False, raw: bool = False
+) -> nx.MultiDiGraph:
+    """
+    Merge per-representation graphs into one graph, then prune and decorate it.
+
+    Args:
+        input_graphs (dict): Graphs returned by `add_edge_label`, the AST
+            graphs being optional
+        reference (ref_index.RefIndex): Node attributes and CALL edges of the
+            export the graphs come from
+        lang (str): Language of the input files, enables language specific
+            pruning
+        fixed_point (bool): See `GraphPruner.prune`
+        raw (bool): Skip the pretty labels and colors
+
+    Returns:
+        networkx.MultiDiGraph: The merged graph
+    """
+    ast = bool(input_graphs["ast"])
+    merged_graph = merge_graphs(input_graphs)
+    merged_graph = copy_node_data(merged_graph, reference)
+    merged_graph = add_call_edges(merged_graph, reference)
+
+    graph_pruner = pruner.GraphPruner(merged_graph)
+
+    if lang == "py":
+        if not ast:
+            graph_pruner.add_prune_function(
+                pruner.langs.python.remove_artifact_nodes_without_ast
+            )
+        else:
+            graph_pruner.add_prune_function(
+                pruner.langs.python.remove_artifact_nodes_with_ast
+            )
+    elif lang == "cpp":
+        graph_pruner.add_prune_function(pruner.langs.cpp.remove_global_import)
+
+    graph_pruner.add_edge_predicate(pruner.predicates.edges.null_ddg)
+    graph_pruner.add_edge_predicate(pruner.predicates.edges.cdg)
+
+    # graph_pruner.add_node_predicate(pruner.predicates.nodes.ast_leaves)
+    graph_pruner.add_node_predicate(
+        pruner.predicates.nodes.is_method_implicitly_defined
+    )
+    graph_pruner.add_node_predicate(pruner.predicates.nodes.operator_fieldaccess)
+
+    graph_pruner.prune(fixed_point=fixed_point)
+    graph_pruner.remove_isolated_nodes()
+
+    if not ast:
+        utils.add_virtual_root(merged_graph, graph_pruner.index)
+
+    merged_graph.name = f"Merged {lang} Graph"
+
+    if not raw:
+        visualization.pretty_graph(merged_graph, graph_pruner.index)
+    return merged_graph
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Merge multiple Graphviz .dot files into a single graph."
@@ -98,12 +190,29 @@ def main():
     parser.add_argument("--cfg", nargs="+", help="Paths to the CFG .dot files")
     parser.add_argument("--pdg", nargs="+", help="Paths to the PDG .dot files")
     parser.add_argument("--ref", help="Path to the reference .dot file")
+    parser.add_argument(
+        "--ref-index",
+        help="Path to the reference index, built from --ref if missing or out "
+        "of date (default: <ref>.refidx)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Processes parsing the input files, 0 for one per CPU (default: 1)",
+    )
     parser.add_argument(
         "--lang", choices=["py", "java", "cpp"], help="Language of the input files"
     )
     parser.add_argument(
         "--raw", action="store_true", help="disable pretty label and colorization"
     )
+    parser.add_argument(
+        "--fixed-point",
+        action="store_true",
+        help="Prune until no predicate matches and no node is isolated",
+    )
     parser.add_argument(
         "-v", "--verbose", action="store_true", help="Enable verbose output"
     )
@@ -117,48 +226,20 @@ def main():
     args = parser.parse_args()
     utils.setup_logging(args.verbose)
 
-    input_graphs = read_dot_files(args.ast, args.cfg, args.pdg)
-    refer_graph: nx.Graph = utils.read_dot_file(args.ref)
+    input_graphs = read_dot_files(args.ast, args.cfg, args.pdg, args.jobs)
+    refer_index = ref_index.open_index(args.ref, args.ref_index)
 
     input_graphs = add_edge_label(input_graphs)
 
-    merged_graph = merge_graphs(input_graphs)
-    merged_graph = copy_node_data(merged_graph, refer_graph)
-    merged_graph = add_call_edges(merged_graph, refer_graph)
-
-    graph_pruner = pruner.GraphPruner(merged_graph)
-
-    if args.lang == "py":
-        if args.ast is None:
-            graph_pruner.add_prune_function(
-                pruner.langs.python.remove_artifact_nodes_without_ast
-            )
-        else:
-            graph_pruner.add_prune_function(
-                pruner.langs.python.remove_artifact_nodes_with_ast
-            )
-    elif args.lang == "cpp":
-        graph_pruner.add_prune_function(pruner.langs.cpp.remove_global_import)
-
-    graph_pruner.add_edge_predicate(pruner.predicates.edges.null_ddg)
-    graph_pruner.add_edge_predicate(pruner.predicates.edges.cdg)
-
-    # graph_pruner.add_node_predicate(pruner.predicates.nodes.ast_leaves)
-    graph_pruner.add_node_predicate(
-        pruner.predicates.nodes.is_method_implicitly_defined
+    merged_graph = build_merged(
+        input_graphs,
+        refer_index,
+        lang=args.lang,
+        fixed_point=args.fixed_point,
+        raw=args.raw,
     )
-    graph_pruner.add_node_predicate(pruner.predicates.nodes.operator_fieldaccess)
-
-    graph_pruner.prune()
-    graph_pruner.remove_isolated_nodes()
-
-    if not args.ast:
-        utils.add_virtual_root(merged_graph)
-
-    merged_graph.name = f"Merged {args.lang} Graph"
+    refer_index.close()
 
-    if not args.raw:
-        visualization.pretty_graph(merged_graph)
     utils.write_dot_file(merged_graph, f"{args.output}")
 
 
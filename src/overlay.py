@@ -0,0 +1,305 @@
+"""
+Copy-on-write variant of a MultiDiGraph.
+
+Deriving a variant of a graph with `graph.copy()` duplicates every node,
+every adjacency dict and every attribute dict, even when the variant only
+removes or reroutes some edges. `OverlayGraph` keeps a reference to the base
+graph and records the difference instead:
+
+    removed nodes       masked
+    added nodes         held with their attributes
+    changed adjacency   the neighbors of a node are copied the first time one
+                        of its edges is added or removed, sharing the
+                        attribute dicts of the edges; untouched nodes read the
+                        adjacency of the base
+
+Memory grows with the nodes whose edges change, not with the graph, and no
+attribute dict is copied unless it is updated.
+
+Only the part of the NetworkX API the variant passes use is implemented:
+iterating nodes, edges, in / out edges and degrees, adding and removing
+nodes and edges, the read-only adjacency mappings (`succ`, `pred`, `adj`)
+and what `nx.isolates` and `nx.nx_agraph.to_agraph` need.
+
+The base must not change while an overlay is in use. Attribute dicts of base
+nodes and edges are shared with the base and must not be modified through
+the overlay; `add_node` / `add_edge` with attributes copy them first.
+"""
+
+from collections.abc import Mapping
+
+import networkx as nx
+
+__all__ = [
+    "OverlayGraph",
+]
+
+
+class _Adjacency(Mapping):
+    """Read-only node -> neighbor -> key -> attributes mapping of an overlay."""
+
+    def __init__(self, overlay, forward: bool):
+        self._overlay = overlay
+        self._forward = forward
+
+    def __getitem__(self, node):
+        return self._overlay._neighbors(node, self._forward)
+
+    def __iter__(self):
+        return iter(self._overlay)
+
+    def __len__(self):
+        return len(self._overlay)
+
+
+class OverlayGraph:
+    """
+    Copy-on-write view of a MultiDiGraph, see the module docstring.
+
+    Nodes and edges come out in the order a copy of the base would yield
+    them after the same changes, except that a removed and re-added base
+    node keeps its place.
+    """
+
+    def __init__(self, base: nx.MultiDiGraph):
+        self.base = base
+        self.graph = dict(base.graph)
+        self._removed_nodes = set()
+        self._nodes = {}  # added, re-added or updated node -> attributes
+        self._out = {}  # copied successors, u -> v -> key -> attributes
+        self._in = {}  # copied predecessors, v -> u -> key -> attributes
+
+    def __repr__(self):
+        return (
+            f"OverlayGraph over {self.base}, {len(self._removed_nodes)} nodes "
+            f"removed, {len(self._nodes)} nodes added or updated, "
+            f"{len(self._out.keys() | self._in.keys())} adjacencies copied"
+        )
+
+    @property
+    def name(self):
+        return self.graph.get("name", "")
+
+    @name.setter
+    def name(self, name):
+        self.graph["name"] = name
+
+    def is_directed(self):
+        return True
+
+    def is_multigraph(self):
+        return True
+
+    # -- nodes ---------------------------------------------------------------
+
+    def __contains__(self, node):
+        try:
+            return node in self._nodes or (
+                node in self.base._node and node not in self._removed_nodes
+            )
+        except TypeError:
+            return False
+
+    def __iter__(self):
+        for node in self.base._node:
+            if node not in self._removed_nodes:
+                yield node
+        for node in self._nodes:
+            if node not in self.base._node:
+                yield node
+
+    def __len__(self):
+        return (
+            len(self.base._node)
+            - len(self._removed_nodes)
+            + sum(1 for node in self._nodes if node not in self.base._node)
+        )
+
+    def has_node(self, node):
+        return node in self
+
+    def number_of_nodes(self):
+        return len(self)
+
+    def _node_data(self, node):
+        return self._nodes[node] if node in self._nodes else self.base._node[node]
+
+    def nodes(self, data=False, default=None):
+        """Iterate nodes, or (node, data) pairs as `graph.nodes(data=...)`."""
+        for node in self:
+            if data is False:
+                yield node
+            elif data is True:
+                yield node, self._node_data(node)
+            else:
+                yield node, self._node_data(node).get(data, default)
+
+    def add_node(self, node, **attr):
+        if node not in self:
+            if node in self.base._node:
+                # a removed base node comes back without its old edges
+                self._removed_nodes.discard(node)
+                self._out[node] = {}
+                self._in[node] = {}
+            self._nodes[node] = {}
+        elif attr and node not in self._nodes:
+            self._nodes[node] = dict(self.base._node[node])
+        if attr:
+            self._nodes[node].update(attr)
+
+    def remove_node(self, node):
+        if node not in self:
+            raise nx.NetworkXError(f"The node {node} is not in the graph.")
+        for nbr in self._neighbors(node, forward=True):
+            if nbr != node:
+                del self._own(nbr, forward=False)[node]
+        for nbr in self._neighbors(node, forward=False):
+            if nbr != node:
+                del self._own(nbr, forward=True)[node]
+        self._out.pop(node, None)
+        self._in.pop(node, None)
+        self._nodes.pop(node, None)
+        if node in self.base._node:
+            self._removed_nodes.add(node)
+
+    def remove_nodes_from(self, nodes):
+        for node in nodes:
+            if node in self:
+                self.remove_node(node)
+
+    # -- edges ---------------------------------------------------------------
+
+    def _neighbors(self, node, forward: bool) -> dict:
+        """Neighbor -> key -> attributes of `node`, not to be modified."""
+        copied = self._out if forward else self._in
+        if node in copied:
+            return copied[node]
+        if node not in self:
+            raise KeyError(node)
+        return (self.base._succ if forward else self.base._pred).get(node, {})
+
+    def _own(self, node, forward: bool) -> dict:
+        """The adjacency of `node`, copied from the base on first use."""
+        copied = self._out if forward else self._in
+        adjacency = copied.get(node)
+        if adjacency is None:
+            adjacency = copied[node] = {
+                nbr: dict(keydict)
+                for nbr, keydict in self._neighbors(node, forward).items()
+            }
+        return adjacency
+
+    @property
+    def succ(self) -> Mapping:
+        return _Adjacency(self, forward=True)
+
+    @property
+    def pred(self) -> Mapping:
+        return _Adjacency(self, forward=False)
+
+    # `nx` functions such as `number_of_selfloops` read the private names
+    adj = _adj = _succ = succ
+    _pred = pred
+
+    def has_edge(self, u, v, key=None):
+        try:
+            keydict = self._neighbors(u, forward=True)[v]
+        except KeyError:
+            return False
+        return key is None or key in keydict
+
+    def _edges(self, nodes, forward, keys, data, default):
+        for node in nodes:
+            for nbr, keydict in self._neighbors(node, forward).items():
+                for key, attrs in keydict.items():
+                    edge = (node, nbr) if forward else (nbr, node)
+                    if keys:
+                        edge += (key,)
+                    if data is True:
+                        edge += (attrs,)
+                    elif data is not False:
+                        edge += (attrs.get(data, default),)
+                    yield edge
+
+    def edges(self, nbunch=None, keys=False, data=False, default=None):
+        """Iterate edges as `graph.edges(...)`, out edges of `nbunch` if given."""
+        nodes = self if nbunch is None else self._nbunch(nbunch)
+        return self._edges(nodes, True, keys, data, default)
+
+    out_edges = edges
+
+    def in_edges(self, nbunch=None, keys=False, data=False, default=None):
+        """Iterate edges as `graph.in_edges(...)`."""
+        nodes = self if nbunch is None else self._nbunch(nbunch)
+        return self._edges(nodes, False, keys, data, default)
+
+    def _nbunch(self, nbunch):
+        if nbunch in self:
+            return [nbunch]
+        return [node for node in nbunch if node in self]
+
+    def number_of_edges(self):
+        return sum(1 for _ in self.edges())
+
+    def degree(self, nbunch=None):
+        """Iterate (node, in + out degree) pairs, self-loops counting twice."""
+        nodes = self if nbunch is None else self._nbunch(nbunch)
+        for node in nodes:
+            yield (
+                node,
+                sum(
+                    len(keydict)
+                    for forward in (True, False)
+                    for keydict in self._neighbors(node, forward).values()
+                ),
+            )
+
+    def add_edge(self, u, v, key=None, **attr):
+        """Add an edge as `MultiDiGraph.add_edge`, returning its key."""
+        for node in (u, v):
+            if node not in self:
+                self.add_node(node)
+        keydict = self._own(u, forward=True).setdefault(v, {})
+        if key is None:
+            key = len(keydict)
+            while key in keydict:
+                key += 1
+        data = keydict.get(key)
+        if data is None:
+            data = {}
+        elif attr and data is self.base._succ.get(u, {}).get(v, {}).get(key):
+            data = dict(data)
+        keydict[key] = data
+        self._own(v, forward=False).setdefault(u, {})[key] = data
+        data.update(attr)
+        return key
+
+    def remove_edge(self, u, v, key=None):
+        """Remove an edge as `MultiDiGraph.remove_edge`."""
+        keydict = self._neighbors(u, forward=True).get(v, {}) if u in self else {}
+        if not keydict or (key is not None and key not in keydict):
+            raise nx.NetworkXError(f"The edge {u}-{v} not in graph.")
+        successors = self._own(u, forward=True)
+        predecessors = self._own(v, forward=False)
+        if key is None:
+            key = next(reversed(successors[v]))
+        del successors[v][key]
+        del predecessors[u][key]
+        if not successors[v]:
+            del successors[v]
+            del predecessors[u]
+
+    def remove_edges_from(self, edges):
+        for edge in edges:
+            try:
+                self.remove_edge(*edge[:3])
+            except nx.NetworkXError:
+                pass
+
+    def to_graph(self) -> nx.MultiDiGraph:
+        """Return the variant as a standalone MultiDiGraph."""
+        graph = nx.MultiDiGraph()
+        graph.graph.update(self.graph)
+        graph.add_nodes_from((node, dict(data)) for node, data in self.nodes(data=True))
+        graph.add_edges_from(self.edges(keys=True, data=True))
+        return graph
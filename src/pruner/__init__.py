@@ -1,21 +1,41 @@
-from typing import Callable
+import inspect
+import logging
+from collections.abc import Callable
+from itertools import chain
 
 import networkx as nx
 
+from label_index import LabelIndex
 from utils import remove_edges_from, remove_nodes_from
 
+from .rules import Rule, any_of, compile_predicates
+
+logger = logging.getLogger(__name__)
+
 predicator = Callable[[tuple, dict, nx.MultiDiGraph], bool]
 
 
 __all__ = [
     "GraphPruner",
+    "Rule",
+    "any_of",
     "predicator",
 ]
 
 
 class GraphPruner:
-    def __init__(self, graph: nx.MultiDiGraph):
+    """
+    Prune a graph with custom functions and node / edge predicates.
+
+    The pruner keeps a `LabelIndex` of the graph in sync with its own
+    removals, so that predicates and prune functions only visit the labels
+    they care about. Prune functions taking an `index` keyword receive it and
+    must keep it in sync; after any other prune function the index is rebuilt.
+    """
+
+    def __init__(self, graph: nx.MultiDiGraph, index: LabelIndex | None = None):
         self.graph = graph
+        self.index = index if index is not None else LabelIndex(graph)
         self.node_predicates: list[predicator] = []
         self.edge_predicates: list[predicator] = []
         self.custom_prune_functions = []
@@ -29,18 +49,32 @@ class GraphPruner:
     def add_prune_function(self, prune_function: Callable[[nx.MultiDiGraph], None]):
         self.custom_prune_functions.append(prune_function)
 
-    def prune(self):
+    def prune(self, fixed_point: bool = False):
+        """
+        Run the custom prune functions, then remove matching edges and nodes.
+
+        Args:
+            fixed_point (bool): Keep pruning until no predicate matches and no
+                node is isolated, see `_prune_to_fixed_point`
+        """
         for prune_function in self.custom_prune_functions:
-            prune_function(self.graph)
-        self._prune_edges()
-        self._prune_nodes()
+            if "index" in inspect.signature(prune_function).parameters:
+                prune_function(self.graph, index=self.index)
+            else:
+                prune_function(self.graph)
+                self.index = LabelIndex(self.graph)
+        if fixed_point:
+            self._prune_to_fixed_point()
+        else:
+            self._prune_edges()
+            self._prune_nodes()
 
     def remove_isolated_nodes(self):
         """
         Remove isolated nodes from the graph.
         """
         isolated_nodes = list(nx.isolates(self.graph))
-        remove_nodes_from(self.graph, isolated_nodes)
+        remove_nodes_from(self.graph, isolated_nodes, index=self.index)
 
     def _prune_edges(self):
         """
@@ -49,15 +83,15 @@ class GraphPruner:
         Args:
             graph (networkx.Graph): The graph to modify
             predicates (list): List of predicate functions to determine which edges to remove
+
+        All predicates are fused into a single pass over the relevant label
+        buckets, see `rules.compile_predicates`.
         """
-        edges_to_remove = []
-        for u, v, k, data in self.graph.edges(keys=True, data=True):
-            edge = (u, v, k)
-            if any(
-                predicate(edge, data, self.graph) for predicate in self.edge_predicates
-            ):
-                edges_to_remove.append(edge)
-        remove_edges_from(self.graph, edges_to_remove)
+        if not self.edge_predicates:
+            return
+        matches = compile_predicates(self.edge_predicates)
+        edges_to_remove = matches.select_edges(self.graph, self.index)
+        remove_edges_from(self.graph, edges_to_remove, index=self.index)
 
     def _prune_nodes(self):
         """
@@ -66,11 +100,84 @@ class GraphPruner:
         Args:
             graph (networkx.Graph): The graph to modify
             predicates (list): List of predicate functions to determine which nodes to remove
+
+        All predicates are fused into a single pass over the relevant label
+        buckets, see `rules.compile_predicates`.
+        """
+        if not self.node_predicates:
+            return
+        matches = compile_predicates(self.node_predicates)
+        nodes_to_remove = matches.select_nodes(self.graph, self.index)
+        remove_nodes_from(self.graph, nodes_to_remove, index=self.index)
+
+    def _prune_to_fixed_point(self):
+        """
+        Remove matching edges and nodes, and isolated nodes, until none is left.
+
+        The first round evaluates the whole graph like `_prune_edges` and
+        `_prune_nodes`. Every removal then marks its surroundings dirty: the
+        endpoints of removed edges, the neighbours of removed nodes and the
+        edges around those neighbours, CFG bypass edges included. Later rounds
+        only re-evaluate dirty elements, so their cost follows the changes.
         """
-        nodes_to_remove = []
-        for node, data in self.graph.nodes(data=True):
-            if any(
-                predicate(node, data, self.graph) for predicate in self.node_predicates
-            ):
-                nodes_to_remove.append(node)
-        remove_nodes_from(self.graph, nodes_to_remove)
+        graph = self.graph
+        index = self.index
+        edge_matches = compile_predicates(self.edge_predicates)
+        node_matches = compile_predicates(self.node_predicates)
+
+        def is_prunable(node):
+            return graph.degree(node) == 0 or (
+                node_matches and node_matches(node, graph.nodes[node], graph)
+            )
+
+        edges_to_remove = (
+            edge_matches.select_edges(graph, index) if edge_matches else []
+        )
+        dirty_nodes = set(nx.isolates(graph))
+        rounds = removed_nodes = removed_edges = 0
+        while True:
+            rounds += 1
+            remove_edges_from(graph, edges_to_remove, index=index)
+            removed_edges += len(edges_to_remove)
+            dirty_nodes.update(node for edge in edges_to_remove for node in edge[:2])
+
+            if rounds == 1 and node_matches:
+                nodes_to_remove = set(node_matches.select_nodes(graph, index))
+                nodes_to_remove.update(n for n in dirty_nodes if is_prunable(n))
+            else:
+                nodes_to_remove = {
+                    node for node in dirty_nodes if node in graph and is_prunable(node)
+                }
+            if not nodes_to_remove:
+                break
+
+            neighbours = {
+                neighbour
+                for node in nodes_to_remove
+                for neighbour in chain(graph.pred[node], graph.succ[node])
+            }
+            neighbours -= nodes_to_remove
+            remove_nodes_from(graph, nodes_to_remove, index=index)
+            removed_nodes += len(nodes_to_remove)
+
+            dirty_nodes = neighbours
+            if not edge_matches:
+                edges_to_remove = []
+                continue
+            dirty_edges = {
+                edge
+                for node in neighbours
+                for edge in chain(
+                    graph.in_edges(node, keys=True), graph.out_edges(node, keys=True)
+                )
+            }
+            succ = graph.succ
+            edges_to_remove = [
+                (u, v, k)
+                for u, v, k in dirty_edges
+                if edge_matches((u, v, k), succ[u][v][k], graph)
+            ]
+
+        logger.debug(
+            f"Pruned {removed_nodes} nodes and {removed_edges} edges in {rounds} rounds"
+        )
@@ -1,20 +1,37 @@
 import logging
+import time
 
-import networkx as nx
+from label_index import LabelIndex
+from utils import reachable_from
 
 logger = logging.getLogger(__name__)
 
 
-def remove_global_import(graph):
+def remove_global_import(graph, index: LabelIndex | None = None):
     """
-    Remove useless graph rooted by <includes>:<global> node"""
-    nodes_to_remove = []
-    for node, data in graph.nodes(data=True):
+    Remove useless graph rooted by <includes>:<global> node
+
+    Only AST edges are followed: the CFG, REACHING_DEF and CALL edges leaving
+    the subtree lead into the rest of the program, which must stay.
+    """
+    start = time.perf_counter()
+    if index is not None:
+        methods = ((node, graph.nodes[node]) for node in index.nodes("METHOD"))
+    else:
+        methods = graph.nodes(data=True)
+    nodes_to_remove = set()
+    for node, data in methods:
         if data["label"] == "METHOD" and data.get("FULL_NAME") == "<includes>:<global>":
             logger.debug(f"Removing node {node} with data {data}")
-            nodes_to_remove.append(node)
-            for des in nx.descendants(graph, node):
-                nodes_to_remove.append(des)
+            nodes_to_remove = reachable_from(graph, [node], edge_labels={"AST"})
             break
+    if index is not None:
+        index.discard_nodes(nodes_to_remove)
     graph.remove_nodes_from(nodes_to_remove)
+    if nodes_to_remove:
+        # runs once per file in the CodeNet driver, see `benchmark.py includes`
+        logger.debug(
+            f"Removed <includes>:<global> subtree of {len(nodes_to_remove)} nodes "
+            f"in {time.perf_counter() - start:.3f}s"
+        )
     return graph
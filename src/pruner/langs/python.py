@@ -2,12 +2,34 @@ import logging
 
 import networkx as nx
 
+from label_index import LabelIndex
+from utils import reachable_from
+
 logger = logging.getLogger(__name__)
 
 # The following functions do not work if class methods are not called!
 
+BAD_NAMES = {
+    "<metaClassCallHandler>",
+    "<metaClassAdapter>",
+    "<fakeNew>",
+    "<body>",
+    "<meta>",
+}
+
+
+def _keep_only(graph: nx.MultiDiGraph, good_nodes: set, index: LabelIndex | None):
+    """Remove every node not in `good_nodes` in one batch."""
+    bad_nodes = [node for node in graph if node not in good_nodes]
+    logger.debug(f"Removing {len(bad_nodes)} artifact nodes")
+    if index is not None:
+        index.discard_nodes(bad_nodes)
+    graph.remove_nodes_from(bad_nodes)
 
-def remove_artifact_nodes_with_ast(graph: nx.MultiDiGraph):
+
+def remove_artifact_nodes_with_ast(
+    graph: nx.MultiDiGraph, index: LabelIndex | None = None
+):
     root = [n for n, d in graph.in_degree() if d == 0]
     assert len(root) == 1, "There should be only one root node"
     root = root[0]
@@ -23,57 +45,26 @@ def remove_artifact_nodes_with_ast(graph: nx.MultiDiGraph):
         subroot for subroot in subroots if not is_bad_subroot(graph.nodes[subroot])
     ]
 
-    good_nodes = set()
-    for subroot in good_subroots:
-        good_nodes.add(subroot)
-        good_nodes.update(nx.descendants(graph, subroot))
-
+    good_nodes = reachable_from(graph, good_subroots)
     good_nodes.add(root)
 
-    for node in list(graph.nodes()):
-        if node not in good_nodes:
-            # graph.nodes[node]["color"] = "blue"
-            graph.remove_node(node)
+    _keep_only(graph, good_nodes, index)
 
 
-def remove_artifact_nodes_without_ast(graph: nx.MultiDiGraph):
-    logger.warning("Removing artifact nodes without AST is not implemented yet.")
-    return  # TODO: implement this function
+def remove_artifact_nodes_without_ast(
+    graph: nx.MultiDiGraph, index: LabelIndex | None = None
+):
     roots = [n for n, d in graph.in_degree() if d == 0]
 
     def is_bad_root(data):
         if data.get("label") == "METHOD":
-            bad_root_names = {
-                "<metaClassCallHandler>",
-                "<metaClassAdapter>",
-                "<fakeNew>",
-                "<body>",
-                "<meta>",
-            }
-            return any(
-                [bad_root_name in data.get("NAME") for bad_root_name in bad_root_names]
-            )
+            name = data.get("NAME", "")
+            return any(bad_name in name for bad_name in BAD_NAMES)
         if data.get("label") == "CALL":
-            bad_call_names = {
-                "<metaClassCallHandler>",
-                "<metaClassAdapter>",
-                "<fakeNew>",
-                "<body>",
-                "<meta>",
-            }
-            return any(
-                [bad_call_name in data.get("CODE") for bad_call_name in bad_call_names]
-            )
+            code = data.get("CODE", "")
+            return any(bad_name in code for bad_name in BAD_NAMES)
         return False
 
     good_roots = [root for root in roots if not is_bad_root(graph.nodes[root])]
 
-    good_nodes = set()
-    for subroot in good_roots:
-        good_nodes.add(subroot)
-        good_nodes.update(nx.descendants(graph, subroot))
-
-    for node in list(graph.nodes()):
-        if node not in good_nodes:
-            # graph.nodes[node]["color"] = "blue"
-            graph.remove_node(node)
+    _keep_only(graph, reachable_from(graph, good_roots), index)
@@ -0,0 +1,295 @@
+from collections.abc import Callable, Mapping
+from dataclasses import dataclass, field
+from functools import cached_property
+
+import networkx as nx
+
+from label_index import LabelIndex
+
+__all__ = [
+    "CompiledPredicates",
+    "Rule",
+    "any_of",
+    "compile_predicates",
+]
+
+
+def _as_set(values):
+    if values is None:
+        return None
+    if isinstance(values, str):
+        return frozenset([values])
+    return frozenset(values)
+
+
+@dataclass(frozen=True)
+class Rule:
+    """
+    Declarative node or edge predicate, true when all given conditions hold.
+
+    Args:
+        labels: label is one of these
+        exclude_labels: label is none of these
+        attrs: attribute equals the value, or is one of the values if a set
+        contains: attribute contains the substring
+        missing: attributes that must not be set
+        source_labels: (edges only) label of the source node is one of these
+        target_labels: (edges only) label of the target node is one of these
+        ast_parent: (nodes only) an AST edge comes from a node matching this
+            rule, which must have `labels`
+
+    A rule is a regular predicate, but `GraphPruner` can also look at its
+    conditions: rules with `labels` are only evaluated on elements carrying
+    one of those labels, and rules checking nothing else are resolved by the
+    label lookup alone. With a `LabelIndex`, rules anchored on endpoint or
+    parent labels are only evaluated next to nodes carrying those labels.
+    """
+
+    labels: frozenset[str] | None = None
+    exclude_labels: frozenset[str] = frozenset()
+    attrs: Mapping = field(default_factory=dict)
+    contains: Mapping = field(default_factory=dict)
+    missing: frozenset[str] = frozenset()
+    source_labels: frozenset[str] | None = None
+    target_labels: frozenset[str] | None = None
+    ast_parent: "Rule | None" = None
+
+    def __post_init__(self):
+        # frozen dataclass, so bypass __setattr__ to normalize the inputs
+        for name in ("labels", "source_labels", "target_labels"):
+            object.__setattr__(self, name, _as_set(getattr(self, name)))
+        for name in ("exclude_labels", "missing"):
+            object.__setattr__(self, name, _as_set(getattr(self, name)))
+        object.__setattr__(
+            self,
+            "attrs",
+            tuple(
+                (key, value if isinstance(value, str) else _as_set(value))
+                for key, value in dict(self.attrs).items()
+            ),
+        )
+        object.__setattr__(self, "contains", tuple(dict(self.contains).items()))
+        if self.ast_parent is not None and self.ast_parent.labels is None:
+            raise ValueError("ast_parent rules must have labels")
+
+    def __call__(self, element, data, graph) -> bool:
+        if self.labels is not None and data.get("label") not in self.labels:
+            return False
+        return self._check(element, data, graph)
+
+    @cached_property
+    def _check(self):
+        return self.compile()
+
+    def is_label_only(self) -> bool:
+        """Whether the rule is decided by `labels` alone."""
+        return self.labels is not None and not (
+            self.exclude_labels
+            or self.attrs
+            or self.contains
+            or self.missing
+            or self.source_labels is not None
+            or self.target_labels is not None
+            or self.ast_parent is not None
+        )
+
+    def compile(self) -> Callable[[tuple, dict, nx.MultiDiGraph], bool]:
+        """
+        Build a predicate checking every condition except `labels`, which the
+        caller is expected to have checked already.
+        """
+        checks = []
+        if self.exclude_labels:
+            exclude = self.exclude_labels
+            checks.append(lambda element, data, graph: data.get("label") not in exclude)
+        for key, value in self.attrs:
+            if isinstance(value, str):
+                checks.append(
+                    lambda element, data, graph, key=key, value=value: (
+                        data.get(key) == value
+                    )
+                )
+            else:
+                checks.append(
+                    lambda element, data, graph, key=key, value=value: (
+                        data.get(key) in value
+                    )
+                )
+        for key, value in self.contains:
+            checks.append(
+                lambda element, data, graph, key=key, value=value: (
+                    value in data.get(key, "")
+                )
+            )
+        if self.missing:
+            missing = self.missing
+            checks.append(lambda element, data, graph: missing.isdisjoint(data.keys()))
+        if self.source_labels is not None:
+            source_labels = self.source_labels
+            checks.append(
+                lambda element, data, graph: (
+                    graph.nodes[element[0]].get("label") in source_labels
+                )
+            )
+        if self.target_labels is not None:
+            target_labels = self.target_labels
+            checks.append(
+                lambda element, data, graph: (
+                    graph.nodes[element[1]].get("label") in target_labels
+                )
+            )
+        if self.ast_parent is not None:
+            parent = self.ast_parent
+            checks.append(
+                lambda element, data, graph: any(
+                    edge_data.get("label") == "AST" and parent(u, graph.nodes[u], graph)
+                    for u, _, edge_data in graph.in_edges(element, data=True)
+                )
+            )
+
+        if not checks:
+            return lambda element, data, graph: True
+        if len(checks) == 1:
+            return checks[0]
+        return lambda element, data, graph: all(
+            check(element, data, graph) for check in checks
+        )
+
+
+class any_of(tuple):
+    """A predicate that holds when any of its rules does."""
+
+    def __new__(cls, *rules: Rule):
+        return super().__new__(cls, rules)
+
+    def __call__(self, element, data, graph) -> bool:
+        return any(rule(element, data, graph) for rule in self)
+
+
+class CompiledPredicates:
+    """
+    A list of predicates fused into one, see `compile_predicates`.
+
+    Attributes:
+        labels: labels matched through a label bucket
+        anchored: rules without `labels` that a `LabelIndex` can still narrow
+            down through their endpoint or parent labels
+        opaque: True when some predicate may match any element, in which case
+            every element has to be visited
+    """
+
+    def __init__(self, predicates):
+        buckets = {}
+        generic = []
+        self.anchored = []
+        self.opaque = False
+        for predicate in predicates:
+            for rule in predicate if isinstance(predicate, any_of) else (predicate,):
+                if isinstance(rule, Rule) and rule.labels is not None:
+                    check = True if rule.is_label_only() else rule.compile()
+                    for label in rule.labels:
+                        bucket = buckets.setdefault(label, [])
+                        if check is True:
+                            bucket[:] = [True]
+                        elif bucket != [True]:
+                            bucket.append(check)
+                    continue
+                if isinstance(rule, Rule) and (
+                    rule.source_labels is not None
+                    or rule.target_labels is not None
+                    or rule.ast_parent is not None
+                ):
+                    self.anchored.append(rule)
+                else:
+                    self.opaque = True
+                generic.append(rule)
+
+        # every bucket also runs the generic predicates; unknown labels only those
+        self._compiled = {
+            label: True if checks == [True] else tuple(checks + generic)
+            for label, checks in buckets.items()
+        }
+        self._generic = tuple(generic)
+        self.labels = frozenset(self._compiled)
+
+    def __bool__(self):
+        return bool(self._compiled or self._generic)
+
+    def __call__(self, element, data, graph) -> bool:
+        checks = self._compiled.get(data.get("label"), self._generic)
+        if checks is True:
+            return True
+        for check in checks:
+            if check(element, data, graph):
+                return True
+        return False
+
+    def select_nodes(self, graph, index: LabelIndex | None = None) -> list:
+        """
+        Return the matching nodes. With an `index`, only the label buckets and
+        the children of anchoring nodes are visited, unless `opaque`.
+        """
+        if (
+            index is None
+            or self.opaque
+            or any(rule.ast_parent is None for rule in self.anchored)
+        ):
+            return [
+                node for node, data in graph.nodes(data=True) if self(node, data, graph)
+            ]
+
+        candidates = dict.fromkeys(index.nodes(*self.labels))
+        for rule in self.anchored:
+            parent = rule.ast_parent
+            for u in index.nodes(*parent.labels):
+                if parent(u, graph.nodes[u], graph):
+                    for _, v, data in graph.out_edges(u, data=True):
+                        if data.get("label") == "AST":
+                            candidates[v] = None
+        graph_nodes = graph.nodes
+        return [node for node in candidates if self(node, graph_nodes[node], graph)]
+
+    def select_edges(self, graph, index: LabelIndex | None = None) -> list:
+        """
+        Return the matching (u, v, key) edges. With an `index`, only the label
+        buckets and the edges around anchoring nodes are visited, unless
+        `opaque`.
+        """
+        if (
+            index is None
+            or self.opaque
+            or any(
+                rule.source_labels is None and rule.target_labels is None
+                for rule in self.anchored
+            )
+        ):
+            return [
+                (u, v, k)
+                for u, v, k, data in graph.edges(keys=True, data=True)
+                if self((u, v, k), data, graph)
+            ]
+
+        candidates = dict.fromkeys(index.edges(*self.labels))
+        for rule in self.anchored:
+            if rule.target_labels is not None:
+                for v in index.nodes(*rule.target_labels):
+                    candidates.update(dict.fromkeys(graph.in_edges(v, keys=True)))
+            elif rule.source_labels is not None:
+                for u in index.nodes(*rule.source_labels):
+                    candidates.update(dict.fromkeys(graph.out_edges(u, keys=True)))
+        succ = graph.succ
+        return [
+            (u, v, k) for u, v, k in candidates if self((u, v, k), succ[u][v][k], graph)
+        ]
+
+
+def compile_predicates(predicates) -> CompiledPredicates:
+    """
+    Fuse a list of predicates into one.
+
+    Rules (also inside `any_of`) are bucketed by label; everything else is a
+    generic check evaluated on every element. The fused predicate looks up
+    the element label once and only runs the checks of that bucket plus the
+    generic ones; buckets holding a label-only rule match right away.
+    """
+    return CompiledPredicates(predicates)
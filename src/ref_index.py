@@ -0,0 +1,306 @@
+"""
+Persistent index of the reference export used by merge.py.
+
+merge.py borrows two things from the reference `all/export.dot`: the
+attributes of the nodes of the per-representation exports, and the CALL
+edges. Loading the whole export for that dominates the merge, and it is
+repeated for every variant merged from the same export. `RefIndex` keeps
+just those two things in a file next to the export, built by streaming the
+export once. Later runs memory-map the file and look nodes up in an on-disk
+hash table, so neither the reference graph nor its node table is loaded.
+
+Layout of the index file (little-endian):
+
+    magic       8 bytes
+    header      export size, export mtime (ns), node count, offset of the
+                CALL edges, offset of the table, table slots (6 x 8 bytes)
+    records     one JSON line `[node, attrs]` per node
+    CALL edges  one JSON line `[[u, v, attrs], ...]`
+    table       slots of (hash of the node, record offset + 1), 0 marking an
+                empty slot, probed linearly
+
+The index is rebuilt when the size or mtime of the export changes, and used
+as is when the export is gone.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+
+import dot_reader
+import utils
+
+__all__ = [
+    "GraphReference",
+    "RefIndex",
+    "build_index",
+    "open_index",
+]
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"CPGREF1\n"
+_HEADER = struct.Struct("<QqQQQQ")
+_SLOT = struct.Struct("<QQ")
+
+
+def _hash(node) -> int:
+    # Python's hash() is salted per process, the table outlives the process
+    return int.from_bytes(hashlib.blake2b(node.encode(), digest_size=8).digest())
+
+
+def _read_reference(file_path):
+    """
+    Return the node attributes and the CALL edges of an export, as
+    `utils.read_dot_file` would load them: nodes in insertion order, CALL
+    edges in the order `graph.edges` yields them.
+    """
+    nodes = {}
+    # u -> v -> [attrs, ...]; v is added on the first u -> v edge of any label,
+    # as `graph.succ[u]` orders it, and the list holds only the CALL edges
+    calls = {}
+    try:
+        for event in dot_reader.iter_dot(file_path):
+            if event[0] == "node":
+                nodes.setdefault(event[1], {}).update(event[2])
+            elif event[0] == "edge":
+                _, u, v, _, attrs = event
+                nodes.setdefault(u, {})
+                nodes.setdefault(v, {})
+                parallel = calls.setdefault(u, {}).setdefault(v, [])
+                if attrs.get("label") == "CALL":
+                    parallel.append(attrs)
+    except dot_reader.DotSyntaxError:
+        graph = utils.read_dot_file(file_path)
+        nodes = dict(graph.nodes(data=True))
+        calls = {}
+        for u, v, data in graph.edges(data=True):
+            if data.get("label") == "CALL":
+                calls.setdefault(u, {}).setdefault(v, []).append(data)
+
+    call_edges = [
+        [u, v, attrs]
+        for u in nodes
+        for v, parallel in calls.get(u, {}).items()
+        for attrs in parallel
+    ]
+    return nodes, call_edges
+
+
+def build_index(file_path, index_path):
+    """
+    Build the index of the export `file_path` and write it to `index_path`.
+
+    The file is written under a temporary name and renamed, so concurrent
+    builds and readers never see a partial index.
+    """
+    stat = os.stat(file_path)
+    nodes, call_edges = _read_reference(file_path)
+
+    slots = 1 << max(3, (2 * len(nodes)).bit_length())
+    table = [(0, 0)] * slots
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as fp:
+            fp.write(MAGIC + bytes(_HEADER.size))
+            for node, attrs in nodes.items():
+                offset = fp.tell()
+                h = _hash(node)
+                slot = h % slots
+                while table[slot][1]:
+                    slot = (slot + 1) % slots
+                table[slot] = (h, offset + 1)
+                fp.write(json.dumps([node, attrs], ensure_ascii=False).encode())
+                fp.write(b"\n")
+            calls_offset = fp.tell()
+            fp.write(json.dumps(call_edges, ensure_ascii=False).encode())
+            fp.write(b"\n")
+            table_offset = fp.tell()
+            fp.writelines(_SLOT.pack(*entry) for entry in table)
+            fp.seek(len(MAGIC))
+            fp.write(
+                _HEADER.pack(
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                    len(nodes),
+                    calls_offset,
+                    table_offset,
+                    slots,
+                )
+            )
+        os.replace(tmp_path, index_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    logger.info(
+        f"Indexed {len(nodes)} nodes and {len(call_edges)} CALL edges "
+        f"of {file_path} in {index_path}"
+    )
+
+
+class RefIndex:
+    """
+    Read-only, memory-mapped view of an index written by `build_index`.
+
+    Behaves like a mapping from node to attributes: `node in index`,
+    `index.get(node)` and `len(index)`. Each lookup decodes a fresh dict.
+    """
+
+    def __init__(self, index_path):
+        self.path = index_path
+        with open(index_path, "rb") as fp:
+            self._map = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[: len(MAGIC)] != MAGIC:
+            self._map.close()
+            raise ValueError(f"Not a reference index: {index_path}")
+        (
+            self.source_size,
+            self.source_mtime_ns,
+            self._nodes,
+            self._calls_offset,
+            self._table_offset,
+            self._slots,
+        ) = _HEADER.unpack_from(self._map, len(MAGIC))
+
+    def __repr__(self):
+        return f"RefIndex of {self._nodes} nodes in {self.path}"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self._nodes
+
+    def __contains__(self, node):
+        return self._find(node) is not None
+
+    def _record(self, offset):
+        end = self._map.find(b"\n", offset)
+        return json.loads(self._map[offset:end])
+
+    def _find(self, node):
+        h = _hash(node)
+        slot = h % self._slots
+        while True:
+            stored, offset = _SLOT.unpack_from(
+                self._map, self._table_offset + slot * _SLOT.size
+            )
+            if not offset:
+                return None
+            if stored == h:
+                record = self._record(offset - 1)
+                if record[0] == node:
+                    return record[1]
+            slot = (slot + 1) % self._slots
+
+    def get(self, node, default=None):
+        """Return the attributes of `node` in the reference, or `default`."""
+        attrs = self._find(node)
+        return default if attrs is None else attrs
+
+    def call_edges(self) -> list:
+        """Return the CALL edges of the reference as (u, v, attrs) tuples."""
+        return [tuple(edge) for edge in self._record(self._calls_offset)]
+
+    def is_current(self, file_path) -> bool:
+        """Whether the index was built from the export as it is now."""
+        stat = os.stat(file_path)
+        return (stat.st_size, stat.st_mtime_ns) == (
+            self.source_size,
+            self.source_mtime_ns,
+        )
+
+    def close(self):
+        self._map.close()
+
+
+class GraphReference:
+    """
+    `RefIndex` interface over an export that is already loaded, for callers
+    holding the graph anyway (see variants.py). Lookups return the graph's
+    own attribute dicts, which must not be modified.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __repr__(self):
+        return f"GraphReference to {self.graph}"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.graph)
+
+    def __contains__(self, node):
+        return node in self.graph
+
+    def get(self, node, default=None):
+        """Return the attributes of `node` in the reference, or `default`."""
+        return self.graph.nodes.get(node, default)
+
+    def call_edges(self) -> list:
+        """Return the CALL edges of the reference as (u, v, attrs) tuples."""
+        return [
+            (u, v, data)
+            for u, v, data in self.graph.edges(data=True)
+            if data.get("label") == "CALL"
+        ]
+
+    def close(self):
+        pass
+
+
+def open_index(file_path, index_path=None) -> RefIndex:
+    """
+    Open the index of the export `file_path`, building it first if it is
+    missing or out of date.
+
+    Args:
+        file_path (str): Path to the reference .dot file
+        index_path (str): Path to the index (default: `file_path` + ".refidx")
+    """
+    index_path = index_path or f"{file_path}.refidx"
+    if os.path.exists(index_path):
+        index = RefIndex(index_path)
+        if not os.path.exists(file_path) or index.is_current(file_path):
+            logger.debug(f"Using {index}")
+            return index
+        index.close()
+        logger.info(f"{file_path} changed since {index_path} was built")
+    build_index(file_path, index_path)
+    return RefIndex(index_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build the reference index merge.py uses for a Joern export."
+    )
+    parser.add_argument("input_file", help="Path to the reference .dot file")
+    parser.add_argument(
+        "-o", "--output", help="Path to the index (default: <input_file>.refidx)"
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="Enable verbose output"
+    )
+
+    args = parser.parse_args()
+    utils.setup_logging(args.verbose)
+
+    build_index(args.input_file, args.output or f"{args.input_file}.refidx")
+
+
+if __name__ == "__main__":
+    main()
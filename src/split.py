@@ -0,0 +1,229 @@
+"""
+Split a Joern `all` export of several source files into one export per file.
+
+Parsing many small files in one Joern project is much cheaper than one
+project per file, but the export then holds every file at once. Each node
+is assigned to the file it comes from: FILE, NAMESPACE_BLOCK, TYPE_DECL and
+METHOD nodes carry the file name, everything below them in the AST belongs
+to the same file. Nodes owned by no file or by several files (META_DATA,
+TYPE, external method stubs, ...) are shared: a file gets those adjacent to
+its own nodes together with their shared AST descendants (the parameters
+and return of a `<operator>` stub, ...), plus the isolated ones.
+
+A part differs from an export of the file alone in the shared nodes it
+lacks: those reached from the file only through other shared nodes (e.g.
+the TYPE of a stub parameter) are left out, as are shared nodes Joern
+creates only for other files.
+
+Joern also links calls against the methods of the whole project, and
+sources of one problem mostly define the same functions (`gcd`, `solve`,
+...): a call may end up linked to the METHOD of another file, an edge a
+part cannot hold. `linked_files` finds these files, which have to be parsed
+alone. Files staged under another name (see `renamer`) get their own name
+back in FILENAME and the FULL_NAMEs derived from it.
+"""
+
+import argparse
+import logging
+import os
+import re
+
+import dot_reader
+import utils
+
+logger = logging.getLogger(__name__)
+
+
+def file_of(data) -> str | None:
+    """Return the base name of the file a node declares, or None."""
+    if data.get("label") == "FILE":
+        filename = data.get("NAME")
+    else:
+        filename = data.get("FILENAME")
+    return os.path.basename(filename) if filename else None
+
+
+def _owners(graph, filenames) -> dict:
+    """Return node -> file of the nodes below the nodes declaring a file."""
+    roots = {filename: [] for filename in filenames}
+    for node, data in graph.nodes(data=True):
+        filename = file_of(data)
+        if filename in roots:
+            roots[filename].append(node)
+
+    owners = {}
+    for filename, file_roots in roots.items():
+        for node in utils.reachable_from(graph, file_roots, edge_labels={"AST"}):
+            owners[node] = filename if node not in owners else None
+    return owners
+
+
+def linked_files(graph, owners) -> set[str]:
+    """
+    Return the files with an edge to or from a node owned by another file.
+
+    An export of a file alone has no such edge, so its part would miss it,
+    e.g. a call linked to the `gcd` of another file instead of its own.
+
+    Args:
+        graph (networkx.MultiDiGraph): The full export
+        owners (dict): Node -> file, None for nodes of several files
+    """
+    linked = set()
+    for u, v in graph.edges():
+        u_file, v_file = owners.get(u), owners.get(v)
+        if u_file is not None and v_file is not None and u_file != v_file:
+            linked.update((u_file, v_file))
+    return linked
+
+
+def partition(graph, filenames, owners=None) -> dict[str, set]:
+    """
+    Return the nodes of the per-file export of each of `filenames`.
+
+    Args:
+        graph (networkx.MultiDiGraph): The full export
+        filenames (iterable): Base names of the parsed files
+        owners (dict): Node -> file, from `_owners`, computed if not given
+
+    Returns:
+        dict: File name -> nodes, in the order of `filenames`
+    """
+    filenames = list(filenames)
+    if owners is None:
+        owners = _owners(graph, filenames)
+
+    isolated = [node for node in graph if node not in owners and not graph.degree(node)]
+    parts = {filename: set(isolated) for filename in filenames}
+    shared = {filename: set() for filename in filenames}
+    pred, succ = graph.pred, graph.succ
+    for node, filename in owners.items():
+        if filename is None:
+            continue
+        parts[filename].add(node)
+        for neighbour in (*pred[node], *succ[node]):
+            if owners.get(neighbour, None) is None:
+                shared[filename].add(neighbour)
+
+    # shared AST subtrees, without crossing into nodes owned by a file
+    for filename, part in parts.items():
+        part |= shared[filename]
+        stack = list(shared[filename])
+        while stack:
+            for child, keydict in succ[stack.pop()].items():
+                if child in part or owners.get(child, None) is not None:
+                    continue
+                if any(data.get("label") == "AST" for data in keydict.values()):
+                    part.add(child)
+                    stack.append(child)
+    return parts
+
+
+def renamer(renames: dict):
+    """
+    Return a function renaming files in the attribute values of a statement.
+
+    Values that are a staged file name of `renames`, or start with it followed
+    by `:`, get the original name instead: FILENAME, the NAME of FILE nodes,
+    FULL_NAMEs such as `<file>:<global>`.
+
+    Args:
+        renames (dict): Staged name or path -> original name or path
+    """
+    quoted = {_quote(staged): _quote(name) for staged, name in renames.items()}
+    pattern = re.compile(
+        '="('
+        + "|".join(
+            re.escape(staged) for staged in sorted(quoted, key=len, reverse=True)
+        )
+        + ')(?=[":])'
+    )
+
+    def rename(text):
+        return pattern.sub(lambda match: f'="{quoted[match[1]]}', text)
+
+    return rename
+
+
+def _quote(name):
+    return name.replace('"', '\\"')
+
+
+def split_export(input_file, output_files: dict, renames=None) -> set[str]:
+    """
+    Write the per-file exports of a Joern `all` export.
+
+    Statements are copied verbatim, except for the file names in `renames`.
+    A part holds what the module docstring describes, not always everything
+    an export of the file alone would. Files linked to other files (see
+    `linked_files`) are not written.
+
+    Args:
+        input_file (str): Path to the full export
+        output_files (dict): Base name of a parsed file -> path of its export
+        renames (dict): Staged name or path -> original, see `renamer`
+
+    Returns:
+        set: Files that were not written and have to be parsed alone
+    """
+    graph = utils.read_dot_file(input_file)
+    owners = _owners(graph, output_files)
+    linked = linked_files(graph, owners)
+    parts = partition(graph, output_files, owners)
+    for filename in linked:
+        logger.warning(f"{filename}: linked to nodes of other files, not written")
+        del parts[filename]
+    for filename, nodes in parts.items():
+        logger.debug(f"{filename}: {len(nodes)} nodes")
+        os.makedirs(
+            os.path.dirname(os.path.abspath(output_files[filename])), exist_ok=True
+        )
+    dot_reader.split_dot(
+        input_file,
+        parts,
+        output_files,
+        rewrite=renamer(renames) if renames else None,
+    )
+    return linked
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Split a Joern export of several files into one export per file."
+    )
+    parser.add_argument(
+        "input_file",
+        help="Path to the input .dot file.",
+        nargs="?",
+        default="out/joern/all/export.dot",
+    )
+    parser.add_argument(
+        "files", nargs="+", help="Names of the parsed files, as in FILENAME"
+    )
+    parser.add_argument(
+        "-o",
+        "--output-dir",
+        default="./out/split",
+        help="Directory receiving one <file name>.dot per file (default: out/split)",
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="Enable verbose output"
+    )
+
+    args = parser.parse_args()
+
+    utils.setup_logging(args.verbose)
+
+    split_export(
+        args.input_file,
+        {
+            os.path.basename(name): os.path.join(
+                args.output_dir, os.path.basename(name) + ".dot"
+            )
+            for name in args.files
+        },
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,142 @@
+import concurrent.futures
 import logging
+import multiprocessing
+import os
+from collections import defaultdict
+from itertools import chain
 
 import colorlog
+import networkx as nx
 import networkx.drawing.nx_agraph
 
+import dot_reader
+from cpg import CPGTemplate
+from label_index import LabelIndex
+
 logger = logging.getLogger(__name__)
 
 
-def read_dot_file(file_path):
-    graph = networkx.drawing.nx_agraph.read_dot(file_path)
+def read_dot_file(file_path, template: CPGTemplate | None = None):
+    """
+    Read a .dot file into a MultiDiGraph.
+
+    Joern exports go through the streaming `dot_reader`; anything it does not
+    understand is handed over to pygraphviz.
+
+    Args:
+        file_path (str): Path to the .dot file
+        template (CPGTemplate): If given, only nodes and edges with these labels
+            are kept (see `filter_graph`). Most of them are discarded while
+            parsing, so the unfiltered graph is never built.
+    """
+    try:
+        graph = dot_reader.read_dot(file_path, template)
+    except dot_reader.DotSyntaxError as e:
+        logger.warning(f"{e} in {file_path}, falling back to pygraphviz")
+        graph = networkx.drawing.nx_agraph.read_dot(file_path)
     logger.debug(f"Loaded {graph} from {file_path}")
+    if template is not None:
+        filter_graph(graph, template)
+    return graph
+
+
+def read_dot_files(file_paths, template: CPGTemplate | None = None, jobs=1):
+    """
+    Read many .dot files, e.g. Joern's per-method exports, with `read_dot_file`.
+
+    Parsing is pure Python and holds the GIL, so with `jobs` > 1 the files are
+    parsed by a pool of processes, each handed a run of consecutive files to
+    amortize the round trip. Inside a daemonic process (a multiprocessing.Pool
+    worker), which cannot start children, the files are read sequentially.
+
+    Args:
+        file_paths (list): Paths to the .dot files
+        template (CPGTemplate): See `read_dot_file`
+        jobs (int): Number of processes, 0 for one per CPU
+
+    Returns:
+        list: The graphs, in the order of `file_paths`
+    """
+    file_paths = list(file_paths)
+    jobs = min(jobs or os.cpu_count() or 1, len(file_paths))
+    if jobs <= 1 or multiprocessing.current_process().daemon:
+        return [read_dot_file(file_path, template) for file_path in file_paths]
+
+    chunksize = max(1, len(file_paths) // (jobs * 4))
+    with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+        return list(
+            executor.map(
+                read_dot_file,
+                file_paths,
+                [template] * len(file_paths),
+                chunksize=chunksize,
+            )
+        )
+
+
+def fork_graph(graph, template: CPGTemplate | None = None):
+    """
+    Copy a fully loaded export as `read_dot_file` would load it with `template`.
+
+    Only the nodes and edges the template keeps are copied, plus the dropped
+    nodes on a CFG path, which `filter_graph` then splices out exactly as for
+    the file. Attribute dicts are copied, so the fork can be mutated freely.
+
+    Args:
+        graph (networkx.MultiDiGraph): The export, loaded without a template
+        template (CPGTemplate): If given, only nodes and edges with these labels
+            are kept; None copies the whole graph
+    """
+    if template is None:
+        return graph.copy()
+
+    node_labels = template.node_labels
+    edge_labels = template.edge_labels
+    fork = nx.MultiDiGraph()
+    fork.graph.update(graph.graph)
+    fork.add_nodes_from(
+        (node, data)
+        for node, data in graph.nodes(data=True)
+        if data.get("label") in node_labels
+    )
+    spliced = []
+    for u, v, k, data in graph.edges(keys=True, data=True):
+        label = data.get("label")
+        if label not in edge_labels:
+            continue
+        if u in fork and v in fork:
+            fork.add_edge(u, v, k, **data)
+        elif label == "CFG":
+            spliced.append((u, v, k, data))
+    # adds the dropped endpoints, without attributes
+    fork.add_edges_from(spliced)
+    logger.debug(f"Forked {fork} from {graph}")
+    return filter_graph(fork, template)
+
+
+def filter_graph(graph, template: CPGTemplate):
+    """
+    Keep only nodes and edges whose label is in the template.
+
+    Nodes are removed first, with CFG flow preserved across them (see
+    `remove_nodes_from`), then edges.
+    """
+    # Delete nodes with specified labels (partial match)
+    nodes_to_remove = [
+        node
+        for node, data in graph.nodes(data=True)
+        if data.get("label") not in template.node_labels
+    ]
+    logger.debug(f"Nodes to remove: {nodes_to_remove}")
+    remove_nodes_from(graph, nodes_to_remove)
+
+    # Delete edges with specified labels, considering MultiDiGraph
+    edges_to_remove = [
+        (u, v, k)
+        for u, v, k, data in graph.edges(keys=True, data=True)
+        if data.get("label") not in template.edge_labels
+    ]
+    remove_edges_from(graph, edges_to_remove)
     return graph
 
 
@@ -24,68 +152,197 @@ def write_dot_file(graph, output_file):
     networkx.drawing.nx_agraph.write_dot(graph, output_file)
 
 
-def remove_edges_from(graph, edges):
+def remove_edges_from(graph, edges, index: LabelIndex | None = None):
+    if index is not None:
+        edges = list(edges)
+        index.discard_edges(edges)
     graph.remove_edges_from(edges)
 
 
-def remove_nodes_from(graph, nodes):
+def _cfg_edge_data(keydict):
+    """Return the data of the first CFG edge among parallel edges, or None."""
+    for data in keydict.values():
+        if data.get("label") == "CFG":
+            return data
+    return None
+
+
+def cfg_bypass_edges(graph, removed, max_fan_in=None):
     """
-    Check if the CFG will be broken if we remove the node.
-    If true, CFG flow should skip the node.
+    Compute the CFG edges that keep the flow connected once `removed` is gone.
+
+    Every kept CFG predecessor of a removed region is connected to every kept
+    node the region leads to, following CFG edges through removed nodes only,
+    so branch splits and joins inside the region survive. Only the edges
+    touching removed nodes are indexed, and the kept successors of each
+    region are computed once on its condensation, so the cost is linear in
+    the affected edges plus the number of bypass edges produced.
+
+    Args:
+        graph (networkx.MultiDiGraph): The graph, before removal
+        removed (set): Nodes about to be removed
+        max_fan_in (int): If set, at most this many bypass edges end in the
+            same node, guarding against pathological fan-in
+
+    Returns:
+        list: (u, v, data) tuples of the bypass edges, without duplicates nor
+        edges already present in the CFG
     """
+    pred, succ = graph.pred, graph.succ
 
-    for node in nodes:
-        has_incoming_cfg = False
-        has_outgoing_cfg = False
+    # CFG adjacency index restricted to the removed nodes
+    entries = {}  # removed node -> {kept predecessor: edge data}
+    exits = {}  # removed node -> kept successors
+    inner = nx.DiGraph()  # CFG edges between removed nodes
+    for node in removed:
+        for u, keydict in pred[node].items():
+            if u not in removed:
+                data = _cfg_edge_data(keydict)
+                if data is not None:
+                    entries.setdefault(node, {})[u] = data
+        for v, keydict in succ[node].items():
+            if _cfg_edge_data(keydict) is not None:
+                if v in removed:
+                    inner.add_edge(node, v)
+                else:
+                    exits.setdefault(node, set()).add(v)
+    if not entries or not exits:
+        return []
 
-        incoming_edge = None
-        outgoning_edge = None
+    # kept nodes reachable from each strongly connected group of removed nodes
+    inner.add_nodes_from(entries)
+    condensed = nx.condensation(inner)
+    reachable = {}
+    for scc in reversed(list(nx.topological_sort(condensed))):
+        members = condensed.nodes[scc]["members"]
+        children = list(condensed.successors(scc))
+        own = [v for node in members for v in exits.get(node, ())]
+        if not own and len(children) == 1:
+            # plain chain, share the successor's set instead of copying it
+            reachable[scc] = reachable[children[0]]
+            continue
+        targets = set(own)
+        for child in children:
+            targets.update(reachable[child])
+        reachable[scc] = targets
 
-        for u, v, k, data in graph.in_edges(node, keys=True, data=True):
-            if data["label"] == "CFG":
-                has_incoming_cfg = True
-                incoming_edge = (u, v, k, data)
-                break
+    mapping = condensed.graph["mapping"]
+    bypass = {}
+    fan_in = defaultdict(int)
+    skipped = 0
+    for node, sources in entries.items():
+        targets = reachable[mapping[node]]
+        for u, data in sources.items():
+            for v in targets:
+                if (u, v) in bypass or (v in succ[u] and _cfg_edge_data(succ[u][v])):
+                    continue
+                if max_fan_in is not None and fan_in[v] >= max_fan_in:
+                    skipped += 1
+                    continue
+                fan_in[v] += 1
+                bypass[(u, v)] = data
+    if skipped:
+        logger.warning(
+            f"Skipped {skipped} CFG bypass edges over the fan-in cap of {max_fan_in}"
+        )
+    return [(u, v, dict(data)) for (u, v), data in bypass.items()]
 
-        for u, v, k, data in graph.out_edges(node, keys=True, data=True):
-            if data["label"] == "CFG":
-                has_outgoing_cfg = True
-                outgoning_edge = (u, v, k, data)
-                break
 
-        if not has_incoming_cfg and not has_outgoing_cfg:
-            # No CFG edges, so we can remove the node
-            pass
+def remove_nodes_from(graph, nodes, max_fan_in=None, index: LabelIndex | None = None):
+    """
+    Remove nodes from the graph without breaking the CFG.
 
-        elif has_incoming_cfg != has_outgoing_cfg:
-            # We are at the entry or exit of a CFG
-            logger.debug(
-                f"Removing node {graph.nodes[node]} with only one CFG edge {incoming_edge if has_incoming_cfg else outgoning_edge}"
+    CFG flow skips the removed nodes (see `cfg_bypass_edges`). Bypass edges
+    are computed for the whole batch first, then the graph is mutated once.
+    If an `index` is given, it is kept in sync.
+    """
+    removed = {node for node in nodes if node in graph}
+    bypass = cfg_bypass_edges(graph, removed, max_fan_in)
+    if index is not None:
+        index.discard_nodes(removed)
+        graph.remove_nodes_from(removed)
+        index.add_edges_from(bypass)
+    else:
+        graph.remove_nodes_from(removed)
+        graph.add_edges_from(bypass)
+    logger.debug(f"Removed {len(removed)} nodes, added {len(bypass)} CFG bypass edges")
+
+
+def contract_cfg(graph, nodes):
+    """
+    Route CFG flow around `nodes`: their CFG edges are replaced by edges
+    from their kept CFG predecessors to the kept nodes they lead to (see
+    `cfg_bypass_edges`). The nodes themselves and their other edges stay.
+    """
+    contracted = {node for node in nodes if node in graph}
+    bypass = cfg_bypass_edges(graph, contracted)
+    graph.remove_edges_from(
+        [
+            (u, v, k)
+            for node in contracted
+            for u, v, k, label in chain(
+                graph.in_edges(node, keys=True, data="label"),
+                graph.out_edges(node, keys=True, data="label"),
             )
+            if label == "CFG"
+        ]
+    )
+    graph.add_edges_from(bypass)
+    logger.debug(
+        f"Contracted the CFG around {len(contracted)} nodes, "
+        f"added {len(bypass)} CFG bypass edges"
+    )
 
-        elif has_incoming_cfg and has_outgoing_cfg:
-            # We have both incoming and outgoing CFG edges
-            # We need to remove the node but maintain the CFG flow
-            if incoming_edge and outgoning_edge:
-                graph.remove_edges_from([incoming_edge, outgoning_edge])
-                graph.add_edge(incoming_edge[0], outgoning_edge[1], **incoming_edge[3])
-                logger.debug(
-                    f"Removing node {graph.nodes[node]} with both CFG edges {incoming_edge} and {outgoning_edge}"
-                )
 
-    graph.remove_nodes_from(nodes)
+def reachable_from(graph, sources, edge_labels=None) -> set:
+    """
+    Return the nodes reachable from any of `sources`, sources included.
 
+    Unlike a union of `nx.descendants` calls, this is a single traversal:
+    every node is visited once however many sources reach it.
 
-def add_virtual_root(graph):
+    Args:
+        graph (networkx.MultiDiGraph): The graph
+        sources (iterable): Start nodes
+        edge_labels (set): If given, only follow edges with one of these labels
+    """
+    succ = graph.succ
+    seen = set(sources)
+    stack = list(seen)
+    while stack:
+        for v, keydict in succ[stack.pop()].items():
+            if v in seen:
+                continue
+            if edge_labels is not None and not any(
+                data.get("label") in edge_labels for data in keydict.values()
+            ):
+                continue
+            seen.add(v)
+            stack.append(v)
+    return seen
+
+
+def add_virtual_root(graph, index: LabelIndex | None = None):
     """
     Add a virtual root node connecting to all method nodes in the graph.
     """
     virtual_root = "FILE"
     if virtual_root not in graph:
+        if index is not None:
+            methods = index.nodes("METHOD")
+        else:
+            methods = [
+                node
+                for node, data in graph.nodes(data=True)
+                if data["label"] == "METHOD"
+            ]
         graph.add_node(virtual_root, label="FILE")
-        for node, data in graph.nodes(data=True):
-            if data["label"] == "METHOD":
-                graph.add_edge(virtual_root, node, label="AST")
+        edges = [(virtual_root, node, {"label": "AST"}) for node in methods]
+        if index is not None:
+            index.add_nodes([virtual_root])
+            index.add_edges_from(edges)
+        else:
+            graph.add_edges_from(edges)
         logger.info(f"Added virtual root node {virtual_root} to the graph.")
 
 
@@ -119,12 +376,24 @@ def setup_logging(verbose=False):
         )
 
 
-def replace_ddg_label(graph):
+def replace_ddg_label(graph, index: LabelIndex | None = None):
     """
     Replace the label of DDG edges to include the property if it exists.
     """
-    for u, v, k, data in graph.edges(keys=True, data=True):
-        if data.get("label") == "REACHING_DEF":
-            data["label"] = f"DDG: {data.get('property', '')}"
-            if "property" in data:
-                del data["property"]
+    if index is not None:
+        edges = index.edges("REACHING_DEF")
+    else:
+        edges = [
+            (u, v, k)
+            for u, v, k, data in graph.edges(keys=True, data=True)
+            if data.get("label") == "REACHING_DEF"
+        ]
+    for u, v, k in edges:
+        data = graph.succ[u][v][k]
+        label = f"DDG: {data.get('property', '')}"
+        if "property" in data:
+            del data["property"]
+        if index is not None:
+            index.relabel_edge((u, v, k), label)
+        else:
+            data["label"] = label
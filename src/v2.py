@@ -1,6 +1,9 @@
 import argparse
+import contextlib
 import logging
 
+import networkx as nx
+
 import pruner
 import pruner.langs
 import pruner.predicates
@@ -10,77 +13,105 @@ from visualization import pretty_graph
 
 logger = logging.getLogger(__name__)
 
+# Nodes left out of Joern's per-method CFG export (`--repr=cfg`), whose flow
+# is routed around them, see `CfgGenerator.shouldBeDisplayed` in Joern.
+CFG_HIDDEN_LABELS = {
+    "BLOCK",
+    "CONTROL_STRUCTURE",
+    "IDENTIFIER",
+    "JUMP_TARGET",
+    "LITERAL",
+    "METHOD_PARAMETER_IN",
+}
 
-def main():
-    parser = argparse.ArgumentParser(
-        description="Delete nodes and edges from a Graphviz .dot file."
-    )
-    parser.add_argument(
-        "input_file",
-        help="Path to the input .dot file.",
-        nargs="?",
-        default="out/all/export.dot",
-    )
-    parser.add_argument("--cfg", nargs="+", help="Paths to the CFG .dot files")
-    parser.add_argument(
-        "-o",
-        "--output",
-        default="./out/v2.dot",
-        help="Path to the output .dot file (default: v2.dot)",
-    )
-    parser.add_argument(
-        "--lang", choices=["py", "java", "cpp"], help="Language of the input files"
-    )
-    parser.add_argument("--ast", action="store_true", help="Keep AST nodes")
-    parser.add_argument(
-        "-v", "--verbose", action="store_true", help="Enable verbose output"
-    )
-
-    args = parser.parse_args()
 
-    utils.setup_logging(args.verbose)
+def template(ast: bool = False, cfg: bool = False) -> CPGTemplate:
+    """
+    Return the labels kept by v2, with AST edges if `ast` and CFG edges if
+    `cfg`.
 
+    AST nodes are kept either way, the AST variant only adds the AST edges.
+    """
     node_filter: CPGTemplate = (
         CPG.METHOD_ + CPG.AST + CPG.CALLGRAPH_CALL_ + CPG.PDG_DDG_
     )
 
     edge_filter: CPGTemplate = CPG.METHOD_ + CPG.CALLGRAPH_CALL_ + CPG.PDG_DDG_
 
-    if args.ast:
+    if ast:
         node_filter += CPG.AST
         edge_filter += CPG.AST
+    if cfg:
+        edge_filter += CPG.CFG
 
-    graph = utils.read_dot_file(args.input_file)
-
-    # Delete nodes with specified labels (partial match)
-    nodes_to_remove = [
-        node
-        for node, data in graph.nodes(data=True)
-        if data.get("label") not in node_filter.node_labels
-    ]
-    logger.debug(f"Nodes to remove: {nodes_to_remove}")
-    utils.remove_nodes_from(graph, nodes_to_remove)
-
-    # Delete edges with specified labels, considering MultiDiGraph
-    edges_to_remove = [
-        (u, v, k)
-        for u, v, k, data in graph.edges(keys=True, data=True)
-        if data.get("label") not in edge_filter.edge_labels
-    ]
-    utils.remove_edges_from(graph, edges_to_remove)
+    return CPGTemplate(node_filter.node_labels, edge_filter.edge_labels)
+
+
+def load_graph(
+    input_file, cfg_files=None, ast: bool = False, jobs=1, base=None
+) -> nx.MultiDiGraph:
+    """
+    Read a Joern `all` export filtered to `template(ast)`, with DDG labels
+    rewritten and CFG edges added.
+
+    The CFG edges come from the export itself, contracted around
+    `CFG_HIDDEN_LABELS` nodes to match the per-method `--repr=cfg` export,
+    unless `cfg_files`, the files of such an export, are given; their edges
+    are then merged in instead, in the order of `cfg_files`. They are parsed
+    by `jobs` processes (see `utils.read_dot_files`).
+
+    If `base`, the export already loaded without a template, is given,
+    `input_file` is not read again: the graph is forked from `base`, which
+    is left untouched.
+    """
+    if base is not None:
+        graph = utils.fork_graph(base, template(ast, cfg=cfg_files is None))
+    else:
+        graph = utils.read_dot_file(input_file, template(ast, cfg=cfg_files is None))
 
     utils.replace_ddg_label(graph)
 
-    for cfg_file in args.cfg:
-        sub_cfg_graph = utils.read_dot_file(cfg_file)
+    if cfg_files is None:
+        utils.contract_cfg(
+            graph,
+            [
+                node
+                for node, label in graph.nodes(data="label")
+                if label in CFG_HIDDEN_LABELS
+            ],
+        )
+
+    for sub_cfg_graph in utils.read_dot_files(cfg_files or [], jobs=jobs):
         for u, v, data in sub_cfg_graph.edges(data=True):
             data["label"] = "CFG"
         graph.update(sub_cfg_graph.edges(data=True))
 
+    return graph
+
+
+def build_v2(
+    graph: nx.MultiDiGraph,
+    lang=None,
+    ast: bool = False,
+    fixed_point: bool = False,
+) -> nx.MultiDiGraph:
+    """
+    Prune and decorate a graph returned by `load_graph`, in place.
+
+    Args:
+        graph (networkx.MultiDiGraph): The graph, loaded with the same `ast`
+        lang (str): Language of the input files, enables language specific
+            pruning
+        ast (bool): Whether AST edges were kept
+        fixed_point (bool): See `GraphPruner.prune`
+
+    Returns:
+        networkx.MultiDiGraph: The same graph
+    """
     graph_pruner = pruner.GraphPruner(graph)
 
-    if args.lang == "py":
-        if args.ast is None:
+    if lang == "py":
+        if not ast:
             graph_pruner.add_prune_function(
                 pruner.langs.python.remove_artifact_nodes_without_ast
             )
@@ -88,7 +119,7 @@ def main():
             graph_pruner.add_prune_function(
                 pruner.langs.python.remove_artifact_nodes_with_ast
             )
-    elif args.lang == "cpp":
+    elif lang == "cpp":
         graph_pruner.add_prune_function(pruner.langs.cpp.remove_global_import)
 
     graph_pruner.add_edge_predicate(pruner.predicates.edges.null_ddg)
@@ -100,15 +131,145 @@ def main():
     )
     # graph_pruner.add_node_predicate(pruner.predicates.nodes.operator_fieldaccess)
 
-    graph_pruner.prune()
+    graph_pruner.prune(fixed_point=fixed_point)
     graph_pruner.remove_isolated_nodes()
 
-    if not args.ast:
-        utils.add_virtual_root(graph)
+    if not ast:
+        utils.add_virtual_root(graph, graph_pruner.index)
 
     # Render the graph as an SVG file
-    pretty_graph(graph)
-    utils.write_dot_file(graph, args.output)
+    pretty_graph(graph, graph_pruner.index)
+    return graph
+
+
+def generate(
+    input_file,
+    cfg_files=None,
+    lang=None,
+    output=None,
+    ast_output=None,
+    fixed_point: bool = False,
+    stage=None,
+    jobs=1,
+    base=None,
+):
+    """
+    Write the v2 graph to `output` and its AST variant to `ast_output`.
+
+    Either output may be None. When both are requested the export is parsed
+    once: the AST variant is loaded and the plain one is derived from a copy
+    without AST edges. For C++ the AST edges are loaded for the plain variant
+    too: the `<includes>:<global>` subtree is found through them, and is
+    removed before they are left out.
+
+    `jobs` processes parse the `cfg_files` (see `utils.read_dot_files`).
+    `base` is passed to `load_graph`.
+
+    `stage`, if given, is called with "parse", "prune" or "write" and must
+    return a context manager, which is wrapped around that step (e.g. to time
+    it). "prune" and "write" are entered once per requested output.
+    """
+    stage = stage or (lambda name: contextlib.nullcontext())
+
+    load_ast = ast_output is not None or (output is not None and lang == "cpp")
+    with stage("parse"):
+        graph = load_graph(input_file, cfg_files, ast=load_ast, jobs=jobs, base=base)
+
+    if output is not None:
+        with stage("prune"):
+            if lang == "cpp":
+                pruner.langs.cpp.remove_global_import(graph)
+            plain = graph
+            if load_ast:
+                # labels are rewritten by now, so leave the AST edges out
+                # explicitly instead of filtering against template(ast=False);
+                # they are never copied, unlike with graph.copy()
+                ast_labels = template(ast=True).edge_labels - template().edge_labels
+                plain = nx.MultiDiGraph()
+                plain.graph.update(graph.graph)
+                plain.add_nodes_from(graph.nodes(data=True))
+                plain.add_edges_from(
+                    (u, v, k, data)
+                    for u, v, k, data in graph.edges(keys=True, data=True)
+                    if data.get("label") not in ast_labels
+                )
+            build_v2(plain, lang, ast=False, fixed_point=fixed_point)
+        with stage("write"):
+            utils.write_dot_file(plain, output)
+
+    if ast_output is not None:
+        with stage("prune"):
+            build_v2(graph, lang, ast=True, fixed_point=fixed_point)
+        with stage("write"):
+            utils.write_dot_file(graph, ast_output)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Delete nodes and edges from a Graphviz .dot file."
+    )
+    parser.add_argument(
+        "input_file",
+        help="Path to the input .dot file.",
+        nargs="?",
+        default="out/all/export.dot",
+    )
+    parser.add_argument(
+        "--cfg",
+        nargs="+",
+        help="Paths to the per-method CFG .dot files (default: the CFG edges "
+        "of the input file)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Processes parsing the --cfg files, 0 for one per CPU (default: 1)",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default="./out/v2.dot",
+        help="Path to the output .dot file (default: v2.dot)",
+    )
+    parser.add_argument(
+        "--lang", choices=["py", "java", "cpp"], help="Language of the input files"
+    )
+    parser.add_argument("--ast", action="store_true", help="Keep AST nodes")
+    parser.add_argument(
+        "--ast-output",
+        help="Also write the AST variant to this file, from the same parse",
+    )
+    parser.add_argument(
+        "--fixed-point",
+        action="store_true",
+        help="Prune until no predicate matches and no node is isolated",
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="Enable verbose output"
+    )
+
+    args = parser.parse_args()
+
+    utils.setup_logging(args.verbose)
+
+    if args.ast:
+        if args.ast_output is not None:
+            parser.error("--ast-output cannot be combined with --ast")
+        output, ast_output = None, args.output
+    else:
+        output, ast_output = args.output, args.ast_output
+
+    generate(
+        args.input_file,
+        args.cfg,
+        args.lang,
+        output=output,
+        ast_output=ast_output,
+        fixed_point=args.fixed_point,
+        jobs=args.jobs,
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,188 @@
+"""
+Write several graphs of one Joern export, loading the export once.
+
+scripts/joern.sh used to run merge.py twice, filter.py, v2.py and
+visualization.py, each parsing `all/export.dot` again. Here the export is
+parsed once into a base graph, and every variant is derived from it:
+
+    cdfg, ast_cdfg  merged from the per-method exports, which are read once
+                    and shared; the base serves as the merge reference
+    filtered        filter.py, on a fork of the base
+    v2, ast_v2      v2.py, on forks of the base
+    pretty          visualization.py, on a copy of the base, or on the base
+                    itself when it is the last variant
+
+Forks (`utils.fork_graph`) only copy the nodes and edges the variant keeps,
+and never modify the base. The time taken by the load and by each variant
+is printed at the end.
+"""
+
+import argparse
+import glob
+import logging
+import os
+import time
+
+import merge
+import ref_index
+import utils
+import v2
+from cpg import CPGTemplate
+from filter import build_filtered, edge_filter, node_filter
+from visualization import pretty_graph
+
+logger = logging.getLogger(__name__)
+
+VARIANTS = ("cdfg", "ast_cdfg", "filtered", "v2", "ast_v2", "pretty")
+
+
+def _method_files(joern_dir, representation):
+    return sorted(glob.glob(os.path.join(joern_dir, representation, "*")))
+
+
+def generate(
+    joern_dir,
+    variants=VARIANTS,
+    output_dir="./out",
+    lang=None,
+    fixed_point: bool = False,
+    jobs=1,
+) -> dict[str, float]:
+    """
+    Write `variants` of the export in `joern_dir` to `output_dir`/<variant>.dot.
+
+    Args:
+        joern_dir (str): Directory of the Joern exports, with `all/export.dot`
+            and, for the merged variants, the `cfg`, `pdg` and `ast` exports
+        variants (iterable): Names from `VARIANTS`, written in that order
+        output_dir (str): Directory of the output .dot files
+        lang (str): Language of the input files, enables language specific
+            pruning
+        fixed_point (bool): See `GraphPruner.prune`
+        jobs (int): Processes parsing the per-method files, see
+            `utils.read_dot_files`
+
+    Returns:
+        dict: Seconds spent on "load" and on each variant, in order
+    """
+    variants = [variant for variant in VARIANTS if variant in set(variants)]
+    input_file = os.path.join(joern_dir, "all", "export.dot")
+    timings = {}
+
+    start = time.perf_counter()
+    base = utils.read_dot_file(input_file)
+    input_graphs = None
+    if "cdfg" in variants or "ast_cdfg" in variants:
+        input_graphs = merge.read_dot_files(
+            _method_files(joern_dir, "ast") if "ast_cdfg" in variants else None,
+            _method_files(joern_dir, "cfg"),
+            _method_files(joern_dir, "pdg"),
+            jobs,
+        )
+        input_graphs = merge.add_edge_label(input_graphs)
+    timings["load"] = time.perf_counter() - start
+
+    for variant in variants:
+        start = time.perf_counter()
+        output = os.path.join(output_dir, f"{variant}.dot")
+
+        if variant in ("cdfg", "ast_cdfg"):
+            graphs = dict(input_graphs)
+            if variant == "cdfg":
+                graphs["ast"] = []
+            graph = merge.build_merged(
+                graphs,
+                ref_index.GraphReference(base),
+                lang=lang,
+                fixed_point=fixed_point,
+            )
+            utils.write_dot_file(graph, output)
+        elif variant == "filtered":
+            graph = utils.fork_graph(
+                base, CPGTemplate(node_filter.node_labels, edge_filter.edge_labels)
+            )
+            build_filtered(graph, fixed_point=fixed_point)
+            utils.write_dot_file(graph, output)
+        elif variant in ("v2", "ast_v2"):
+            v2.generate(
+                input_file,
+                lang=lang,
+                output=output if variant == "v2" else None,
+                ast_output=output if variant == "ast_v2" else None,
+                fixed_point=fixed_point,
+                base=base,
+            )
+        elif variant == "pretty":
+            graph = base if variant == variants[-1] else utils.fork_graph(base)
+            pretty_graph(graph)
+            utils.write_dot_file(graph, output)
+
+        timings[variant] = time.perf_counter() - start
+        logger.info(f"Wrote {output} in {timings[variant]:.3f} s")
+
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Write several graphs of a Joern export, loading it once."
+    )
+    parser.add_argument(
+        "joern_dir",
+        nargs="?",
+        default="./out/joern",
+        help="Directory of the Joern exports (default: ./out/joern)",
+    )
+    parser.add_argument(
+        "--variants",
+        nargs="+",
+        choices=VARIANTS,
+        default=list(VARIANTS),
+        help="Graphs to write (default: all)",
+    )
+    parser.add_argument(
+        "--lang", choices=["py", "java", "cpp"], help="Language of the input files"
+    )
+    parser.add_argument(
+        "-o",
+        "--output-dir",
+        default="./out",
+        help="Directory of the output .dot files (default: ./out)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Processes parsing the per-method files, 0 for one per CPU (default: 1)",
+    )
+    parser.add_argument(
+        "--fixed-point",
+        action="store_true",
+        help="Prune until no predicate matches and no node is isolated",
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="Enable verbose output"
+    )
+
+    args = parser.parse_args()
+    utils.setup_logging(args.verbose)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    timings = generate(
+        args.joern_dir,
+        args.variants,
+        args.output_dir,
+        lang=args.lang,
+        fixed_point=args.fixed_point,
+        jobs=args.jobs,
+    )
+
+    print(f"{'step':<12}{'time (s)':>10}")
+    for step, elapsed in timings.items():
+        print(f"{step:<12}{elapsed:>10.3f}")
+    print(f"{'total':<12}{sum(timings.values()):>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
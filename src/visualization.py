@@ -3,6 +3,7 @@ import logging
 from collections import defaultdict
 
 import utils
+from label_index import LabelIndex
 
 logger = logging.getLogger(__name__)
 
@@ -208,9 +209,9 @@ class ASTNodeLabel:
         return f"[{self.node_type}] @ {self.line_number}\\n{self.value}\\n{self.code}"
 
 
-def pretty_graph(graph):
+def pretty_graph(graph, index: LabelIndex | None = None):
     color_node(graph)
-    color_edge(graph)
+    color_edge(graph, index)
     pretty_label(graph)
 
 
@@ -233,19 +234,34 @@ def color_node(graph):
             )
 
 
-def color_edge(graph):
+def edge_color(label):
+    if label == "AST":
+        return CPG_COLORS["AST_EDGE"]
+    elif "CFG" in label:
+        return CPG_COLORS["CFG_EDGE"]
+    elif "DDG" in label or "REACHING_DEF" in label:
+        return CPG_COLORS["DDG_EDGE"]
+    elif "CDG" in label:
+        return CPG_COLORS["CDG_EDGE"]
+    elif "CALL" in label:
+        return CPG_COLORS["CALL_EDGE"]
+    return None
+
+
+def color_edge(graph, index: LabelIndex | None = None):
     # Modify the label for each node
-    for u, v, k, data in graph.edges(keys=True, data=True):
-        if data.get("label") == "AST":
-            graph.edges[u, v, k]["color"] = CPG_COLORS["AST_EDGE"]
-        elif "CFG" in data.get("label"):
-            graph.edges[u, v, k]["color"] = CPG_COLORS["CFG_EDGE"]
-        elif "DDG" in data.get("label") or "REACHING_DEF" in data.get("label"):
-            graph.edges[u, v, k]["color"] = CPG_COLORS["DDG_EDGE"]
-        elif "CDG" in data.get("label"):
-            graph.edges[u, v, k]["color"] = CPG_COLORS["CDG_EDGE"]
-        elif "CALL" in data.get("label"):
-            graph.edges[u, v, k]["color"] = CPG_COLORS["CALL_EDGE"]
+    if index is None:
+        for u, v, k, data in graph.edges(keys=True, data=True):
+            color = edge_color(data.get("label"))
+            if color is not None:
+                graph.edges[u, v, k]["color"] = color
+        return
+    # one color lookup per label instead of per edge
+    for label in index.edge_labels():
+        color = edge_color(label)
+        if color is not None:
+            for u, v, k in index.edges(label):
+                graph.succ[u][v][k]["color"] = color
 
 
 def main():